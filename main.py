@@ -1,24 +1,51 @@
 import strava_app_api
+import strava_app_export
+import strava_app_metrics as metrics
+import strava_app_pipeline
 import strava_app_scoring as scorer
+import strava_app_store
 import strava_app_team as teams
 from strava_app_settings import INTERMEDIATE_LOCATION
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
+import argparse
 
-def process_user(token):
-    """Process a single user's data and return the UserEC object or None if failed."""
-    try:
-        user_ec = scorer.UserEC(token)
-        if user_ec.calculate_points() != False:
-            return user_ec
-        else:
-            print(f"Error obtaining Strava data for user {token}")
-            return None
-    except Exception as e:
-        print(f"Exception processing user {token}: {e}")
-        return None
+def fetch_and_score(token_list, use_async=False, concurrency=10, challenges=None):
+    """Refresh tokens, sync and score users against every challenge (default: scorer.CHALLENGES).
+    Activities are fetched once over the union of the challenge windows.
+    Returns {challenge name: the users' DataFrame (see scorer.create_dataframe_from_users)}"""
+    challenges = scorer.CHALLENGES if challenges is None else challenges
+    # Refresh tokens that would expire mid-run up front, and drop unusable ones
+    with metrics.span('token_refresh'):
+        token_report = strava_app_api.refresh_tokens(token_list)
+    print(f"Tokens: {len(token_report['valid'])} valid, {len(token_report['refreshed'])} refreshed, "
+          f"{len(token_report['invalid'])} invalid")
+    for user_id, reason in token_report['invalid'].items():
+        print(f"  Skipping user {user_id}: {reason}")
+    token_list = token_report['valid'] + token_report['refreshed']
+    if not token_list:
+        return {challenge.name: scorer.create_dataframe_from_users([]) for challenge in challenges}
 
-def main():
+    # Stale users first, so they are ahead in the queue if the rate limit is hit
+    token_list = strava_app_store.order_by_staleness(token_list)
+
+    # Process each user's activities and calculate their points
+    if use_async:
+        import strava_app_async
+        results = strava_app_async.run(token_list, concurrency, challenges)
+        return {challenge.name: scorer.create_dataframe_from_users(users)
+                for challenge, users in zip(challenges, results)}
+    max_workers = min(concurrency, len(token_list))  # Users fetched at once
+    strava_app_api.configure_session(max_workers * strava_app_api.max_concurrent_pages)
+    # Activities stream page by page into the store and from there into each user's
+    # stats, so only compact result rows are kept for every user
+    sinks = strava_app_pipeline.run_challenges(token_list, challenges, max_workers)
+    return {challenge.name: sink.dataframe() for challenge, sink in zip(challenges, sinks)}
+
+
+def main(use_async=False, concurrency=10, rescore=False, processes=None, archive=False, excel=False,
+         report=False, prometheus=None, with_teams=None):
+    """with_teams: True/False to skip the interactive team prompt (eg. when scheduled)"""
+    if report or prometheus:
+        metrics.enable()
     # Get Exercise Challenge users from token files
     # Any users not in the token list will be skipped
     token_list = strava_app_api.get_token_list()
@@ -26,47 +53,78 @@ def main():
         print("No tokens found. Please check saved token files. Exiting...")
         return
 
-    # Process each user's activities and calculate their points
-    user_results = []
-    max_workers = min(10, len(token_list))  # Thread pool size
-    
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_token = {executor.submit(process_user, token): token for token in token_list}
-        
-        # Collect results as they complete
-        for future in as_completed(future_to_token):
-            token = future_to_token[future]
-            try:
-                user_ec = future.result()
-                if user_ec:
-                    user_results.append(user_ec)
-            except Exception as e:
-                print(f"Exception for user {token}: {e}")
-    
-    if not user_results:
+    with metrics.span('fetch_and_score'):
+        if rescore:
+            # Score from the local activity store only, on a process pool
+            results = scorer.score_cached_users_parallel(token_list, max_workers=processes)
+        else:
+            results = fetch_and_score(token_list, use_async, concurrency)
+
+    challenges = [challenge for challenge in scorer.CHALLENGES if not results[challenge.name].empty]
+    if not challenges:
         print("No Strava data retrieved. Exiting...")
         return
-    
-    # Convert to DataFrame, sort by points, add user rankings
-    df = scorer.create_dataframe_from_users(user_results)
-    df = df.sort_values('Total_Points', ascending=False).reset_index(drop=True)
-    df['Rank'] = df.index + 1
 
     # Calculate team points and rankings
     teams.generate_user_data()
-    if input("Please manually update team assignments in 'users.json'.\n"
-             "Proceed with generating team stats? (y/n): ").lower() == "y":
-        # Calculate team statistics using the new function
-        team_stats = teams.calculate_team_statistics(df)
-        teams.save(team_stats, "team_rankings.csv")
+    if with_teams is None:
+        with_teams = input("Please manually update team assignments in 'users.json'.\n"
+                           "Proceed with generating team stats? (y/n): ").lower() == "y"
+
+    for challenge in challenges:
+        df = results[challenge.name]
+        # Several challenges: files are prefixed with the challenge name
+        prefix = f"{challenge.name}_" if len(scorer.CHALLENGES) > 1 else ""
+
+        # Sort by points, add user rankings
+        df = df.sort_values('Total_Points', ascending=False).reset_index(drop=True)
+        df['Rank'] = df.index + 1
+
+        team_stats = None
+        if with_teams:
+            # Fill in names/teams, then calculate team statistics
+            with metrics.span('team_merge'):
+                df = teams.assign_user_data(df)
+                team_stats = teams.calculate_team_statistics(df)
+            teams.save(team_stats, prefix + "team_rankings.csv")
+
+        # Save to file
+        # TODO: save to google sheet
+        with metrics.span('export'):
+            df.to_csv(INTERMEDIATE_LOCATION + prefix + 'user_rankings.csv', index=False)
+            if archive:
+                strava_app_export.export_run(df, team_stats, challenge=challenge.name,
+                                             after=challenge.start, before=challenge.end)
+            if excel:
+                strava_app_export.export_excel(df, team_stats, INTERMEDIATE_LOCATION + prefix + 'rankings.xlsx')
 
-    # Save to file
-    # TODO: save to google sheet or excel
-    df.to_csv(INTERMEDIATE_LOCATION + 'user_rankings.csv', index=False)
-   
+    if metrics.enabled:
+        path = metrics.write_report(prometheus_path=prometheus)
+        print(metrics.summary())
+        print(f"Run report saved to {path}")
     print("Strava App Complete")
 
 # CLI
 if __name__=="__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Score the Exercise Challenge")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="fetch with the asyncio engine (requires aiohttp) instead of the thread pool")
+    parser.add_argument('--concurrency', type=int, default=10, help="users fetched at once")
+    parser.add_argument('--rescore', action='store_true',
+                        help="no API calls: re-score everyone from the activity store on a process pool")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes for --rescore")
+    parser.add_argument('--archive', action='store_true',
+                        help="also archive scores, teams and activities to Parquet (requires pyarrow)")
+    parser.add_argument('--excel', action='store_true',
+                        help="also write the rankings to an Excel workbook (requires openpyxl)")
+    parser.add_argument('--report', action='store_true',
+                        help="time each stage and count API usage, saved as JSON under output/run_reports/")
+    parser.add_argument('--prometheus', metavar='PATH', default=None,
+                        help="also write the run's metrics in Prometheus text format to PATH (implies --report)")
+    parser.add_argument('--teams', dest='with_teams', action='store_true', default=None,
+                        help="generate team stats without asking")
+    parser.add_argument('--no-teams', dest='with_teams', action='store_false', help="skip team stats without asking")
+    args = parser.parse_args()
+    main(use_async=args.use_async, concurrency=args.concurrency, rescore=args.rescore, processes=args.processes,
+         archive=args.archive, excel=args.excel, report=args.report, prometheus=args.prometheus,
+         with_teams=args.with_teams)
\ No newline at end of file
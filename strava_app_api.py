@@ -1,27 +1,316 @@
+import calendar
+import heapq
+import itertools
 import json
+import math
 import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+import strava_app_metrics as metrics
 import strava_app_settings
+import strava_app_vault
+from strava_app_helpers import write_json_atomic
 
 """
 Module for:
 1) Strava API token handling
 2) Strava API data retrieving
+3) Rate-limit aware scheduling of every Strava request
+4) Pooled keep-alive HTTP session shared by all threads
 """
 
 # Make Strava auth API call with your: client_code, client_secret, user_id, and user_code
 token_save_location = strava_app_settings.TOKEN_LOCATION
+token_store = strava_app_settings.TOKEN_STORE     # 'files' or 'vault'
 client_id =     str(strava_app_settings.STRAVA_CLIENT_ID)
 client_secret = str(strava_app_settings.STRAVA_CLIENT_SECRET)
 
+strava_base_url = "https://www.strava.com"
+oauth_url = strava_base_url + "/oauth/token"
+activities_url = strava_base_url + "/api/v3/activities"
+activities_per_page = 200   # Strava's maximum page size
+max_concurrent_pages = 4    # pages fetched at once per user once the page count is estimated
+request_timeout = (5, 20)   # (connect, read) seconds, applied to every request
+token_refresh_margin = 300  # seconds before 'expires_at' that a token is refreshed
+
+
+class StravaAPIError(Exception):
+    """Raised when a Strava API call fails part way through a paginated fetch"""
+
+
+class RateLimitExceeded(StravaAPIError):
+    """Raised when the Strava quota would not free up within the scheduler's max_wait"""
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    # Transport-level retries cover connection failures (and read failures on GETs only,
+    # so a refresh token is never spent twice); 429/5xx retries are the scheduler's job
+    retries = Retry(total=3, connect=3, read=2, status=0, other=0, backoff_factor=0.5)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries, pool_block=True)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def configure_session(pool_size: int = 10) -> requests.Session:
+    """
+    (Re)creates the shared keep-alive session used for every Strava call
+    @param pool_size int connections kept open to Strava, size it to the number of
+        threads making requests (workers x pages in flight per worker)
+    """
+    global _session
+    session = _build_session(pool_size)
+    with _session_lock:
+        previous, _session = _session, session
+    if previous is not None:
+        previous.close()
+    return session
+
+
+def get_session() -> requests.Session:
+    """Returns the shared session, creating it with the default pool size on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = _build_session(10)
+        return _session
+
+
+class RequestScheduler:
+    """
+    Meters every Strava request made by the app, across all worker threads
+        - spends what the X-RateLimit-Usage headers say is left in the current
+          15-minute window, less the requests still in flight
+        - once only the reserve fraction of the window is left, spreads the remaining
+          requests over the rest of the window instead of sending them at once
+        - blocks until the next window (or next UTC day) once a quota is used up
+        - retries 429/5xx with exponential backoff, and connection errors for idempotent methods
+        - waiting requests are served lowest priority value first, so callers
+          pass the time of a user's last sync to put stale users ahead
+    """
+    short_window = 900      # seconds, Strava quotas reset on the quarter hour
+    retry_statuses = (429, 500, 502, 503, 504)
+    # Resent after a timeout or dropped connection; a POST may already have spent its
+    # refresh token or single-use authorization code, so it is never resent
+    idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+    def __init__(self, short_limit=200, daily_limit=2000, reserve=0.1, max_retries=5, max_wait=960):
+        self.short_limit = short_limit
+        self.daily_limit = daily_limit
+        self.short_usage = 0
+        self.daily_usage = 0
+        self.reserve = reserve      # fraction of the 15-minute quota that is paced, not sent at once
+        self.max_retries = max_retries
+        self.max_wait = max_wait    # seconds a request may wait for quota before RateLimitExceeded
+        self._window = int(time.time() // self.short_window)
+        self._tokens = float(short_limit)   # requests left in the current window
+        self._in_flight = 0         # requests sent that have not been answered yet
+        self._sent_at = 0.0         # wall clock of the last request sent
+        self._blocked_until = 0.0   # wall clock
+        self._queue = []            # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._cond = threading.Condition()
+
+    def _roll_window(self, now: float) -> None:
+        """Starts a fresh 15-minute quota once the clock passes the quarter hour"""
+        window = int(now // self.short_window)
+        if window != self._window:
+            self._window = window
+            self.short_usage = 0
+            self._tokens = float(max(0, min(self.short_limit, self.daily_limit - self.daily_usage)
+                                     - self._in_flight))
+
+    def _wait_time(self) -> float:
+        """Seconds until a request may be sent, 0 if one can go now. Caller holds the lock"""
+        now = time.time()
+        self._roll_window(now)
+        blocked = self._blocked_until - now
+        if blocked > 0:
+            return blocked
+        window_left = (self._window + 1) * self.short_window - now
+        if self._tokens < 1:
+            return window_left
+        if self._tokens > self.reserve * self.short_limit:
+            return 0.0
+        # Quota nearly used up: pace what is left over the rest of the window
+        return max(0.0, self._sent_at + window_left / self._tokens - now)
+
+    def _take(self) -> None:
+        self._tokens -= 1
+        self._in_flight += 1
+        self._sent_at = time.time()
+
+    def acquire(self, priority: float = 0.0) -> None:
+        """
+        Blocks until this caller is first in line and a request token is available
+        Raises RateLimitExceeded if that would take longer than max_wait
+        Every acquire is matched by a release() once the request is answered or fails
+        """
+        with self._cond:
+            entry = (priority, next(self._tickets))
+            heapq.heappush(self._queue, entry)
+            try:
+                while True:
+                    if self._queue[0] is entry:
+                        wait = self._wait_time()
+                        if wait <= 0:
+                            self._take()
+                            return
+                        if wait > self.max_wait:
+                            raise RateLimitExceeded(f"Strava quota exhausted for the next {wait:.0f}s")
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                self._cond.notify_all()
+
+    def try_acquire(self) -> float:
+        """
+        Non-blocking acquire for callers that cannot park a thread (eg. coroutines)
+        Returns 0 if a request token was taken, otherwise seconds to wait before trying again
+        Threads already queued in acquire() keep precedence
+        Raises RateLimitExceeded if the wait is longer than max_wait
+        """
+        with self._cond:
+            wait = self._wait_time()
+            if wait > self.max_wait:
+                raise RateLimitExceeded(f"Strava quota exhausted for the next {wait:.0f}s")
+            if self._queue:
+                return max(wait, 0.05)
+            if wait <= 0:
+                self._take()
+            return wait
+
+    def release(self, headers=None) -> None:
+        """
+        Marks an acquired request as answered (or failed) and, given its response
+        headers, syncs the quota with them (see update)
+        """
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+        if headers is not None:
+            self.update(headers)
+
+    def update(self, headers) -> None:
+        """
+        Syncs the quota with Strava's X-RateLimit-Limit/X-RateLimit-Usage headers
+        ("<15 min>,<daily>"). The tighter X-ReadRateLimit-* pair is used when present.
+        """
+        for prefix in ('X-ReadRateLimit', 'X-RateLimit'):
+            limit, usage = headers.get(prefix + '-Limit'), headers.get(prefix + '-Usage')
+            if limit and usage:
+                break
+        else:
+            return
+        try:
+            short_limit, daily_limit = (int(v) for v in limit.split(','))
+            short_usage, daily_usage = (int(v) for v in usage.split(','))
+        except ValueError:
+            return
+
+        metrics.record_quota(short_usage, short_limit, daily_usage, daily_limit)
+        with self._cond:
+            now = time.time()
+            self._roll_window(now)
+            self.short_limit, self.daily_limit = short_limit, daily_limit
+            self.short_usage, self.daily_usage = short_usage, daily_usage
+            # The headers are the authority on what is left; requests still in flight are not in them yet
+            left = min(short_limit - short_usage, daily_limit - daily_usage)
+            self._tokens = float(max(0, left - self._in_flight))
+            if daily_usage >= daily_limit:
+                self._blocked_until = max(self._blocked_until, (now // 86400 + 1) * 86400)
+            elif short_usage >= short_limit:
+                self._blocked_until = max(self._blocked_until,
+                                          (now // self.short_window + 1) * self.short_window)
+            self._cond.notify_all()
+
+    def request(self, method: str, url: str, priority: float = 0.0, **kwargs) -> requests.Response:
+        """
+        Sends a metered request, retrying 429/5xx responses, and connection errors
+        for idempotent methods only
+        Returns the last response; raises StravaAPIError if no response was ever received
+        """
+        kwargs.setdefault('timeout', request_timeout)
+        response = None
+        for attempt in range(self.max_retries + 1):
+            self.acquire(priority)
+            response = None
+            started = time.perf_counter()
+            try:
+                with metrics.span('http'):
+                    response = get_session().request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.record_request(method, None, time.perf_counter() - started, attempt)
+                if attempt == self.max_retries or method.upper() not in self.idempotent_methods:
+                    raise StravaAPIError(f"Strava request failed: {e}") from e
+            else:
+                metrics.record_request(method, response.status_code, time.perf_counter() - started, attempt)
+                if response.status_code not in self.retry_statuses or attempt == self.max_retries:
+                    return response
+            finally:
+                self.release(None if response is None else response.headers)
+            time.sleep(self.backoff(attempt, response))
+
+    @staticmethod
+    def backoff(attempt: int, response) -> float:
+        """Retry-After when Strava sends one, otherwise exponential backoff with jitter"""
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+# Shared by every thread in the process
+scheduler = RequestScheduler()
+
+
+def set_base_url(base_url: str) -> None:
+    """
+    Points every Strava call at base_url, eg. a local stand-in server (strava_app_stub)
+    """
+    global strava_base_url, oauth_url, activities_url
+    strava_base_url = base_url.rstrip('/')
+    oauth_url = strava_base_url + "/oauth/token"
+    activities_url = strava_base_url + "/api/v3/activities"
+
+
+_vault = None
+
+
+def get_vault() -> strava_app_vault.TokenVault:
+    """
+    The token vault in the token save location, None unless TOKEN_STORE is 'vault'
+    """
+    global _vault
+    if token_store != 'vault':
+        return None
+    path = token_save_location + strava_app_vault.vault_filename
+    if _vault is None or _vault.path != path:
+        _vault = strava_app_vault.TokenVault(path)
+    return _vault
+
 
 def get_user_path(user_id: str) -> str:
     """
-    Return token path for user_id if it exists
+    Return token path for user_id if it exists (the vault file when tokens are in the vault)
     Returns None if no file found
     """
+    vault = get_vault()
+    if vault is not None:
+        return vault.path if user_id in vault else None
     path = token_save_location + f"strava_tokens_{user_id}.json"
     if not os.path.exists(path):
         return None
@@ -30,12 +319,26 @@ def get_user_path(user_id: str) -> str:
 
 def get_token_list():
     """
-    Returns list of token/user ids based on files in token save location
+    Returns list of token/user ids based on files in token save location (or the vault)
     """
+    vault = get_vault()
+    if vault is not None:
+        return vault.ids()
     token_files = [f for f in os.listdir(token_save_location) if f.startswith("strava_tokens_")]
     return [f.rsplit('.')[0].rsplit('_')[-1] for f in token_files]
 
 
+def token_list_version():
+    """
+    Changes whenever a user's token is added or removed (and, for token files, when one is rewritten)
+    Compare with an earlier value to skip re-listing an unchanged token list
+    """
+    vault = get_vault()
+    if vault is not None:
+        return vault.generation()
+    return os.stat(token_save_location).st_mtime_ns
+
+
 def save_user_token(user_id: str, user_code: str, overwrite=False) -> bool:
     """
     Requests user_id token and saves it to a file
@@ -50,25 +353,238 @@ def save_user_token(user_id: str, user_code: str, overwrite=False) -> bool:
     if (not overwrite) and user_file:
         return True
 
-    response = requests.post(
-                        url='https://www.strava.com/oauth/token',
+    token, error = exchange_code(user_code)
+    if token:
+        write_user_token(user_id, token)
+    else:
+        print(f"Error requesting {user_id}'s token: {error}")
+
+    return token is not None
+
+
+def exchange_code(user_code: str, priority: float = 0.0):
+    """
+    Trades an authorization code (the code= of the athlete's exchange_token redirect) for a token
+    Codes are single use and expire within minutes
+    Returns (token dict, None), or (None, reason) if Strava refused the code
+    """
+    response = scheduler.request(
+                        'POST',
+                        oauth_url,
+                        priority=priority,
                         data={
                               'client_id': client_id,
                               'client_secret': client_secret,
                               'code': user_code,
                               'grant_type': 'authorization_code'
                               },
-                        timeout=20,
                         )
     if response.ok:
-        strava_tokens = response.json()
-        path = token_save_location + f"strava_tokens_{user_id}.json"
-        with open(path, 'w') as outfile:
-            json.dump(strava_tokens, outfile)
+        return response.json(), None
+    if response.status_code == 400:
+        return None, "invalid, expired or already used code (HTTP 400)"
+    return None, f"token request failed (HTTP {response.status_code})"
+
+
+def load_user_token(user_id: str) -> dict:
+    """
+    Returns the saved token dict for user_id read from disk, None if no file found
+    """
+    vault = get_vault()
+    if vault is not None:
+        return vault.get(user_id)
+    user_token_path = get_user_path(user_id)
+    if not user_token_path:
+        return None
+    with open(user_token_path) as token_file:
+        return json.load(token_file)
+
+
+class TokenCache:
+    """
+    Process-wide in-memory cache of user token dicts
+        - each token file is read once, then served from memory
+        - refreshes are single-flight: callers for the same user share one lock,
+          and a refresh token Strava rejected is not retried by the waiters
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}           # user_id -> token dict
+        self._refresh_locks = {}    # user_id -> Lock
+        self._rejected = {}         # user_id -> refresh_token Strava refused
+
+    def get(self, user_id: str) -> dict:
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = load_user_token(user_id)
+            if token is not None:
+                with self._lock:
+                    token = self._tokens.setdefault(user_id, token)
+        return token
+
+    def preload(self, user_ids: list) -> None:
+        """Loads the users not cached yet, in one query when tokens are in the vault"""
+        missing = [user_id for user_id in user_ids if user_id not in self._tokens]
+        vault = get_vault()
+        if vault is None or not missing:
+            return
+        tokens = vault.get_many(missing)
+        with self._lock:
+            for user_id, token in tokens.items():
+                self._tokens.setdefault(user_id, token)
+
+    def put(self, user_id: str, token: dict) -> None:
+        with self._lock:
+            self._tokens[user_id] = token
+            self._rejected.pop(user_id, None)
+
+    def refresh_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            return self._refresh_locks.setdefault(user_id, threading.Lock())
+
+    def reject(self, user_id: str, token: dict) -> None:
+        with self._lock:
+            self._rejected[user_id] = token['refresh_token']
+
+    def is_rejected(self, user_id: str, token: dict) -> bool:
+        return self._rejected.get(user_id) == token['refresh_token']
+
+    def invalidate(self, user_id: str = None) -> None:
+        """Drops one user (or everyone) so the next get() rereads from disk"""
+        with self._lock:
+            if user_id is None:
+                self._tokens.clear()
+                self._rejected.clear()
+            else:
+                self._tokens.pop(user_id, None)
+                self._rejected.pop(user_id, None)
+
+
+token_cache = TokenCache()
+
+
+def write_user_token(user_id: str, token: dict) -> None:
+    """
+    Saves token dict to user_id's token file (atomically) or the vault, and the token cache
+    """
+    vault = get_vault()
+    if vault is not None:
+        vault.put(user_id, token)
+    else:
+        write_json_atomic(token_save_location + f"strava_tokens_{user_id}.json", token)
+    token_cache.put(user_id, token)
+
+
+def write_user_tokens(tokens: dict) -> None:
+    """
+    write_user_token for many users, {user_id: token dict}; a single transaction in the vault
+    """
+    vault = get_vault()
+    if vault is not None:
+        vault.put_many(tokens)
     else:
-        print(f"Error requesting {user_id}'s token.")
+        for user_id, token in tokens.items():
+            write_json_atomic(token_save_location + f"strava_tokens_{user_id}.json", token)
+    for user_id, token in tokens.items():
+        token_cache.put(user_id, token)
+
+
+def delete_user_token(user_id: str) -> None:
+    """
+    Removes user_id's token file (or vault entry) and cached token, eg. after they deauthorize the app
+    """
+    vault = get_vault()
+    if vault is not None:
+        vault.delete(user_id)
+    else:
+        path = get_user_path(user_id)
+        if path:
+            os.remove(path)
+    token_cache.invalidate(user_id)
+
+
+def refresh_request_data(token: dict) -> dict:
+    """
+    Form data for a Strava auth API call with the token's refresh token
+    """
+    return {
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'grant_type': 'refresh_token',
+        'refresh_token': token['refresh_token']
+    }
+
+
+def token_needs_refresh(token: dict, min_ttl: float = None) -> bool:
+    """
+    True if token expires within min_ttl seconds (default token_refresh_margin)
+    """
+    min_ttl = token_refresh_margin if min_ttl is None else min_ttl
+    return token['expires_at'] - min_ttl < time.time()
+
+
+def cached_token(user_id: str):
+    """
+    Returns (token dict, None) from the token cache (read from file on first use),
+    or (None, reason) if the token is missing, unreadable or incomplete
+    """
+    try:
+        token = token_cache.get(user_id)
+    except (OSError, ValueError) as e:
+        return None, f"unreadable token file ({e})"
+    if not token:
+        return None, "no token file"
+    if 'refresh_token' not in token or 'expires_at' not in token:
+        return None, "token file is missing refresh_token/expires_at"
+    return token, None
 
-    return response.ok
+
+def reload_token(user_id: str):
+    """
+    cached_token() reread from disk (token file or vault), for use just before a refresh:
+    another process (eg. a 'refresh-tokens' cron job) may have rotated the refresh token
+    """
+    try:
+        token = load_user_token(user_id)
+    except (OSError, ValueError) as e:
+        return None, f"unreadable token file ({e})"
+    if not token:
+        return None, "no token file"
+    if 'refresh_token' not in token or 'expires_at' not in token:
+        return None, "token file is missing refresh_token/expires_at"
+    cached = token_cache.get(user_id)
+    if cached is None or cached.get('refresh_token') != token['refresh_token']:
+        token_cache.put(user_id, token)
+    return token_cache.get(user_id), None
+
+
+def _refresh_if_needed(user_id: str, min_ttl: float = None):
+    """
+    Returns (token dict, None) with the token refreshed if it expires within min_ttl,
+    or (None, reason) if there is no usable token
+    """
+    # Get the tokens from the cache to connect to Strava
+    token, error = cached_token(user_id)
+    if error:
+        return None, error
+
+    # Check if token is about to expire and refresh it, once for all concurrent callers
+    if token_needs_refresh(token, min_ttl):
+        with token_cache.refresh_lock(user_id):
+            token, error = reload_token(user_id)
+            if error:
+                return None, error
+            if token_cache.is_rejected(user_id, token):
+                return None, "refresh rejected by Strava"
+            if token_needs_refresh(token, min_ttl):
+                # Make Strava auth API call with current refresh token
+                response = scheduler.request('POST', oauth_url, data=refresh_request_data(token))
+                if not response.ok:
+                    token_cache.reject(user_id, token)
+                    return None, f"refresh rejected by Strava (HTTP {response.status_code})"
+                token = response.json()
+                write_user_token(user_id, token)
+    return token, None
 
 
 def get_user_token(user_id: str) -> str:
@@ -76,60 +592,164 @@ def get_user_token(user_id: str) -> str:
     Retrieves user access token and refreshes saved token if need be
     None if file does not exist or error refreshing/retrieving token
     """
-    user_token_path = get_user_path(user_id)
-    if not user_token_path:
-        return None
-    
-    # Get the tokens from file to connect to Strava
-    token = None
-    with open(user_token_path) as token_file:
-        token = json.load(token_file)
-
-    # Check if token expired and refresh it
-    if token['expires_at'] < time.time():
-        # Make Strava auth API call with current refresh token
-        response = requests.post(
-            url='https://www.strava.com/oauth/token',
-            data={
-                'client_id': client_id,
-                'client_secret': client_secret,
-                'grant_type': 'refresh_token',
-                'refresh_token': token['refresh_token']
-            }
-        )
-
-        if response.ok:
-            token = response.json()
-            with open(user_token_path, 'w') as outfile:
-                json.dump(token, outfile)
+    token, error = _refresh_if_needed(user_id)
+    if error and error != "no token file":
+        print(f"Error refreshing {user_id}'s token: {error}")
+    return token['access_token'] if token else None
+
+
+def refresh_tokens(user_ids: list = None, horizon: float = None, max_workers: int = 8) -> dict:
+    """
+    Pre-flight token stage: refreshes every token expiring within horizon seconds
+    in a bounded concurrent batch, so refreshes are off the scoring critical path
+    @param user_ids list ids to check, defaults to get_token_list()
+    @param horizon float seconds, defaults to settings TOKEN_REFRESH_HORIZON
+    @param max_workers int refreshes in flight at once
+    @return dict with
+        'valid':     ids whose token outlives the horizon
+        'refreshed': ids refreshed now
+        'invalid':   {id: reason} unreadable, revoked or otherwise unusable tokens
+    """
+    user_ids = get_token_list() if user_ids is None else user_ids
+    horizon = strava_app_settings.TOKEN_REFRESH_HORIZON if horizon is None else horizon
+    report = {'valid': [], 'refreshed': [], 'invalid': {}}
+
+    token_cache.preload(user_ids)
+    expiring = []
+    for user_id in user_ids:
+        try:
+            token = token_cache.get(user_id)
+        except (OSError, ValueError) as e:
+            report['invalid'][user_id] = f"unreadable token file ({e})"
+            continue
+        if token and 'expires_at' in token and not token_needs_refresh(token, horizon):
+            report['valid'].append(user_id)
         else:
-            print(f"Error refreshing {user_id}'s token.")
-            return None
+            expiring.append(user_id)
 
-    return token['access_token']
+    def refresh(user_id):
+        try:
+            return _refresh_if_needed(user_id, horizon)
+        except StravaAPIError as e:
+            return None, str(e)
 
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for user_id, (token, error) in zip(expiring, executor.map(refresh, expiring)):
+            if token:
+                report['refreshed'].append(user_id)
+            else:
+                report['invalid'][user_id] = error
+    return report
 
-def get_user_activities(user_id:str):
+
+def activity_timestamp(activity) -> int:
+    """UTC epoch seconds of an activity's 'start_date' (same clock as the before/after params)"""
+    return calendar.timegm(time.strptime(activity['start_date'], "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def _estimate_page_count(first_page: list, after: int, before: int) -> int:
     """
-    Retrieves user Strava activities from Challenge start and stop dates
+    Estimates the number of pages in the after..before window from the
+    activity density of a full first page
+    Pages come oldest first, so nothing precedes the first activity; and nothing is
+    newer than now, however far off 'before' is during a live challenge
     """
-    user_token = get_user_token(user_id)
-    if not user_token:
-        return False
+    timestamps = [activity_timestamp(a) for a in first_page]
+    covered = max(timestamps) - min(timestamps) + 1
+    remaining = max(covered, min(before, time.time()) - max(after, min(timestamps)))
+    estimated_total = len(first_page) * remaining / covered
+    return max(1, math.ceil(estimated_total / activities_per_page))
+
 
-    strava_url = "https://www.strava.com/api/v3/activities"
+def _get_activities_page(user_id: str, user_token: str, page: int, after: int, before: int,
+                         priority: float = 0.0) -> list:
+    """
+    Requests a single page of activities
+    Raises StravaAPIError if the request fails
+    """
     strava_params = {
         'access_token'  : user_token,
-        'per_page'      : '200',
-        'page'          : '1',
-        'before'        : str(strava_app_settings.END),
-        'after'         : str(strava_app_settings.START),
+        'per_page'      : str(activities_per_page),
+        'page'          : str(page),
+        'before'        : str(before),
+        'after'         : str(after),
     }
-
-    activities_req = requests.get(url=strava_url, params=strava_params)
-    
+    activities_req = scheduler.request('GET', activities_url, priority=priority, params=strava_params)
     if not activities_req.ok:
-        print(f"Failed to retrieve {user_id}'s data")
-        return False
+        raise StravaAPIError(f"Failed to retrieve {user_id}'s data (page {page}, HTTP {activities_req.status_code})")
+    with metrics.span('json_decode'):
+        return activities_req.json()
+
+
+def iter_user_activities(user_id: str, after: int = None, before: int = None,
+                         max_workers: int = max_concurrent_pages, priority: float = 0.0):
+    """
+    Generator over all of a user's Strava activities in the after..before window
+    Page 1 is fetched alone. If it is full, the remaining page count is estimated from
+    its activity density and later pages are fetched concurrently, max_workers at a time.
+    Activities are yielded page by page, in page order, as soon as each page arrives.
+    @param user_id str Strava ID for user
+    @param after int epoch seconds, defaults to challenge START
+    @param before int epoch seconds, defaults to challenge END
+    @param max_workers int upper bound on pages in flight
+    @param priority float scheduler priority, lower goes first (eg. time of last sync)
+    Raises StravaAPIError if the token or any page cannot be retrieved
+    """
+    after = strava_app_settings.START if after is None else after
+    before = strava_app_settings.END if before is None else before
+
+    user_token = get_user_token(user_id)
+    if not user_token:
+        raise StravaAPIError(f"No valid token for {user_id}")
 
-    return activities_req.json()
\ No newline at end of file
+    first_page = _get_activities_page(user_id, user_token, 1, after, before, priority)
+    yield from first_page
+    if len(first_page) < activities_per_page:
+        return
+
+    estimated_pages = _estimate_page_count(first_page, after, before)
+    next_page = 2
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while True:
+            # Fetch up to the estimate concurrently, then one page at a time if it was short
+            window = max(1, min(max_workers, estimated_pages - next_page + 1))
+            futures = [executor.submit(_get_activities_page, user_id, user_token, page, after, before, priority)
+                       for page in range(next_page, next_page + window)]
+            next_page += window
+            for index, future in enumerate(futures):
+                page = future.result()
+                yield from page
+                if len(page) < activities_per_page:
+                    for pending in futures[index + 1:]:
+                        pending.cancel()
+                    return
+
+
+def get_activity(user_id: str, activity_id, priority: float = 0.0) -> dict:
+    """
+    Requests a single activity by id (eg. the one named in a webhook event)
+    Returns None if Strava no longer has it (deleted or made private)
+    Raises StravaAPIError if the token or the request fails
+    """
+    user_token = get_user_token(user_id)
+    if not user_token:
+        raise StravaAPIError(f"No valid token for {user_id}")
+    response = scheduler.request('GET', f"{activities_url}/{activity_id}", priority=priority,
+                                 headers={'Authorization': f"Bearer {user_token}"})
+    if response.status_code == 404:
+        return None
+    if not response.ok:
+        raise StravaAPIError(f"Failed to retrieve {user_id}'s activity {activity_id} (HTTP {response.status_code})")
+    return response.json()
+
+
+def get_user_activities(user_id:str):
+    """
+    Retrieves all user Strava activities from Challenge start and stop dates
+    Returns False if the token or any page could not be retrieved
+    """
+    try:
+        return list(iter_user_activities(user_id))
+    except StravaAPIError as e:
+        print(e)
+        return False
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import time
+
+import strava_app_api
+import strava_app_metrics as metrics
+import strava_app_scoring as scorer
+import strava_app_store
+
+"""
+Module for:
+1) asyncio alternative to the thread pool pipeline (strava_app_pipeline) in main.py
+   A single pooled HTTP client; token refresh, activity pagination and scoring
+   all run as coroutines under one concurrency limit
+Requires aiohttp (pip install aiohttp)
+Produces the same UserEC results as strava_app_pipeline: activities are merged
+into the activity store and scored from it exactly like the threaded path
+"""
+
+try:
+    import aiohttp
+except ImportError:     # optional dependency, only needed for this fetch path
+    aiohttp = None
+
+default_concurrency = 25    # users in flight at once
+
+
+async def _request(session, method: str, url: str, **kwargs):
+    """
+    Sends a request metered by strava_app_api.scheduler, retrying 429/5xx (and
+    connection errors for idempotent methods) like RequestScheduler.request does
+    Returns (status, decoded JSON body), the body None unless the status is 2xx
+    (error pages, eg. a gateway's HTML 502, are not JSON)
+    Raises StravaAPIError if a 2xx body is not valid JSON
+    """
+    scheduler = strava_app_api.scheduler
+    for attempt in range(scheduler.max_retries + 1):
+        while (wait := scheduler.try_acquire()) > 0:
+            await asyncio.sleep(wait)
+
+        response = None
+        started = time.perf_counter()
+        try:
+            with metrics.span('http'):
+                async with session.request(method, url, **kwargs) as response:
+                    body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            response = None
+            metrics.record_request(method, None, time.perf_counter() - started, attempt)
+            if attempt == scheduler.max_retries or method.upper() not in scheduler.idempotent_methods:
+                raise strava_app_api.StravaAPIError(f"Strava request failed: {e}") from e
+        else:
+            metrics.record_request(method, response.status, time.perf_counter() - started, attempt)
+            if response.status not in scheduler.retry_statuses or attempt == scheduler.max_retries:
+                if not 200 <= response.status < 300 or not body:
+                    return response.status, None
+                try:
+                    with metrics.span('json_decode'):
+                        return response.status, json.loads(body)
+                except ValueError as e:
+                    raise strava_app_api.StravaAPIError(f"Invalid response from {url}: {e}") from e
+        finally:
+            scheduler.release(None if response is None else response.headers)
+        await asyncio.sleep(scheduler.backoff(attempt, response))
+
+
+async def get_user_token(session, user_id: str) -> str:
+    """
+    Async strava_app_api.get_user_token: refreshes the saved token if it has expired
+    None if file does not exist or error refreshing/retrieving token
+    """
+    token, error = strava_app_api.cached_token(user_id)
+    if error:
+        if error != "no token file":
+            print(f"Error refreshing {user_id}'s token: {error}")
+        return None
+
+    # One coroutine per user, so no single-flight lock is needed here
+    if strava_app_api.token_needs_refresh(token):
+        # Reread first: another process may have refreshed it already
+        token, error = strava_app_api.reload_token(user_id)
+        if not error and strava_app_api.token_cache.is_rejected(user_id, token):
+            error = "refresh rejected by Strava"
+        if error:
+            print(f"Error refreshing {user_id}'s token: {error}")
+            return None
+    if strava_app_api.token_needs_refresh(token):
+        status, body = await _request(session, 'POST', strava_app_api.oauth_url,
+                                      data=strava_app_api.refresh_request_data(token))
+        if status != 200:
+            strava_app_api.token_cache.reject(user_id, token)
+            print(f"Error refreshing {user_id}'s token: refresh rejected by Strava (HTTP {status})")
+            return None
+        token = body
+        strava_app_api.write_user_token(user_id, token)
+
+    return token['access_token']
+
+
+async def _get_activities_page(session, user_id: str, user_token: str, page: int, after: int, before: int) -> list:
+    strava_params = {
+        'access_token'  : user_token,
+        'per_page'      : str(strava_app_api.activities_per_page),
+        'page'          : str(page),
+        'before'        : str(before),
+        'after'         : str(after),
+    }
+    status, body = await _request(session, 'GET', strava_app_api.activities_url, params=strava_params)
+    if status >= 400:
+        raise strava_app_api.StravaAPIError(f"Failed to retrieve {user_id}'s data (page {page}, HTTP {status})")
+    return body
+
+
+async def get_user_activities(session, user_id: str, after: int, before: int,
+                              max_pages: int = strava_app_api.max_concurrent_pages) -> list:
+    """
+    Async strava_app_api.iter_user_activities: page 1 alone, then estimated
+    pages max_pages at a time until a short page
+    Raises StravaAPIError if the token or any page cannot be retrieved
+    """
+    user_token = await get_user_token(session, user_id)
+    if not user_token:
+        raise strava_app_api.StravaAPIError(f"No valid token for {user_id}")
+
+    per_page = strava_app_api.activities_per_page
+    activities = await _get_activities_page(session, user_id, user_token, 1, after, before)
+    if len(activities) < per_page:
+        return activities
+
+    estimated_pages = strava_app_api._estimate_page_count(activities, after, before)
+    next_page = 2
+    while True:
+        window = max(1, min(max_pages, estimated_pages - next_page + 1))
+        pages = await asyncio.gather(*(_get_activities_page(session, user_id, user_token, page, after, before)
+                                       for page in range(next_page, next_page + window)))
+        next_page += window
+        for page in pages:
+            activities.extend(page)
+            if len(page) < per_page:
+                return activities
+
+
+async def process_user(session, semaphore: asyncio.Semaphore, user_id: str, challenges: list) -> list:
+    """
+    Coroutine version of one user's pass through strava_app_pipeline: syncs them into the
+    activity store once over the union of the challenge windows, then scores every challenge
+    Returns a UserEC object per challenge, None where the user has no activities (or the fetch failed)
+    """
+    after, before = scorer.union_window(challenges)
+    async with semaphore:
+        plan = strava_app_store.SyncPlan(user_id, after, before, keep_new=False)
+        started = time.perf_counter()
+        try:
+            activities = await get_user_activities(session, user_id, plan.fetch_after, before)
+        except strava_app_api.StravaAPIError as e:
+            metrics.incr('user_fetch_failures')
+            print(e)
+            print(f"Error obtaining Strava data for user {user_id}")
+            return [None] * len(challenges)
+        plan.commit(activities)
+        metrics.observe('user_fetch_seconds', time.perf_counter() - started)
+
+    with metrics.span('scoring'):
+        users = scorer.score_user_challenges(user_id, challenges)
+    if not any(users):
+        print(f"Error obtaining Strava data for user {user_id}")
+    return users
+
+
+async def fetch_and_score(user_ids: list, concurrency: int = default_concurrency, challenges: list = None) -> list:
+    """
+    Fetches and scores every user over one pooled client session
+    Returns a list per challenge (default: just the one in settings) of the UserEC objects
+    for users that succeeded, in user_ids order
+    """
+    challenges = [scorer.DEFAULT_CHALLENGE] if challenges is None else challenges
+    if aiohttp is None:
+        raise ImportError("The async fetch path requires aiohttp: pip install aiohttp")
+
+    connector = aiohttp.TCPConnector(limit=concurrency * strava_app_api.max_concurrent_pages)
+    connect_timeout, read_timeout = strava_app_api.request_timeout
+    timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        results = await asyncio.gather(*(process_user(session, semaphore, user_id, challenges)
+                                         for user_id in user_ids))
+    return [[users[i] for users in results if users[i]] for i in range(len(challenges))]
+
+
+def run(user_ids: list, concurrency: int = default_concurrency, challenges: list = None) -> list:
+    """Blocking entry point for fetch_and_score"""
+    return asyncio.run(fetch_and_score(user_ids, concurrency, challenges))
@@ -0,0 +1,184 @@
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+import strava_app_scoring as scorer
+import strava_app_store
+from strava_app_helpers import BonusType
+from strava_app_sports import ADVENTURE_CATEGORIES, BONUS_CATEGORIES, CATEGORIES, MILES, MINUTES, \
+    METERS, SPORT_DISPATCH, STAT_FIELDS
+
+"""
+Module for:
+1) Vectorized batch scoring of many users from one columnar activities DataFrame
+   Output matches strava_app_scoring.create_dataframe_from_users exactly
+
+Per-user sums use np.bincount, which adds each user's activities sequentially in
+the same order UserEC.add_activities does, so float totals are bit-identical
+"""
+
+ACTIVITY_COLUMNS = ['user_id', 'sport_type', 'distance', 'moving_time', 'start_date']
+
+
+def _python_round(values: np.ndarray, ndigits=2) -> np.ndarray:
+    """Per-user round() so values match scorer.round_all bit for bit"""
+    return np.array([round(v, ndigits) for v in values.tolist()], dtype=np.float64)
+
+
+def activities_frame(rows) -> pd.DataFrame:
+    """
+    Builds the columnar activities DataFrame from (user_id, sport_type, distance,
+    moving_time, start_date) rows, eg. strava_app_store.load_activity_columns()
+    """
+    return pd.DataFrame.from_records(rows, columns=ACTIVITY_COLUMNS)
+
+
+def activities_frame_from_dicts(activities_by_user: dict) -> pd.DataFrame:
+    """
+    Builds the columnar activities DataFrame from {user_id: [Strava activity dict]}
+    """
+    return activities_frame((user_id, a['sport_type'], a['distance'], a['moving_time'], a['start_date'])
+                            for user_id, activities in activities_by_user.items() for a in activities)
+
+
+def score_activities(activities: pd.DataFrame, user_ids: list, challenge: scorer.Challenge = None) -> pd.DataFrame:
+    """
+    Scores every user in user_ids from one activities DataFrame
+    Users without activities are left out, like UserEC.calculate_points failing for them
+    @param activities DataFrame with ACTIVITY_COLUMNS, each user's activities (in the
+        challenge window) in fetch order
+    @param user_ids list of user ids, sets the row order
+    @param challenge Challenge whose constants and bonus tables are used, defaults to the one in settings
+    @return DataFrame identical to create_dataframe_from_users for the same users
+    """
+    c = scorer.DEFAULT_CHALLENGE if challenge is None else challenge
+    user_codes = pd.Categorical(activities['user_id'], categories=list(user_ids)).codes.astype(np.int64)
+    keep = user_codes >= 0
+    activities = activities[keep]
+    user_codes = user_codes[keep]
+    n_users = len(user_ids)
+    n_fields = len(STAT_FIELDS)
+    field_index = {name: i for i, name in enumerate(STAT_FIELDS)}
+
+    distance = activities['distance'].to_numpy(dtype=np.float64)
+    duration = activities['moving_time'].to_numpy(dtype=np.float64) / 60.0
+    field_codes = (activities['sport_type'].str.upper()
+                   .map({sport: field_index[name] for sport, (name, _) in SPORT_DISPATCH.items()})
+                   .fillna(-1).to_numpy(dtype=np.int64))
+
+    # Value each activity adds to its stat field, in that field's unit
+    units = np.array([category.unit for category in CATEGORIES])
+    field_unit = np.where(field_codes >= 0, units[np.maximum(field_codes, 0)], '')
+    values = np.select([field_unit == MILES, field_unit == MINUTES, field_unit == METERS],
+                       [distance / 1609.3, duration, distance], 0.0)
+
+    # One grouped reduction for every (user, stat field) pair
+    known = field_codes >= 0
+    stats = np.bincount(user_codes[known] * n_fields + field_codes[known], weights=values[known],
+                        minlength=n_users * n_fields).reshape(n_users, n_fields)
+    touched = np.bincount(field_codes[known], minlength=n_fields) > 0
+    total_moving_time = np.bincount(user_codes, weights=duration, minlength=n_users)
+    activity_count = np.bincount(user_codes, minlength=n_users)
+
+    # First / last day, compared as local wall-clock times like datetime.timestamp() does
+    start = pd.to_datetime(activities['start_date'], format="%Y-%m-%dT%H:%M:%SZ").to_numpy()
+    first_day = np.datetime64(datetime.fromtimestamp(c.start + 86400))
+    last_day = np.datetime64(datetime.fromtimestamp(c.end - 86400))
+    early = start < first_day
+    late = ~early & (start > last_day)
+    first_of_month = np.bincount(user_codes, weights=early, minlength=n_users) > 0
+    last_of_month = np.bincount(user_codes, weights=late, minlength=n_users) > 0
+
+    stat = {name: stats[:, i] for i, name in enumerate(STAT_FIELDS)}
+
+    # ECM
+    ecm_bike = c.ecm_bike * stat['bike_distance']
+    ecm_swim = c.ecm_swim * stat['swim_distance']
+    ecm_walk = c.ecm_run * stat['walk_distance']
+    ecm_run = c.ecm_run * stat['run_distance']
+    total_ecm = ecm_bike + ecm_swim + ecm_walk + ecm_run
+
+    # Bonus
+    def tier_points(bonus_type, values):
+        table = c.bonus_tables.get(bonus_type)
+        return table.score(values) if table else np.zeros(n_users, dtype=np.int64)
+
+    bonus = {'bonus_ECM': tier_points(BonusType.ECM, total_ecm)}
+    for category in BONUS_CATEGORIES:
+        bonus[category.bonus_field] = tier_points(category.bonus, stat[category.stat_field])
+    total_bonus = sum(bonus.values())
+
+    # Unique
+    zeros = np.zeros(n_users, dtype=np.int64)
+    unique = {
+        'early_bird': np.where(first_of_month, c.bonus_bird, zeros),
+        'final_stretch': np.where(last_of_month, c.bonus_bird, zeros),
+        'triathlete': np.where((stat['swim_distance'] > 0) & (stat['bike_distance'] > 0)
+                               & (stat['run_distance'] > 0), c.bonus_triathlete, zeros),
+        'around_the_world': np.where((stat['weightlift_time'] > 0) & (stat['rowing_distance'] > 0)
+                                     & (stat['stairstepper_time'] > 0) & (stat['hiit_time'] > 0)
+                                     & (stat['walk_distance'] > 0), c.bonus_world, zeros),
+        'club_500': np.where(np.any([bonus[category.bonus_field] >= 500 for category in BONUS_CATEGORIES], axis=0),
+                             c.bonus_500, zeros),
+        'first_step': np.where(total_moving_time >= 60, c.bonus_first_step, zeros),
+        'lucky_7s': np.where(total_ecm >= 777, c.bonus_lucky_7s, zeros),
+    }
+
+    # Adventure
+    adventure = {category.points_field: np.floor(stat[category.stat_field] / 30).astype(np.int64) * c.adventure_points
+                 for category in ADVENTURE_CATEGORIES}
+    number_of_adventures = sum((points > 0).astype(np.int64) for points in adventure.values())
+    unique['club_adventure'] = np.where(number_of_adventures >= 6, c.bonus_adventure_club, zeros)
+    total_unique = sum(unique.values())
+    total_adventure = sum(adventure.values())
+
+    total_time_pts = total_moving_time * c.pts_per_min
+    total_points = total_time_pts + total_bonus + total_unique + total_adventure
+
+    def stat_column(name):
+        # A stat no activity touched stays the dataclass default int 0
+        return stat[name] if touched[field_index[name]] else zeros
+
+    columns = {
+        'User_ID': list(user_ids),
+        'Team': zeros,
+        'Rank': zeros,
+        'Name': ["None"] * n_users,
+        'Total_Points': total_points,
+        'Moving_Time': total_moving_time,
+        'Time_Points': _python_round(total_time_pts),
+        'Bonus_Points': total_bonus,
+        'Unique_Points': total_unique,
+        'Adventure_Points': total_adventure,
+        'Net_ECM': _python_round(total_ecm),
+        'Run_Distance': stat_column('run_distance'),
+        'Walk_Distance': stat_column('walk_distance'),
+        'Bike_Distance': stat_column('bike_distance'),
+        'Swim_Distance': stat_column('swim_distance'),
+        'Rowing_Distance': stat_column('rowing_distance'),
+        'Weightlift_Time': stat_column('weightlift_time'),
+        'HIIT_Time': stat_column('hiit_time'),
+        'Stairstepper_Time': stat_column('stairstepper_time'),
+        'Early_Bird': unique['early_bird'],
+        'First_Step': unique['first_step'],
+        'Final_Stretch': unique['final_stretch'],
+        'Triathlete': unique['triathlete'],
+        'Around_the_World': unique['around_the_world'],
+        'Club_500': unique['club_500'],
+        'Lucky_7s': unique['lucky_7s'],
+        'Club_Adventure': unique['club_adventure'],
+    }
+    for category in ADVENTURE_CATEGORIES:
+        columns[category.column] = adventure[category.points_field]
+
+    df = pd.DataFrame(columns)
+    return df[activity_count > 0].reset_index(drop=True).round(2)
+
+
+def score_cached_users(user_ids: list, challenge: scorer.Challenge = None) -> pd.DataFrame:
+    """
+    Re-scores users straight from the activity store, no API calls
+    """
+    c = scorer.DEFAULT_CHALLENGE if challenge is None else challenge
+    rows = strava_app_store.load_activity_columns(user_ids, c.start, c.end)
+    return score_activities(activities_frame(rows), user_ids, c)
@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import zlib
+from datetime import datetime, timezone
+from unittest import mock
+
+import strava_app_api
+import strava_app_scoring as scorer
+import strava_app_store
+import strava_app_stub
+import strava_app_team as teams
+from strava_app_settings import INTERMEDIATE_LOCATION, START, END
+
+"""
+Module for:
+1) Synthetic Strava activities - payloads shaped like /athlete/activities results
+   (sport_type mix, distances and moving times that fit the sport, 'start_date' strings)
+2) Benchmarks of the scoring flow at any scale, eg. 10 to 100k users
+    add_activities / calculate_points / create_dataframe_from_users / calculate_team_statistics
+        on every generated user, in memory
+    calculate_stats
+        a sample of users synced from a local StubStrava into an empty activity store
+    main
+        the end-to-end main.main() run against the stub, for a sample of users
+3) Results saved as JSON (BENCH_LOCATION) and compared between versions
+
+Example:
+    python strava_app_bench.py --scales 10 1000 100000
+    python strava_app_bench.py --compare output/benchmarks/bench-A.json output/benchmarks/bench-B.json
+Everything runs in a temporary directory; the real tokens, store and outputs are not touched
+"""
+
+BENCH_LOCATION = INTERMEDIATE_LOCATION + 'benchmarks/'
+
+# sport_type: (share of activities, (low, high) distance in meters, (low, high) pace in seconds per km)
+# Time-only sports have no distance; their pace range is the duration range in seconds
+SPORT_MIX = {
+    'Run':                           (0.24, (3000, 16000),   (270, 420)),
+    'Ride':                          (0.14, (10000, 80000),  (100, 180)),
+    'VirtualRide':                   (0.04, (10000, 40000),  (100, 150)),
+    'Walk':                          (0.16, (1500, 8000),    (540, 780)),
+    'Hike':                          (0.04, (4000, 18000),   (600, 900)),
+    'Swim':                          (0.05, (500, 3000),     (1200, 2100)),
+    'Rowing':                        (0.02, (2000, 10000),   (220, 300)),
+    'WeightTraining':                (0.10, None,            (1200, 4200)),
+    'HighIntensityIntervalTraining': (0.04, None,            (900, 2700)),
+    'StairStepper':                  (0.02, None,            (600, 2400)),
+    'Yoga':                          (0.06, None,            (1200, 4500)),
+    'Pickleball':                    (0.02, None,            (1800, 5400)),
+    'Tennis':                        (0.02, None,            (2700, 6000)),
+    'AlpineSki':                     (0.01, (5000, 30000),   (60, 300)),
+    'Kayaking':                      (0.01, (2000, 12000),   (400, 700)),
+    'Golf':                          (0.01, (3000, 8000),    (1500, 2500)),
+    'Workout':                       (0.02, None,            (900, 3600)),  # not scored, like real uploads
+}
+_SPORTS = list(SPORT_MIX)
+_WEIGHTS = [share for share, _, _ in SPORT_MIX.values()]
+
+
+def generate_activities(user_id: str, count: int, seed: int = 0, start: int = START, end: int = END) -> list:
+    """
+    Returns count synthetic activities for user_id inside start..end, oldest first
+    The same (user_id, seed) always gives the same activities
+    """
+    rng = random.Random(f"{seed}-{user_id}")
+    athlete_id = int(user_id) if user_id.isdigit() else zlib.crc32(user_id.encode())
+    starts = sorted(rng.randint(start + 1, end - 1) for _ in range(count))
+    activities = []
+    for index, (sport, timestamp) in enumerate(zip(rng.choices(_SPORTS, _WEIGHTS, k=count), starts)):
+        _, distance_range, pace_range = SPORT_MIX[sport]
+        if distance_range:
+            distance = round(rng.uniform(*distance_range), 1)
+            moving_time = int(distance / 1000 * rng.uniform(*pace_range))
+        else:
+            distance = 0.0
+            moving_time = rng.randint(*pace_range)
+        activities.append({
+            'resource_state': 2,
+            'athlete': {'id': athlete_id, 'resource_state': 1},
+            'name': f"{sport} {index}",
+            'distance': distance,
+            'moving_time': moving_time,
+            'elapsed_time': moving_time + rng.randint(0, 600),
+            'total_elevation_gain': round(rng.uniform(0, 300), 1) if distance else 0,
+            'type': sport,
+            'sport_type': sport,
+            'id': athlete_id * 100000 + index,
+            'start_date': datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'timezone': "(GMT-07:00) America/Denver",
+            'trainer': sport.startswith('Virtual'),
+            'manual': rng.random() < 0.05,
+            'average_speed': round(distance / moving_time, 3) if distance else 0,
+        })
+    return activities
+
+
+def generate_users(n_users: int, activities_per_user: int = 40, seed: int = 0):
+    """Generator of (user_id, activities); activity counts vary around activities_per_user"""
+    rng = random.Random(seed)
+    for user in range(n_users):
+        user_id = str(1000 + user)
+        yield user_id, generate_activities(user_id, rng.randint(0, 2 * activities_per_user), seed)
+
+
+def write_rosters(user_ids: list, team_size: int = 8, seed: int = 0) -> None:
+    """users.json / teams.json with users dealt into teams of team_size"""
+    rng = random.Random(seed)
+    n_teams = max(1, len(user_ids) // team_size)
+    roster = teams.Roster()
+    for user_id in user_ids:
+        roster.upsert(user_id, name=f"Athlete {user_id}", team=rng.randint(1, n_teams))
+    roster.save()
+
+
+def _close_store() -> None:
+    """Closes this thread's store connection so the next call opens the current store_file"""
+    conn = getattr(strava_app_store._local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        strava_app_store._local.conn = None
+
+
+class _Sandbox:
+    """Points the store, tokens, rosters and outputs at a temporary directory, and the API at a stub"""
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory + 'tokens/', exist_ok=True)
+        self._patches = [
+            mock.patch.object(strava_app_store, 'store_file', directory + 'activities.db'),
+            mock.patch.object(strava_app_api, 'token_save_location', directory + 'tokens/'),
+            mock.patch.object(strava_app_api, 'scheduler',
+                              strava_app_api.RequestScheduler(short_limit=10**9, daily_limit=10**9)),
+            mock.patch.object(teams, 'user_data_file', directory + 'users.json'),
+            mock.patch.object(teams, 'team_data_file', directory + 'teams.json'),
+            mock.patch.object(teams, 'roster_state_file', directory + 'roster_state.json'),
+            mock.patch.object(teams, 'INTERMEDIATE_LOCATION', directory),
+        ]
+        self.stub = strava_app_stub.StubStrava(rate_limit=(10**9, 10**9))
+        self._base_url = strava_app_api.strava_base_url
+
+    def __enter__(self):
+        for patch in self._patches:
+            patch.start()
+        _close_store()
+        strava_app_api.token_cache.invalidate()
+        self.stub.start()
+        strava_app_api.set_base_url(self.stub.url)
+        return self
+
+    def __exit__(self, *exc):
+        self.stub.stop()
+        strava_app_api.set_base_url(self._base_url)
+        _close_store()
+        for patch in reversed(self._patches):
+            patch.stop()
+        strava_app_api.token_cache.invalidate()
+
+    def add_users(self, users: list) -> None:
+        """Registers (user_id, activities) with the stub and writes their tokens"""
+        for user_id, activities in users:
+            strava_app_api.write_user_token(user_id, self.stub.add_user(user_id, activities))
+
+
+def bench_scale(n_users: int, activities_per_user: int = 40, sample_users: int = 200, seed: int = 0) -> dict:
+    """
+    Runs every benchmark at one scale
+    Returns {benchmark: {'seconds': ..., 'users': ..., 'per_user_us': ...}}
+    """
+    results = {}
+
+    def record(name, seconds, users):
+        results[name] = {'seconds': round(seconds, 6), 'users': users,
+                         'per_user_us': round(seconds / users * 1e6, 3) if users else None}
+
+    # In-memory scoring of every user; activities are generated per user so memory stays flat
+    user_ecs = []
+    add_time = points_time = 0.0
+    n_activities = 0
+    for user_id, activities in generate_users(n_users, activities_per_user, seed):
+        n_activities += len(activities)
+        user_ec = scorer.UserEC(user_id)
+        started = time.perf_counter()
+        has_stats = user_ec.add_activities(activities)
+        add_time += time.perf_counter() - started
+        if has_stats:
+            started = time.perf_counter()
+            user_ec.calculate_points()
+            points_time += time.perf_counter() - started
+            user_ecs.append(user_ec)
+    record('add_activities', add_time, n_users)
+    record('calculate_points', points_time, len(user_ecs))
+    results['activities'] = n_activities
+
+    started = time.perf_counter()
+    df = scorer.create_dataframe_from_users(user_ecs)
+    record('create_dataframe_from_users', time.perf_counter() - started, len(user_ecs))
+    df = df.sort_values('Total_Points', ascending=False).reset_index(drop=True)
+    df['Rank'] = df.index + 1
+
+    with tempfile.TemporaryDirectory() as directory, _Sandbox(directory + '/') as sandbox:
+        write_rosters(list(df['User_ID']), seed=seed)
+        started = time.perf_counter()
+        teams.calculate_team_statistics(df)
+        record('calculate_team_statistics', time.perf_counter() - started, len(df))
+
+        # Network paths against the stub, on a sample of users
+        sample = list(generate_users(min(n_users, sample_users), activities_per_user, seed))
+        sandbox.add_users(sample)
+        started = time.perf_counter()
+        for user_id, _ in sample:
+            scorer.UserEC(user_id).calculate_stats()
+        record('calculate_stats', time.perf_counter() - started, len(sample))
+
+        import main
+        _close_store()
+        with mock.patch.object(strava_app_store, 'store_file', sandbox.directory + 'main.db'), \
+                mock.patch.object(main, 'INTERMEDIATE_LOCATION', sandbox.directory), \
+                mock.patch('builtins.input', return_value='y'), \
+                mock.patch('builtins.print'):
+            started = time.perf_counter()
+            main.main()
+            record('main', time.perf_counter() - started, len(sample))
+        _close_store()
+    return results
+
+
+def git_version() -> str:
+    """Current commit of the working tree, None outside a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales: list, activities_per_user: int = 40, sample_users: int = 200, seed: int = 0,
+        out_dir: str = BENCH_LOCATION) -> str:
+    """
+    Benchmarks every scale and saves the results as JSON
+    Returns the path of the results file
+    """
+    report = {
+        'version': git_version(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'activities_per_user': activities_per_user,
+        'sample_users': sample_users,
+        'seed': seed,
+        'scales': {},
+    }
+    for n_users in scales:
+        print(f"Benchmarking {n_users} users...")
+        report['scales'][str(n_users)] = bench_scale(n_users, activities_per_user, sample_users, seed)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"bench-{report['version'] or 'local'}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(old_path: str, new_path: str, threshold: float = 0.10) -> list:
+    """
+    Prints per-benchmark timing changes between two results files
+    Returns [(scale, benchmark, ratio)] for benchmarks more than threshold slower
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['version']} -> {new['version']}")
+    regressions = []
+    for scale, benchmarks in new['scales'].items():
+        for name, result in benchmarks.items():
+            before = old['scales'].get(scale, {}).get(name)
+            if not isinstance(result, dict) or not isinstance(before, dict) or not before['seconds']:
+                continue
+            ratio = result['seconds'] / before['seconds']
+            flag = "  REGRESSION" if ratio > 1 + threshold else ""
+            print(f"{scale:>8} users  {name:<28} {before['seconds']:10.4f}s -> {result['seconds']:10.4f}s  "
+                  f"x{ratio:.2f}{flag}")
+            if flag:
+                regressions.append((scale, name, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Exercise Challenge scoring flow")
+    parser.add_argument('--scales', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="numbers of users to benchmark")
+    parser.add_argument('--activities', type=int, default=40, help="average activities per user")
+    parser.add_argument('--sample', type=int, default=200,
+                        help="users synced from the stub for calculate_stats and main")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two results files")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        print(f"Results saved to {run(args.scales, args.activities, args.sample, args.seed)}")
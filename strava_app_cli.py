@@ -0,0 +1,230 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import strava_app_settings
+
+"""
+Module for:
+1) Command line entry point with one subcommand per task
+    register        save a new athlete's token from their authorization code
+    onboard         register a whole CSV/JSONL sign-up list at once (strava_app_onboard)
+    refresh-tokens  refresh tokens that expire soon, list unusable ones
+    sync            fetch new activities into the activity store (no scoring)
+    score           full run: fetch, score, rank, save (main.py)
+    leaderboard     keep the rankings live: sync and apply new activities every interval
+    teams           update users.json/teams.json from the tokens, move users between teams
+    export          archive/Excel the last saved rankings
+2) Fast start for scheduled jobs: pandas (and the modules built on it) is only imported
+   by the subcommands that need it, so register/refresh-tokens/sync/teams start quickly
+
+Example (cron):
+    python strava_app_cli.py refresh-tokens
+    python strava_app_cli.py sync --concurrency 20
+    python strava_app_cli.py score --teams --archive
+"""
+
+
+def _challenge_window():
+    """after, before covering every configured challenge"""
+    if strava_app_settings.CHALLENGE_FILE is None:
+        return strava_app_settings.START, strava_app_settings.END
+    import strava_app_scoring as scorer     # only needed to read the challenge file
+    return scorer.union_window(scorer.CHALLENGES)
+
+
+def register(args) -> int:
+    import strava_app_api
+    if not strava_app_api.save_user_token(args.user_id, args.code, overwrite=args.overwrite):
+        return 1
+    print(f"Token saved for user {args.user_id}")
+    return 0
+
+
+def onboard(args) -> int:
+    import strava_app_onboard
+    signups = strava_app_onboard.read_signups(args.path)
+    report = strava_app_onboard.onboard(signups, max_workers=args.workers, overwrite=args.overwrite)
+    print(f"{len(signups)} sign-ups: {len(report['registered'])} registered, "
+          f"{len(report['existing'])} already had a token, {len(report['failed'])} failed")
+    for signup, reason in report['failed']:
+        print(f"  Line {signup['line']} (user {signup['user_id'] or 'unknown'}): {reason}")
+    if args.failed and report['failed']:
+        strava_app_onboard.write_failures(args.failed, report['failed'])
+        print(f"Failures saved to {args.failed}")
+    return 1 if report['failed'] else 0
+
+
+def refresh_tokens(args) -> int:
+    import strava_app_api
+    report = strava_app_api.refresh_tokens(horizon=args.horizon, max_workers=args.workers)
+    print(f"Tokens: {len(report['valid'])} valid, {len(report['refreshed'])} refreshed, "
+          f"{len(report['invalid'])} invalid")
+    for user_id, reason in report['invalid'].items():
+        print(f"  User {user_id}: {reason}")
+    return 0
+
+
+def sync(args) -> int:
+    import strava_app_api
+    import strava_app_store
+    user_ids = args.users or strava_app_api.get_token_list()
+    if not user_ids:
+        print("No tokens found")
+        return 1
+    after, before = _challenge_window()
+    user_ids = strava_app_store.order_by_staleness(user_ids)
+    max_workers = max(1, min(args.concurrency, len(user_ids)))
+    strava_app_api.configure_session(max_workers * strava_app_api.max_concurrent_pages)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        merged = list(executor.map(lambda user_id: strava_app_store.sync_user(user_id, after, before, args.full),
+                                   user_ids))
+    failed = [user_id for user_id, count in zip(user_ids, merged) if count is None]
+    print(f"Synced {len(user_ids) - len(failed)} users, {sum(count or 0 for count in merged)} activities merged")
+    for user_id in failed:
+        print(f"  Failed to sync user {user_id}")
+    return 1 if failed else 0
+
+
+def score(args) -> int:
+    import main
+    main.main(use_async=args.use_async, concurrency=args.concurrency, rescore=args.rescore,
+              processes=args.processes, archive=args.archive, excel=args.excel, report=args.report,
+              prometheus=args.prometheus, with_teams=args.with_teams)
+    return 0
+
+
+def leaderboard(args) -> int:
+    import strava_app_leaderboard
+    strava_app_leaderboard.serve(interval=args.interval, user_ids=args.users or None)
+    return 0
+
+
+def _pairs(values: list, convert=str) -> dict:
+    """['123=4', ...] -> {'123': convert('4'), ...}"""
+    pairs = {}
+    for value in values:
+        key, sep, item = value.partition('=')
+        if not sep:
+            raise SystemExit(f"Expected USER_ID=VALUE, got '{value}'")
+        pairs[key] = convert(item)
+    return pairs
+
+
+def teams(args) -> int:
+    import strava_app_team
+    roster = strava_app_team.Roster.load()
+    added = roster.sync_tokens(force=args.rescan)
+    for user_id, name in _pairs(args.name).items():
+        roster.upsert(user_id, name=name)
+    roster.reassign(_pairs(args.assign, int))
+    team_data = roster.build_teams()
+    roster.save()
+    unassigned = sum(1 for user in roster.users.values() if user.get('team', 0) == 0)
+    print(f"{len(roster.users)} users ({added} new, {unassigned} without a team), {len(team_data)} teams")
+    return 0
+
+
+def export(args) -> int:
+    if not (args.archive or args.excel):
+        print("Nothing to export, pass --archive and/or --excel")
+        return 1
+    import pandas as pd
+    import strava_app_export
+    import strava_app_scoring as scorer
+    challenges = [challenge for challenge in scorer.CHALLENGES if args.challenge in (None, challenge.name)]
+    if not challenges:
+        print(f"No challenge named {args.challenge}")
+        return 1
+    location = strava_app_settings.INTERMEDIATE_LOCATION
+    for challenge in challenges:
+        prefix = f"{challenge.name}_" if len(scorer.CHALLENGES) > 1 else ""
+        rankings_path = location + prefix + 'user_rankings.csv'
+        if not os.path.exists(rankings_path):
+            print(f"No rankings saved for {challenge.name} ({rankings_path}), run score first")
+            return 1
+        df = pd.read_csv(rankings_path, dtype={'User_ID': str})
+        team_path = location + prefix + 'team_rankings.csv'
+        team_stats = pd.read_csv(team_path) if os.path.exists(team_path) else None
+        if args.archive:
+            strava_app_export.export_run(df, team_stats, challenge=challenge.name,
+                                         after=challenge.start, before=challenge.end)
+        if args.excel:
+            strava_app_export.export_excel(df, team_stats, location + prefix + 'rankings.xlsx')
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Exercise Challenge tasks")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('register', help="save a new athlete's token from their authorization code")
+    command.add_argument('user_id')
+    command.add_argument('code', help="the code= value from the athlete's exchange_token redirect URL")
+    command.add_argument('--overwrite', action='store_true', help="replace an existing token")
+    command.set_defaults(handler=register)
+
+    command = commands.add_parser('onboard', help="register every athlete in a CSV/JSONL of authorization codes")
+    command.add_argument('path', help="rows of user_id and code (or the pasted exchange_token URL)")
+    command.add_argument('--workers', type=int, default=8, help="codes exchanged at once")
+    command.add_argument('--overwrite', action='store_true', help="replace existing tokens")
+    command.add_argument('--failed', metavar='PATH', default=None, help="save the failed rows to this CSV")
+    command.set_defaults(handler=onboard)
+
+    command = commands.add_parser('refresh-tokens', help="refresh tokens expiring soon, list unusable ones")
+    command.add_argument('--horizon', type=float, default=None,
+                         help="seconds; tokens expiring sooner are refreshed (default TOKEN_REFRESH_HORIZON)")
+    command.add_argument('--workers', type=int, default=8, help="refreshes in flight at once")
+    command.set_defaults(handler=refresh_tokens)
+
+    command = commands.add_parser('sync', help="fetch new activities into the activity store, without scoring")
+    command.add_argument('users', nargs='*', help="user ids (default: everyone with a token)")
+    command.add_argument('--concurrency', type=int, default=10, help="users fetched at once")
+    command.add_argument('--full', action='store_true', help="refetch the whole challenge window")
+    command.set_defaults(handler=sync)
+
+    command = commands.add_parser('score', help="fetch, score and rank everyone (same as main.py)")
+    command.add_argument('--async', dest='use_async', action='store_true',
+                         help="fetch with the asyncio engine (requires aiohttp)")
+    command.add_argument('--concurrency', type=int, default=10, help="users fetched at once")
+    command.add_argument('--rescore', action='store_true', help="no API calls, score from the activity store")
+    command.add_argument('--processes', type=int, default=None, help="worker processes for --rescore")
+    command.add_argument('--archive', action='store_true', help="also archive to Parquet (requires pyarrow)")
+    command.add_argument('--excel', action='store_true', help="also write an Excel workbook (requires openpyxl)")
+    command.add_argument('--report', action='store_true', help="save a run report under output/run_reports/")
+    command.add_argument('--prometheus', metavar='PATH', default=None, help="also write Prometheus metrics to PATH")
+    teams_choice = command.add_mutually_exclusive_group()
+    teams_choice.add_argument('--teams', dest='with_teams', action='store_true', default=None,
+                              help="generate team stats without asking")
+    teams_choice.add_argument('--no-teams', dest='with_teams', action='store_false',
+                              help="skip team stats without asking")
+    command.set_defaults(handler=score)
+
+    command = commands.add_parser('leaderboard', help="keep the ranking CSVs live, refreshed every interval")
+    command.add_argument('users', nargs='*', help="user ids (default: everyone with a token)")
+    command.add_argument('--interval', type=float, default=3600, help="seconds between refreshes")
+    command.set_defaults(handler=leaderboard)
+
+    command = commands.add_parser('teams', help="add users with tokens to users.json, update teams.json")
+    command.add_argument('--assign', nargs='+', default=[], metavar='USER_ID=TEAM',
+                         help="move users to teams (0 = no team)")
+    command.add_argument('--name', nargs='+', default=[], metavar='USER_ID=NAME', help="set users' names")
+    command.add_argument('--rescan', action='store_true', help="list the tokens even if they look unchanged")
+    command.set_defaults(handler=teams)
+
+    command = commands.add_parser('export', help="archive/Excel the last saved rankings")
+    command.add_argument('--challenge', default=None, help="only this challenge (default: all)")
+    command.add_argument('--archive', action='store_true', help="archive to Parquet (requires pyarrow)")
+    command.add_argument('--excel', action='store_true', help="write an Excel workbook (requires openpyxl)")
+    command.set_defaults(handler=export)
+    return parser
+
+
+def run(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(run())
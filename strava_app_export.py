@@ -1,4 +1,257 @@
-from strava_app_settings import INTERMEDIATE_LOCATION
-# Module for exporting Exercise Challenge data to Google Docs or Excel
+import csv
+import math
+import os
+from datetime import datetime
 
+import strava_app_scoring as scorer
+import strava_app_store
+from strava_app_settings import ARCHIVE_LOCATION, CHALLENGE_NAME, INTERMEDIATE_LOCATION, START, END
 
+"""
+Module for exporting Exercise Challenge data:
+1) Sinks - destinations that take result rows as they are produced (write(row), close())
+   and whole DataFrames (write_frame(df)); usable as the sink of strava_app_pipeline.run
+   Used as context managers, a sink left by an exception is abort()ed: files written to a
+   temporary path (Parquet, Excel) are discarded and the previous file is kept
+    CsvSink     - plain CSV
+    ParquetSink - Parquet file in a challenge=<name>/run_date=<date> partition (requires pyarrow)
+    ExcelSink   - streaming .xlsx writer, one sheet per table (requires openpyxl)
+2) Parquet archive of every run: score snapshots, team snapshots and the raw activities
+   Read it back with load_archive(), dtypes included, eg. load_archive('scores')
+
+Archive layout (hive partitioning):
+    ARCHIVE_LOCATION/scores/challenge=Summer_2025/run_date=2025-07-01/scores-093000.parquet
+    ARCHIVE_LOCATION/teams/challenge=Summer_2025/run_date=2025-07-01/teams-093000.parquet
+    ARCHIVE_LOCATION/activities/challenge=Summer_2025/run_date=2025-07-01/activities.parquet
+Each activities partition is the whole challenge as of that day; a rerun on the same day replaces it
+"""
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:     # optional dependency, only needed for Parquet
+    pa = None
+try:
+    import openpyxl
+except ImportError:     # optional dependency, only needed for Excel
+    openpyxl = None
+
+
+def _require(module, name: str) -> None:
+    if module is None:
+        raise ImportError(f"This export requires {name}: pip install {name}")
+
+
+class Sink:
+    """Destination for result rows, written one at a time as users finish"""
+    def __init__(self, columns):
+        self.columns = list(columns)
+
+    def write(self, row: tuple) -> None:
+        raise NotImplementedError
+
+    def write_frame(self, df) -> None:
+        """Writes a DataFrame's rows (its self.columns, in order)"""
+        for row in df[self.columns].itertuples(index=False, name=None):
+            self.write(row)
+
+    def close(self) -> None:
+        pass
+
+    def abort(self) -> None:
+        """Gives up on the output after a failure; close() unless the sink can discard it"""
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class CsvSink(Sink):
+    """Rows to a CSV file with a header line"""
+    def __init__(self, path: str, columns=scorer.USER_COLUMN_NAMES):
+        super().__init__(columns)
+        self._file = open(path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def write(self, row: tuple) -> None:
+        self._writer.writerow(row)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink(Sink):
+    """
+    Rows to one Parquet file under root/dataset/challenge=<challenge>/run_date=<YYYY-MM-DD>/
+    Rows are buffered and written rows_per_group at a time; the file only appears
+    (atomically) on close()
+    """
+    def __init__(self, root: str, dataset: str, schema, challenge: str = CHALLENGE_NAME,
+                 run_at: datetime = None, filename: str = None, rows_per_group: int = 50000):
+        _require(pa, 'pyarrow')
+        super().__init__(schema.names)
+        self.schema = schema
+        self.rows_per_group = rows_per_group
+        run_at = datetime.now() if run_at is None else run_at
+        directory = os.path.join(root, dataset, f"challenge={challenge}", f"run_date={run_at:%Y-%m-%d}")
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, filename or f"{dataset}-{run_at:%H%M%S}.parquet")
+        self._tmp_path = self.path + '.tmp'
+        self._writer = pq.ParquetWriter(self._tmp_path, schema)
+        self._rows = []
+
+    def write(self, row: tuple) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.rows_per_group:
+            self._flush()
+
+    def write_rows(self, rows: list) -> None:
+        self._rows.extend(rows)
+        if len(self._rows) >= self.rows_per_group:
+            self._flush()
+
+    def write_frame(self, df) -> None:
+        self._flush()
+        self._writer.write_table(pa.Table.from_pandas(df[self.columns], schema=self.schema, preserve_index=False))
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        columns = zip(*self._rows)
+        arrays = [pa.array(values, type=field.type) for values, field in zip(columns, self.schema)]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self._rows = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Drops the partial file, leaving any earlier file at self.path in place"""
+        self._rows = []
+        self._writer.close()
+        os.remove(self._tmp_path)
+
+
+class ExcelSink(Sink):
+    """
+    Rows to an .xlsx workbook in openpyxl's write-only (streaming) mode, so rows are
+    not kept in memory; each table goes on its own sheet
+    """
+    def __init__(self, path: str, columns=scorer.USER_COLUMN_NAMES, title: str = 'User_Rankings'):
+        _require(openpyxl, 'openpyxl')
+        super().__init__(columns)
+        self.path = path
+        self._workbook = openpyxl.Workbook(write_only=True)
+        self._sheet = None
+        self.title = title
+
+    def add_sheet(self, title: str, columns) -> None:
+        """Starts a new sheet; following writes go to it"""
+        self.columns = list(columns)
+        self._sheet = self._workbook.create_sheet(title)
+        self._sheet.append(self.columns)
+
+    def write(self, row: tuple) -> None:
+        if self._sheet is None:
+            self.add_sheet(self.title, self.columns)
+        # Excel has no NaN, leave those cells empty
+        self._sheet.append([None if isinstance(value, float) and math.isnan(value) else value for value in row])
+
+    def write_frame(self, df, title: str = None) -> None:
+        """Writes a DataFrame, on a new sheet if title is given"""
+        if title is not None:
+            self.add_sheet(title, df.columns)
+        super().write_frame(df)
+
+    def close(self) -> None:
+        if self._sheet is None:
+            self.add_sheet(self.title, self.columns)
+        tmp_path = self.path + '.tmp'
+        self._workbook.save(tmp_path)
+        os.replace(tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Nothing is on disk until close(), so the workbook is just dropped"""
+        self._workbook = None
+
+
+## Parquet schemas
+def score_schema():
+    """Schema of the rankings DataFrame (scorer.USER_COLUMNS), fixed so every snapshot matches"""
+    _require(pa, 'pyarrow')
+    float_points = set(scorer._float_fields(scorer.UserPoints)) | {'total_points'}
+
+    def column_type(source, value):
+        if source == 'user':
+            return pa.string()
+        if source == 'const':
+            return pa.int64() if isinstance(value, int) else pa.string()
+        if source == 'stats' or value in float_points:
+            return pa.float64()
+        return pa.int64()
+
+    return pa.schema([(column, column_type(source, value)) for column, source, value in scorer.USER_COLUMNS])
+
+
+def team_schema():
+    """Schema of strava_app_team.calculate_team_statistics output"""
+    _require(pa, 'pyarrow')
+    return pa.schema([('Team', pa.int64()), ('Name', pa.string()), ('MemberCount', pa.int64()),
+                      ('ALL_Ave_Rank', pa.float64()), ('XC_Ave_Rank', pa.float64()),
+                      ('Min_Team_Size', pa.int64())])
+
+
+def activity_schema():
+    """Schema of the archived raw activities (strava_app_store.iter_activity_rows)"""
+    _require(pa, 'pyarrow')
+    return pa.schema([('user_id', pa.string()), ('activity_id', pa.int64()),
+                      ('start_date', pa.timestamp('s', tz='UTC')), ('sport_type', pa.string()),
+                      ('distance', pa.float64()), ('moving_time', pa.int64()),
+                      ('payload', pa.string())])    # activity JSON as returned by Strava
+
+
+## Exports
+def export_run(df, team_stats=None, challenge: str = CHALLENGE_NAME, root: str = ARCHIVE_LOCATION,
+               run_at: datetime = None, activities: bool = True, after: int = START, before: int = END) -> None:
+    """
+    Archives one run to Parquet: the rankings snapshot, the team snapshot (if given)
+    and the raw activities in the challenge window (after..before) from the activity store
+    """
+    run_at = datetime.now() if run_at is None else run_at
+    with ParquetSink(root, 'scores', score_schema(), challenge, run_at) as sink:
+        sink.write_frame(df)
+    if team_stats is not None:
+        with ParquetSink(root, 'teams', team_schema(), challenge, run_at) as sink:
+            sink.write_frame(team_stats)
+    if activities:
+        with ParquetSink(root, 'activities', activity_schema(), challenge, run_at,
+                         filename='activities.parquet') as sink:
+            for rows in strava_app_store.iter_activity_rows(after, before):
+                sink.write_rows(rows)
+
+
+def export_excel(df, team_stats=None, path: str = INTERMEDIATE_LOCATION + 'rankings.xlsx') -> None:
+    """Writes the rankings (and team rankings, if given) to an .xlsx workbook for organisers"""
+    with ExcelSink(path) as sink:
+        sink.write_frame(df, 'User_Rankings')
+        if team_stats is not None:
+            sink.write_frame(team_stats, 'Team_Rankings')
+
+
+def load_archive(dataset: str, challenge: str = None, root: str = ARCHIVE_LOCATION):
+    """
+    Reads an archived dataset ('scores', 'teams' or 'activities') into a DataFrame,
+    with challenge and run_date columns from the partitions
+    """
+    _require(pa, 'pyarrow')
+    filters = [('challenge', '=', challenge)] if challenge is not None else None
+    return pq.read_table(os.path.join(root, dataset), filters=filters).to_pandas()
@@ -1,6 +1,30 @@
 
+import bisect
+import itertools
+import json
+import os
+import tempfile
+from enum import Enum
+
+import strava_app_settings
+
 # Misc helper functions
 
+
+def write_json_atomic(path: str, data, **dump_kwargs) -> None:
+    """Writes data as JSON to a temp file next to path, then renames it over path.
+    Readers see either the old or the new file, never a partial one."""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as outfile:
+            json.dump(data, outfile, **dump_kwargs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 # BONUS info
 points_ECM = [50, 50, 100, 100, 100, 200, 400]  # pts
 values_ECM = [25, 50, 100, 200, 300, 500, 1000] # miles
@@ -26,40 +50,75 @@ values_ROW = [7500, 15000, 30000, 60000, 100000, 140000, 180000, 250000] # meter
 points_HIIT = [10, 25, 25, 50, 50, 75, 100, 165]
 values_HIIT = [15, 30, 45, 75, 100, 150, 200, 300]
 
-class BonusType(enumerate):
-    ECM     = 0,
-    RUN     = 1, 
-    WALK    = 2,
-    BIKE    = 3,
-    SWIM    = 4,
-    LIFT    = 5,
-    ROW     = 6,
+class BonusType(Enum):
+    ECM     = 0
+    RUN     = 1
+    WALK    = 2
+    BIKE    = 3
+    SWIM    = 4
+    LIFT    = 5
+    ROW     = 6
     HIIT    = 7
 
 
-def _calc_bonus(pts_arr: list[int], values_arr: list[int], value):
-    """Cumulative sum while value < values_arr[x]"""
-    return sum([pt for pt,val in zip(pts_arr, values_arr) if val <= value])
-
-
-def GetBonus(type: BonusType, value: float) -> int:
-    match type:
-        case BonusType.ECM:
-            total = _calc_bonus(points_ECM, values_ECM, value)
-        case BonusType.RUN:
-            total = _calc_bonus(points_RUN, values_RUN, value)
-        case BonusType.WALK:
-            total = _calc_bonus(points_WALK, values_WALK, value)
-        case BonusType.BIKE:
-            total = _calc_bonus(points_BIKE, values_BIKE, value)
-        case BonusType.SWIM:
-            total = _calc_bonus(points_SWIM, values_SWIM, value)
-        case BonusType.LIFT:
-            total = _calc_bonus(points_LIFT, values_LIFT, value)
-        case BonusType.ROW:
-            total = _calc_bonus(points_ROW, values_ROW, value)
-        case BonusType.HIIT:
-            total = _calc_bonus(points_HIIT, values_HIIT, value)
-        case _:
-            total = 0
-    return total
\ No newline at end of file
+class BonusTable:
+    """Bonus tier table compiled once into sorted thresholds and cumulative points.
+    A value earns every tier whose threshold is <= value."""
+    __slots__ = ('thresholds', 'cumulative', '_arrays')
+
+    def __init__(self, points: list[int], values: list[float]):
+        tiers = sorted(zip(values, points))
+        self.thresholds = [value for value, _ in tiers]
+        # cumulative[i] = points for clearing the i lowest thresholds
+        self.cumulative = list(itertools.accumulate((pts for _, pts in tiers), initial=0))
+        self._arrays = None
+
+    def __call__(self, value: float) -> int:
+        """Scalar O(log n) lookup"""
+        return self.cumulative[bisect.bisect_right(self.thresholds, value)]
+
+    def score(self, values):
+        """Vectorized lookup over a whole column of values (np.searchsorted)"""
+        import numpy as np
+        if self._arrays is None:
+            self._arrays = (np.asarray(self.thresholds, dtype=np.float64),
+                            np.asarray(self.cumulative, dtype=np.int64))
+        thresholds, cumulative = self._arrays
+        return cumulative[np.searchsorted(thresholds, values, side='right')]
+
+    def to_dict(self) -> dict:
+        points = [b - a for a, b in zip(self.cumulative, self.cumulative[1:])]
+        return {'points': points, 'values': list(self.thresholds)}
+
+
+def parse_bonus_tables(config: dict) -> dict:
+    """Compiles tier tables from {"RUN": {"points": [...], "values": [...]}, ...}.
+    Types left out of config are not returned."""
+    return {BonusType[name.upper()]: BonusTable(table['points'], table['values'])
+            for name, table in config.items()}
+
+
+def load_bonus_tables(path: str) -> dict:
+    """Loads tier tables from a JSON file in parse_bonus_tables() format."""
+    with open(path) as f:
+        return parse_bonus_tables(json.load(f))
+
+
+BONUS_TABLES = {
+    BonusType.ECM:  BonusTable(points_ECM,  values_ECM),
+    BonusType.RUN:  BonusTable(points_RUN,  values_RUN),
+    BonusType.WALK: BonusTable(points_WALK, values_WALK),
+    BonusType.BIKE: BonusTable(points_BIKE, values_BIKE),
+    BonusType.SWIM: BonusTable(points_SWIM, values_SWIM),
+    BonusType.LIFT: BonusTable(points_LIFT, values_LIFT),
+    BonusType.ROW:  BonusTable(points_ROW,  values_ROW),
+    BonusType.HIIT: BonusTable(points_HIIT, values_HIIT),
+}
+# A season's tables can replace the defaults above without code edits
+if strava_app_settings.BONUS_TABLE_FILE:
+    BONUS_TABLES.update(load_bonus_tables(strava_app_settings.BONUS_TABLE_FILE))
+
+
+def GetBonus(type: BonusType, value: float, tables: dict = None) -> int:
+    table = (BONUS_TABLES if tables is None else tables).get(type)
+    return table(value) if table else 0
@@ -0,0 +1,287 @@
+import bisect
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import strava_app_api
+import strava_app_scoring as scorer
+import strava_app_store
+import strava_app_team as teams
+
+"""
+Module for:
+1) Incremental leaderboard - keeps every user's stat accumulators in memory and
+   applies newly synced activities as deltas, re-scoring only the users that changed
+2) Individual Rank and team XC_Ave_Rank maintained with an order-statistics list
+   (sorted keys + bisect) instead of re-sorting everyone on each refresh
+
+Results match main.py's full rebuild except that tied users are ordered by user id
+Late uploads (older than a user's newest stored activity) rebuild that user from the
+store, so float totals keep the store's summation order
+Each board scores one challenge; serve() keeps a board per configured challenge
+(scorer.CHALLENGES) live from a single sync
+"""
+
+
+class Leaderboard:
+    """Live individual and team rankings of one challenge, updated from activity deltas"""
+    def __init__(self, user_data: list = None, team_data: list = None, challenge: scorer.Challenge = None):
+        self.challenge = scorer.DEFAULT_CHALLENGE if challenge is None else challenge
+        self.users = {}         # user_id -> UserEC (the stat accumulators)
+        self._order = []        # sorted (-total_points, user_id); index 0 is rank 1
+        self._keys = {}         # user_id -> its key in _order
+        self._team_keys = {}    # team -> sorted keys of its ranked members
+        self._team_ranks = {}   # team -> (ALL_Ave_Rank, XC_Ave_Rank) cache
+        self.set_roster(teams.load_user_data() if user_data is None else user_data,
+                        teams.generate_team_data() if team_data is None else team_data)
+
+    def set_roster(self, user_data: list, team_data: list) -> None:
+        """Takes new users.json/teams.json contents (eg. after team moves) and regroups the ranked users"""
+        self.user_data = user_data
+        self.team_of = {user['user_id']: user.get('team', 0) for user in user_data}
+        self.team_data = team_data
+        self.min_members = min((len(team['members']) for team in team_data), default=0)
+        self._group_teams()
+
+    def _group_teams(self) -> None:
+        self._team_keys = {}
+        for key in self._order:
+            self._team_keys.setdefault(self.team_of.get(key[1], 0), []).append(key)
+        self._team_ranks = {}
+        self._dirty = {team['team'] for team in self.team_data}
+
+    # Building
+    def build(self, user_ids: list) -> None:
+        """Scores users from the activity store and ranks them with a single sort"""
+        for user_id in user_ids:
+            user = scorer.UserEC(user_id, self.challenge)
+            if user.add_activities(self.load_activities(user_id)):
+                user.calculate_points()
+                self.users[user_id] = user
+                self._keys[user_id] = (-user.points.total_points, user_id)
+        self._order = sorted(self._keys.values())
+        self._group_teams()
+
+    def load_activities(self, user_id: str) -> list:
+        """The user's stored activities in this board's challenge window"""
+        return strava_app_store.load_activities(user_id, self.challenge.start, self.challenge.end)
+
+    def in_window(self, activity: dict) -> bool:
+        return self.challenge.start < strava_app_api.activity_timestamp(activity) < self.challenge.end
+
+    # Updating
+    def apply(self, user_id: str, activities: list) -> bool:
+        """
+        Adds newly synced activities to a user's accumulators and re-ranks them
+        Returns True if the user's score was updated
+        """
+        user = self.users.get(user_id) or scorer.UserEC(user_id, self.challenge)
+        if not user.add_activities(activities):
+            return False
+        self.users[user_id] = user
+        self._rescore(user)
+        return True
+
+    def replace(self, user_id: str, activities: list) -> None:
+        """Rebuilds one user from all their activities (after edits or deletions)"""
+        user = scorer.UserEC(user_id, self.challenge)
+        if user.add_activities(activities):
+            self.users[user_id] = user
+            self._rescore(user)
+        else:
+            self.remove(user_id)
+
+    def remove(self, user_id: str) -> None:
+        """Drops a user from the rankings"""
+        self.users.pop(user_id, None)
+        key = self._keys.pop(user_id, None)
+        if key is None:
+            return
+        index = bisect.bisect_left(self._order, key)
+        del self._order[index]
+        self._team_remove(key)
+        # Their own team loses a member; only the teams of users ranked below them shift
+        self._dirty.add(self.team_of.get(user_id, 0))
+        self._mark_shifted(index, len(self._order))
+
+    def _rescore(self, user) -> None:
+        user.points = scorer.UserPoints()
+        user.calculate_points()
+        self._reposition(user.user_id, (-user.points.total_points, user.user_id))
+
+    def _reposition(self, user_id: str, key: tuple) -> None:
+        """Moves a user to their new place; only ranks between old and new place shift"""
+        old_key = self._keys.get(user_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            old_index = bisect.bisect_left(self._order, old_key)
+            del self._order[old_index]
+            self._team_remove(old_key)
+        index = bisect.bisect_left(self._order, key)
+        self._order.insert(index, key)
+        bisect.insort(self._team_keys.setdefault(self.team_of.get(user_id, 0), []), key)
+        self._keys[user_id] = key
+        if old_key is None:
+            self._mark_shifted(index, len(self._order))
+        else:
+            self._mark_shifted(min(index, old_index), max(index, old_index) + 1)
+
+    def _team_remove(self, key: tuple) -> None:
+        members = self._team_keys[self.team_of.get(key[1], 0)]
+        del members[bisect.bisect_left(members, key)]
+
+    def _mark_shifted(self, start: int, stop: int) -> None:
+        for _, user_id in self._order[start:stop]:
+            self._dirty.add(self.team_of.get(user_id, 0))
+
+    # Queries
+    def rank(self, user_id: str) -> int:
+        """1-based individual rank, None if the user is not ranked"""
+        key = self._keys.get(user_id)
+        return None if key is None else bisect.bisect_left(self._order, key) + 1
+
+    def refresh(self, user_ids: list = None, max_workers: int = 10) -> list:
+        """
+        Syncs users' new activities and applies them as deltas
+        Returns ids of users whose score was updated
+        """
+        user_ids = strava_app_api.get_token_list() if user_ids is None else user_ids
+        return self.apply_plans(sync(user_ids, self.challenge.start, self.challenge.end, max_workers))
+
+    def apply_plans(self, plans: list) -> list:
+        """
+        Applies the committed SyncPlans of sync() to the board
+        Returns ids of users whose score was updated
+        """
+        updated = []
+        for plan in plans:
+            user_id = plan.user_id
+            late = plan.state and any(strava_app_api.activity_timestamp(a) < plan.state[1]
+                                      for a in plan.new_activities)
+            if plan.changed or late:
+                self.replace(user_id, self.load_activities(user_id))
+                updated.append(user_id)
+            elif self.apply(user_id, [a for a in plan.new_activities if self.in_window(a)]):
+                updated.append(user_id)
+        return updated
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Individual rankings, same layout as main.py's user_rankings.csv"""
+        df = scorer.create_dataframe_from_users([self.users[user_id] for _, user_id in self._order])
+        df['Rank'] = df.index + 1
+        return teams.assign_user_data(df, self.user_data)
+
+    def team_stats(self) -> pd.DataFrame:
+        """Team statistics, same layout as strava_app_team.calculate_team_statistics"""
+        for team in self._dirty:
+            ranks = [bisect.bisect_left(self._order, key) + 1 for key in self._team_keys.get(team, [])]
+            top = ranks[:self.min_members]
+            self._team_ranks[team] = (sum(ranks) / len(ranks) if ranks else math.nan,
+                                      sum(top) / len(top) if top else math.nan)
+        self._dirty = set()
+
+        team_ids = [team['team'] for team in self.team_data]
+        team_stats = pd.DataFrame({
+            'Team': team_ids,
+            'Name': [team['name'] for team in self.team_data],
+            'MemberCount': [len(team['members']) for team in self.team_data],
+            'ALL_Ave_Rank': [self._team_ranks[team][0] for team in team_ids],
+            'XC_Ave_Rank': [self._team_ranks[team][1] for team in team_ids],
+            'Min_Team_Size': self.min_members,
+        })
+        return team_stats.sort_values('XC_Ave_Rank').reset_index(drop=True)
+
+
+def sync(user_ids: list, after: int, before: int, max_workers: int = 10) -> list:
+    """
+    Syncs users' new activities in the after..before window into the activity store
+    Returns the committed SyncPlans of the users that synced, in user_ids order
+    """
+    def sync_user(user_id):
+        plan = strava_app_store.SyncPlan(user_id, after, before)
+        try:
+            plan.commit(list(strava_app_api.iter_user_activities(
+                user_id, after=plan.fetch_after, before=before, priority=plan.priority)))
+        except strava_app_api.StravaAPIError as e:
+            print(e)
+            return None
+        return plan
+
+    if not user_ids:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(user_ids)))) as executor:
+        return [plan for plan in executor.map(sync_user, user_ids) if plan is not None]
+
+
+def load_boards(user_ids: list = None, challenges: list = None) -> list:
+    """A Leaderboard per challenge (default scorer.CHALLENGES), built from the activity store"""
+    user_ids = strava_app_api.get_token_list() if user_ids is None else user_ids
+    challenges = scorer.CHALLENGES if challenges is None else challenges
+    boards = []
+    for challenge in challenges:
+        board = Leaderboard(challenge=challenge)
+        board.build(user_ids)
+        boards.append(board)
+    return boards
+
+
+def save_rankings(board: Leaderboard) -> None:
+    """Writes the board's user_rankings.csv and team_rankings.csv (prefixed with the
+    challenge name when several challenges are configured, like main.py)"""
+    prefix = f"{board.challenge.name}_" if len(scorer.CHALLENGES) > 1 else ""
+    board.to_dataframe().to_csv(teams.INTERMEDIATE_LOCATION + prefix + 'user_rankings.csv', index=False)
+    teams.save(board.team_stats(), prefix + "team_rankings.csv")
+
+
+def refresh_boards(boards: list, known: set, user_ids: list = None) -> dict:
+    """
+    One serve() round: rereads the token list (unless user_ids is given) and the roster
+    (users.json/teams.json, updated from the tokens like main.py does), syncs every user once
+    over the union of the boards' windows and applies the result to each board
+    Users seen for the first time are ranked from the store; users whose token is gone are dropped
+    @param known set of the user ids the boards were built or refreshed with, updated in place
+    @return {challenge name: ids of users whose score was updated}
+    """
+    user_ids = strava_app_api.get_token_list() if user_ids is None else user_ids
+    teams.generate_user_data()
+    team_data = teams.generate_team_data()
+    user_data = teams.load_user_data()
+    added = [user_id for user_id in user_ids if user_id not in known]
+    removed = known.difference(user_ids)
+
+    plans = sync(user_ids, *scorer.union_window([board.challenge for board in boards]))
+    updated = {}
+    for board in boards:
+        if board.user_data != user_data or board.team_data != team_data:
+            board.set_roster(user_data, team_data)
+        updated[board.challenge.name] = board.apply_plans(plans)
+        for user_id in added:
+            if user_id not in board.users:
+                board.replace(user_id, board.load_activities(user_id))
+        for user_id in removed:
+            board.remove(user_id)
+    known.clear()
+    known.update(user_ids)
+    return updated
+
+
+def serve(interval: float = 3600, user_ids: list = None, challenges: list = None) -> None:
+    """
+    Keeps a leaderboard per challenge (default scorer.CHALLENGES) live: builds them once
+    from the store, then every interval seconds picks up new tokens and roster changes,
+    syncs new activities once over the union of the challenge windows, applies the deltas
+    and rewrites the ranking CSVs
+    @param user_ids list of users to follow, default everyone with a token (reread each round)
+    """
+    initial = strava_app_api.get_token_list() if user_ids is None else user_ids
+    boards = load_boards(initial, challenges)
+    known = set(initial)
+    while True:
+        for name, updated in refresh_boards(boards, known, user_ids).items():
+            print(f"Leaderboard {name} refreshed: {len(updated)} users changed")
+        for board in boards:
+            save_rankings(board)
+        time.sleep(interval)
@@ -0,0 +1,264 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime
+
+from strava_app_helpers import write_json_atomic
+from strava_app_settings import INTERMEDIATE_LOCATION
+
+"""
+Module for:
+1) Run instrumentation - where a run's time went and how much API quota it used
+    span(stage)           - wall time per stage (token refresh, HTTP, JSON decode, scoring, team merge)
+    observe(name, value)  - histograms, eg. per-user fetch latency
+    incr(name)            - counters, eg. retries and HTTP 429s
+    set_gauge(name, value)- last value, eg. Strava quota usage
+2) Run report - everything above as JSON under INTERMEDIATE_LOCATION, and optionally
+   in Prometheus text exposition format (for a node_exporter textfile collector)
+
+Disabled by default: every call returns straight away (span() hands back a shared
+no-op context manager), so instrumented code costs one flag check per call
+Spans of concurrent threads overlap, so a stage's total can exceed the run's wall time
+
+Example:
+    strava_app_metrics.enable()
+    with strava_app_metrics.span('scoring'):
+        ...
+    strava_app_metrics.write_report()
+"""
+
+enabled = False
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)   # seconds
+PROMETHEUS_PREFIX = 'strava_app_'
+
+_lock = threading.Lock()
+_NO_SPAN = nullcontext()
+_started = None     # (epoch seconds, perf_counter) of enable()/reset()
+_spans = {}         # stage -> [count, total seconds, max seconds]
+_counters = {}      # (name, labels) -> value
+_gauges = {}        # (name, labels) -> value
+_histograms = {}    # (name, labels) -> Histogram
+
+
+class Histogram:
+    """Fixed-bucket histogram; counts[i] is the number of values <= buckets[i] (the last slot is +Inf)"""
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf if it is past the last bucket)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class _Span:
+    __slots__ = ('stage', 'started')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.started
+        with _lock:
+            entry = _spans.setdefault(self.stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+
+def enable(on: bool = True) -> None:
+    """Turns collection on (or off) and starts a fresh run"""
+    global enabled
+    enabled = on
+    reset()
+
+
+def reset() -> None:
+    global _started
+    with _lock:
+        _started = (time.time(), time.perf_counter())
+        _spans.clear()
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+
+
+def span(stage: str):
+    """Context manager adding the time spent inside it to stage"""
+    if not enabled:
+        return _NO_SPAN
+    return _Span(stage)
+
+
+def incr(name: str, value: float = 1, **labels) -> None:
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    if not enabled:
+        return
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+def observe(name: str, value: float, buckets=DEFAULT_BUCKETS, **labels) -> None:
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(buckets)
+        histogram.observe(value)
+
+
+def record_request(method: str, status, seconds: float, attempt: int) -> None:
+    """Accounts one Strava HTTP attempt; status is None when no response arrived"""
+    if not enabled:
+        return
+    incr('http_requests', method=method, status='error' if status is None else str(status))
+    observe('http_request_seconds', seconds, method=method)
+    if attempt:
+        incr('http_retries')
+    if status == 429:
+        incr('http_429')
+
+
+def record_quota(short_usage: int, short_limit: int, daily_usage: int, daily_limit: int) -> None:
+    """Latest Strava rate-limit usage, from the X-RateLimit headers"""
+    if not enabled:
+        return
+    set_gauge('quota_usage', short_usage, window='15min')
+    set_gauge('quota_limit', short_limit, window='15min')
+    set_gauge('quota_usage', daily_usage, window='daily')
+    set_gauge('quota_limit', daily_limit, window='daily')
+
+
+def _key_name(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}={v}' for k, v in labels) + '}'
+
+
+def report() -> dict:
+    """The run so far as a JSON-serialisable dict, times in seconds"""
+    with _lock:
+        started_at, started = _started or (time.time(), time.perf_counter())
+        return {
+            'started': datetime.fromtimestamp(started_at).isoformat(timespec='seconds'),
+            'duration': time.perf_counter() - started,
+            'stages': {stage: {'count': count, 'total': total, 'mean': total / count, 'max': worst}
+                       for stage, (count, total, worst) in _spans.items()},
+            'counters': {_key_name(*key): value for key, value in _counters.items()},
+            'gauges': {_key_name(*key): value for key, value in _gauges.items()},
+            'histograms': {_key_name(*key): {
+                'count': h.count, 'sum': h.sum,
+                'mean': h.sum / h.count if h.count else 0.0,
+                'p50': h.quantile(0.5), 'p95': h.quantile(0.95),
+                'buckets': {str(bound): count for bound, count in zip(h.buckets + (float('inf'),), h.counts)},
+            } for key, h in _histograms.items()},
+        }
+
+
+def _prometheus_labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def prometheus_text() -> str:
+    """The run so far in Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        if _spans:
+            name = PROMETHEUS_PREFIX + 'stage_seconds_total'
+            lines.append(f'# TYPE {name} counter')
+            lines += [f'{name}{{stage="{stage}"}} {total}' for stage, (_, total, _) in _spans.items()]
+            name = PROMETHEUS_PREFIX + 'stage_calls_total'
+            lines.append(f'# TYPE {name} counter')
+            lines += [f'{name}{{stage="{stage}"}} {count}' for stage, (count, _, _) in _spans.items()]
+
+        for metrics, kind, suffix in ((_counters, 'counter', '_total'), (_gauges, 'gauge', '')):
+            typed = set()
+            for (metric, labels), value in sorted(metrics.items()):
+                name = PROMETHEUS_PREFIX + metric + suffix
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name}{_prometheus_labels(labels)} {value}')
+
+        typed = set()
+        for (metric, labels), h in sorted(_histograms.items(), key=lambda item: item[0]):
+            name = PROMETHEUS_PREFIX + metric
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(h.buckets + (float('inf'),), h.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else bound
+                lines.append(f'{name}_bucket{_prometheus_labels(labels, le=le)} {cumulative}')
+            lines.append(f'{name}_sum{_prometheus_labels(labels)} {h.sum}')
+            lines.append(f'{name}_count{_prometheus_labels(labels)} {h.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(path: str = None, prometheus_path: str = None) -> str:
+    """
+    Saves the run report as JSON, by default to INTERMEDIATE_LOCATION/run_reports/run-<start>.json,
+    and the Prometheus text too if prometheus_path is given
+    Returns the JSON report's path
+    """
+    data = report()
+    if path is None:
+        directory = INTERMEDIATE_LOCATION + 'run_reports/'
+        os.makedirs(directory, exist_ok=True)
+        path = directory + f"run-{data['started'].replace(':', '')}.json"
+    write_json_atomic(path, data)
+    if prometheus_path is not None:
+        tmp_path = prometheus_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(prometheus_text())
+        os.replace(tmp_path, prometheus_path)
+    return path
+
+
+def summary() -> str:
+    """Short human-readable version of the report, one stage per line"""
+    data = report()
+    lines = [f"Run took {data['duration']:.1f}s"]
+    for stage, entry in sorted(data['stages'].items(), key=lambda item: -item[1]['total']):
+        lines.append(f"  {stage:<16} {entry['total']:8.2f}s over {entry['count']} calls (max {entry['max']:.2f}s)")
+    counters = data['counters']
+    requests = sum(value for name, value in counters.items() if name.startswith('http_requests'))
+    lines.append(f"  HTTP requests: {requests}, retries: {counters.get('http_retries', 0)}, "
+                 f"429s: {counters.get('http_429', 0)}")
+    return '\n'.join(lines)
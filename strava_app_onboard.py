@@ -0,0 +1,185 @@
+import csv
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+import strava_app_api
+
+"""
+Module for:
+1) Bulk athlete onboarding - exchanges a whole sign-up list of authorization codes at once
+    read_signups(path)  - CSV or JSONL of (user_id, code or the full exchange_token redirect URL)
+    onboard(signups)    - exchanges the codes concurrently under the shared rate limit,
+                          then saves every new token together (one transaction in the vault)
+   Codes expire within minutes and are single use, so failures are reported per row
+   (invalid/used code, no activity access, code belonging to another athlete, ...)
+   A code is spent once exchanged, so its token is kept whenever it can be: a code that
+   belongs to another athlete than the row's user_id is saved under that athlete's id
+
+Sign-up file formats (user_id may be left out, it is then taken from the token's athlete):
+    CSV    user_id,code                 (header optional; 'url' works as a column name too)
+           12345,http://localhost/exchange_token?state=&code=82f80d...&scope=read,activity:read_all
+    JSONL  {"user_id": "12345", "code": "82f80d..."} or {"url": "http://localhost/exchange_token?..."}
+
+Example:
+    python strava_app_cli.py onboard signups.csv --failed failed.csv
+"""
+
+_CODE = re.compile(r'(?:^|[?&])code=([^&#\s]+)')
+_SCOPE = re.compile(r'(?:^|[?&])scope=([^&#\s]*)')
+_CODE_COLUMNS = ('code', 'url', 'redirect_url')
+
+
+def parse_code(text: str):
+    """
+    (code, scope) from a pasted exchange_token URL (scope None if the URL has none),
+    or (text, None) if text is already a bare code
+    """
+    text = text.strip()
+    code = _CODE.search(text)
+    if code is None:
+        return text, None
+    scope = _SCOPE.search(text)
+    return unquote(code.group(1)), unquote(scope.group(1)) if scope else None
+
+
+def _signup(line: int, user_id, value) -> dict:
+    code, scope = parse_code(str(value or ''))
+    user_id = str(user_id).strip() if user_id not in (None, '') else None
+    return {'line': line, 'user_id': user_id, 'code': code, 'scope': scope}
+
+
+def read_signups(path: str) -> list:
+    """
+    Reads a CSV or JSONL (by extension .jsonl/.json) sign-up list
+    Returns [{'line', 'user_id' (None if not given), 'code', 'scope'}] in file order
+    """
+    signups = []
+    with open(path, newline='') as f:
+        if path.endswith(('.jsonl', '.json')):
+            for line, text in enumerate(f, 1):
+                if text.strip():
+                    row = json.loads(text)
+                    value = next((row[column] for column in _CODE_COLUMNS if row.get(column)), None)
+                    signups.append(_signup(line, row.get('user_id', row.get('id')), value))
+            return signups
+
+        rows = [row for row in csv.reader(f)]
+        header = [cell.strip().lower() for cell in rows[0]] if rows else []
+        if any(column in header for column in _CODE_COLUMNS):
+            user_column = next((header.index(c) for c in ('user_id', 'id') if c in header), None)
+            code_column = next(header.index(c) for c in _CODE_COLUMNS if c in header)
+            last = code_column == len(header) - 1
+            start, rows = 2, rows[1:]
+        else:
+            user_column, code_column, last, start = 0, 1, True, 1
+        for line, row in enumerate(rows, start):
+            if not any(cell.strip() for cell in row):
+                continue
+            if len(row) == 1:   # just the code/URL
+                signups.append(_signup(line, None, row[0]))
+                continue
+            user_id = row[user_column] if user_column is not None else None
+            value = row[code_column] if code_column < len(row) else ''
+            if last and 'scope=' in value:
+                # Pasted URLs are rarely quoted, so scope=read,activity:read_all spills into more cells
+                value = ','.join(row[code_column:])
+            signups.append(_signup(line, user_id, value))
+    return signups
+
+
+def _precheck(signup: dict, seen_codes: set, overwrite: bool):
+    """Reason not to exchange this sign-up's code, None to go ahead"""
+    if not signup['code']:
+        return "no code"
+    if signup['code'] in seen_codes:
+        return "duplicate code (already listed above)"
+    if signup['scope'] is not None and 'activity:read' not in signup['scope']:
+        return f"athlete did not allow activity access (scope={signup['scope']}), ask them to sign up again"
+    if not overwrite and signup['user_id'] and strava_app_api.get_user_path(signup['user_id']):
+        return "existing"
+    return None
+
+
+def onboard(signups: list, max_workers: int = 8, overwrite: bool = False) -> dict:
+    """
+    Exchanges every sign-up's code concurrently and saves the new tokens together
+    @param signups list of read_signups() dicts
+    @param max_workers int code exchanges in flight at once (all share strava_app_api.scheduler)
+    @param overwrite bool True to replace users' existing tokens
+    @return dict with
+        'registered': ids whose token was saved
+        'existing':   ids that already had a token (their new token is not saved)
+        'failed':     [(sign-up dict, reason)] in file order; a code of another athlete is
+                      listed here even when its token was saved under their id
+    """
+    report = {'registered': [], 'existing': [], 'failed': []}
+    pending = []
+    seen_codes = set()
+    for signup in signups:
+        reason = _precheck(signup, seen_codes, overwrite)
+        seen_codes.add(signup['code'])
+        if reason == "existing":
+            report['existing'].append(signup['user_id'])
+        elif reason:
+            report['failed'].append((signup, reason))
+        else:
+            pending.append(signup)
+
+    def exchange(signup):
+        try:
+            return strava_app_api.exchange_code(signup['code'])
+        except strava_app_api.StravaAPIError as e:
+            return None, str(e)
+        except Exception as e:
+            # eg. the connection dropped mid-response: the code may be spent, keep the other rows going
+            return None, f"exchange failed ({type(e).__name__}: {e})"
+
+    tokens = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending) or 1))) as executor:
+            for signup, (token, error) in zip(pending, executor.map(exchange, pending)):
+                athlete_id = str(token.get('athlete', {}).get('id', '')) if token else ''
+                user_id = signup['user_id'] or athlete_id
+                if token is None:
+                    report['failed'].append((signup, error))
+                    continue
+                if not user_id:
+                    report['failed'].append((signup, "no user_id given and the token names no athlete"))
+                    continue
+
+                # The token belongs to the athlete, whatever the row says; the existing-token
+                # check is repeated now that their id is known (rows without a user_id skip _precheck's)
+                owner = athlete_id or user_id
+                if owner in tokens:
+                    reason = f"duplicate sign-up, athlete {owner} is already listed above"
+                elif not overwrite and strava_app_api.get_user_path(owner):
+                    reason = "existing"
+                else:
+                    tokens[owner] = token
+                    reason = None
+
+                if owner != user_id:
+                    outcome = {None: f"token saved under {owner}",
+                               "existing": f"athlete {owner} already has a token"}.get(reason, reason)
+                    report['failed'].append((signup, f"code belongs to athlete {owner}, not {user_id} ({outcome})"))
+                elif reason == "existing":
+                    report['existing'].append(owner)
+                elif reason:
+                    report['failed'].append((signup, reason))
+    finally:
+        # Exchanged codes are spent, so their tokens are saved even if a later row blows up
+        strava_app_api.write_user_tokens(tokens)
+    report['registered'] = list(tokens)
+    report['failed'].sort(key=lambda failure: failure[0]['line'])
+    return report
+
+
+def write_failures(path: str, failures: list) -> None:
+    """Saves onboard()'s failures as CSV (line, user_id, code, reason), eg. to follow up by email"""
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['line', 'user_id', 'code', 'reason'])
+        for signup, reason in failures:
+            writer.writerow([signup['line'], signup['user_id'] or '', signup['code'], reason])
@@ -0,0 +1,130 @@
+import queue
+import threading
+import time
+
+import strava_app_metrics as metrics
+import strava_app_scoring as scorer
+import strava_app_store
+
+"""
+Module for:
+1) Streaming fetch -> score -> sink pipeline, the thread pool path of main.py
+    fetch stage  - `concurrency` threads sync users into the activity store, a page at a time
+    score stage  - streams each synced user's stored activities into a UserEC in chunks
+    sink         - receives one compact DataFrame row per finished user
+   Stages are joined by bounded queues, so raw activity dicts are dropped as soon as
+   they are accumulated and peak memory depends on concurrency, not on the number of users
+
+Rows match scorer.user_row() for the UserEC that UserEC(user_id).calculate_points() would produce
+Several challenges can share one run: activities are fetched once over the union of
+their windows and every user is scored against each challenge (run_challenges)
+"""
+
+_DONE = object()    # end-of-stream marker passed between stages
+
+
+class RowCollector:
+    """Sink that keeps every finished user's row, for building the rankings DataFrame"""
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row: tuple) -> None:
+        self.rows.append(row)
+
+    def close(self) -> None:
+        pass
+
+    def dataframe(self):
+        return scorer.create_dataframe_from_rows(self.rows)
+
+
+def score_user(user_id: str, challenge: scorer.Challenge = None):
+    """
+    Scores a user from the activity store, one chunk of activities at a time
+    Returns the UserEC object, None if the user has no activities
+    """
+    challenge = scorer.DEFAULT_CHALLENGE if challenge is None else challenge
+    return scorer.score_user_challenges(user_id, [challenge])[0]
+
+
+def run(user_ids: list, concurrency: int = 10, sink=None, challenge: scorer.Challenge = None):
+    """
+    Fetches and scores every user through the pipeline, writing rows to sink as users finish
+    @param user_ids list of user ids, fetched in this order
+    @param concurrency int users fetched at once
+    @param sink object with write(row) and close(), defaults to a RowCollector
+    @param challenge Challenge to score, defaults to the one in settings
+    @return the sink
+    """
+    challenge = scorer.DEFAULT_CHALLENGE if challenge is None else challenge
+    return run_challenges(user_ids, [challenge], concurrency, [sink])[0]
+
+
+def run_challenges(user_ids: list, challenges: list, concurrency: int = 10, sinks: list = None) -> list:
+    """
+    run() for several challenges at once: each user is fetched once over the union of the
+    challenge windows, then scored against every challenge in one pass over their activities
+    @param sinks list with a sink per challenge (None entries default to a RowCollector)
+    @return list of the sinks, in challenges order
+    """
+    sinks = [None] * len(challenges) if sinks is None else sinks
+    sinks = [RowCollector() if sink is None else sink for sink in sinks]
+    after, before = scorer.union_window(challenges)
+    pending = queue.Queue()
+    for user_id in user_ids:
+        pending.put(user_id)
+    n_fetchers = max(1, min(concurrency, len(user_ids)))
+    synced = queue.Queue(maxsize=n_fetchers)    # bounded: fetchers wait if scoring falls behind
+    results = queue.Queue(maxsize=n_fetchers)
+
+    def fetch():
+        while True:
+            try:
+                user_id = pending.get_nowait()
+            except queue.Empty:
+                break
+            started = time.perf_counter()
+            try:
+                if strava_app_store.sync_user(user_id, after, before) is not None:
+                    metrics.observe('user_fetch_seconds', time.perf_counter() - started)
+                    synced.put(user_id)
+                    continue
+            except Exception as e:
+                print(f"Exception processing user {user_id}: {e}")
+            metrics.incr('user_fetch_failures')
+            print(f"Error obtaining Strava data for user {user_id}")
+        synced.put(_DONE)
+
+    def score():
+        remaining = n_fetchers
+        while remaining:
+            user_id = synced.get()
+            if user_id is _DONE:
+                remaining -= 1
+                continue
+            try:
+                with metrics.span('scoring'):
+                    users = scorer.score_user_challenges(user_id, challenges)
+            except Exception as e:
+                print(f"Exception processing user {user_id}: {e}")
+                continue
+            if not any(users):
+                print(f"Error obtaining Strava data for user {user_id}")
+            results.put([scorer.user_row(user) if user else None for user in users])
+        results.put(_DONE)
+
+    threads = [threading.Thread(target=fetch, daemon=True) for _ in range(n_fetchers)]
+    threads.append(threading.Thread(target=score, daemon=True))
+    for thread in threads:
+        thread.start()
+    try:
+        while (rows := results.get()) is not _DONE:
+            for sink, row in zip(sinks, rows):
+                if row is not None:
+                    sink.write(row)
+    finally:
+        for sink in sinks:
+            sink.close()
+    for thread in threads:
+        thread.join()
+    return sinks
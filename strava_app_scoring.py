@@ -1,12 +1,20 @@
-from dataclasses import dataclass, field
+from concurrent.futures import ProcessPoolExecutor
+import bisect
+import json
+from dataclasses import dataclass, field, fields, make_dataclass
 from datetime import datetime
+from functools import lru_cache
 from math import floor
-from typing import List
+from typing import ClassVar, List
+import numpy as np
 import pandas as pd
 
 import strava_app_api
-from strava_app_helpers import GetBonus, BonusType
-from strava_app_settings import START, END
+import strava_app_settings
+import strava_app_store
+from strava_app_helpers import BONUS_TABLES, GetBonus, BonusType, load_bonus_tables, parse_bonus_tables
+from strava_app_sports import ADVENTURE_CATEGORIES, BONUS_CATEGORIES, MILES, MINUTES, SPORT_DISPATCH, STAT_FIELDS
+from strava_app_settings import CHALLENGE_NAME, START, END
 
 ## Exercise Challenge options
 ECM_swim = 9.0
@@ -25,17 +33,77 @@ bonus_first_step = 15
 bonus_lucky_7s = 100
 bonus_adventure_club = 100
 
+
+@dataclass(frozen=True)
+class Challenge:
+    """One scored challenge: its window, scoring constants and bonus tier tables.
+    Defaults are the options above and the window in strava_app_settings."""
+    name: str = CHALLENGE_NAME
+    start: int = START      # epoch seconds, activities must start after this
+    end: int = END          # epoch seconds, ... and before this
+    ecm_swim: float = ECM_swim
+    ecm_run: float = ECM_run
+    ecm_bike: float = ECM_bike
+    pts_per_min: float = pts_per_min
+    adventure_points: int = adventure_points
+    bonus_bird: int = bonus_bird
+    bonus_triathlete: int = bonus_triathlete
+    bonus_world: int = bonus_world
+    bonus_500: int = bonus_500
+    bonus_first_step: int = bonus_first_step
+    bonus_lucky_7s: int = bonus_lucky_7s
+    bonus_adventure_club: int = bonus_adventure_club
+    bonus_tables: dict = field(default_factory=lambda: BONUS_TABLES, compare=False)
+
+
+def load_challenges(path: str) -> list:
+    """Loads challenges from a JSON list, eg.
+        [{"name": "Office_Fall", "start": "2025-09-01", "end": "2025-10-01",
+          "pts_per_min": 0.5, "bonus_table_file": "office_bonus.json"}, ...]
+    Dates are local midnight like START/END in settings. Options left out use the defaults;
+    bonus tiers come from "bonus_tables" (inline) or "bonus_table_file", over the default tables."""
+    with open(path) as f:
+        config = json.load(f)
+    challenges = []
+    for entry in config:
+        options = dict(entry)
+        for key in ('start', 'end'):
+            options[key] = int(datetime.strptime(options[key], "%Y-%m-%d").timestamp())
+        tables = dict(BONUS_TABLES)
+        if 'bonus_table_file' in options:
+            tables.update(load_bonus_tables(options.pop('bonus_table_file')))
+        tables.update(parse_bonus_tables(options.pop('bonus_tables', {})))
+        challenges.append(Challenge(bonus_tables=tables, **options))
+    return challenges
+
+
+def union_window(challenges: list) -> tuple:
+    """(after, before) covering every challenge's window, for a single fetch"""
+    return min(c.start for c in challenges), max(c.end for c in challenges)
+
+
+DEFAULT_CHALLENGE = Challenge()
+# Challenges scored together on each run; CHALLENGE_FILE replaces the single default
+CHALLENGES = (load_challenges(strava_app_settings.CHALLENGE_FILE) if strava_app_settings.CHALLENGE_FILE
+              else [DEFAULT_CHALLENGE])
+
 ## Helper functions
-def toAdvPts(time: float):
+def toAdvPts(time: float, points: int = adventure_points):
     """Convert adventure activity time to points.
     
     Args:
         time: Adventure activity time in minutes
+        points: Points per full 30 minutes (the challenge's adventure_points)
         
     Returns:
         Points earned for the activity
     """
-    return floor(time / 30) * adventure_points
+    return floor(time / 30) * points
+
+@lru_cache(maxsize=None)
+def _float_fields(cls) -> tuple:
+    """Names of a dataclass's float fields, looked up once per class."""
+    return tuple(f.name for f in fields(cls) if f.type is float)
 
 def round_all(dataclass_obj: dataclass, ndigits=2):
     """Rounds all floats in dataclass to ndigits.
@@ -44,46 +112,36 @@ def round_all(dataclass_obj: dataclass, ndigits=2):
         dataclass_obj: The dataclass object to round
         ndigits: Number of decimal places to round to
     """
-    for f_name, f_obj in dataclass_obj.__dataclass_fields__.items():
-        if f_obj.type is float:
-            value = getattr(dataclass_obj, f_name)
-            setattr(dataclass_obj, f_name, round(value, ndigits))
+    for f_name in _float_fields(type(dataclass_obj)):
+        setattr(dataclass_obj, f_name, round(getattr(dataclass_obj, f_name), ndigits))
 
 ## Stats Data Class
-@dataclass
-class StravaStats:
-    """Store metrics retrieved from Strava"""
+# Stats and points classes are slotted (no per-instance __dict__), which keeps
+# large rescoring runs small; field name lists are class-level tuples
+# One float per sport category in strava_app_sports.CATEGORIES (units are listed there)
+_SportStats = make_dataclass('_SportStats', [(name, float, 0) for name in STAT_FIELDS], slots=True)
+
+
+@dataclass(slots=True)
+class StravaStats(_SportStats):
+    """Store metrics retrieved from Strava
+    Per-sport distances/times are generated from the sport registry"""
     total_moving_time: float = 0    # minutes
-    swim_distance: float = 0        # miles
-    run_distance: float = 0         # miles
-    bike_distance: float = 0        # miles
-    walk_distance: float = 0        # miles
-    weightlift_time: float = 0      # minutes
-    stairstepper_time: float = 0    # minutes
-    hiit_time: float = 0            # minutes
-    rowing_distance: float = 0      # meters
-    # adventure categories 
-    pickleball_time: float = 0      # minutes
-    yoga_time: float = 0            # minutes
-    racquetball_time: float = 0     # minutes
-    tennis_time: float = 0          # minutes
-    soccer_time: float = 0          # minutes
-    rock_climb_time: float = 0      # minutes
-    surf_time: float = 0            # minutes
-    paddleboard_time: float = 0     # minutes
-    kayak_time: float = 0           # minutes
-    skiing_time: float = 0          # minutes
-    badminton_time: float = 0       # minutes
-    golf_time: float = 0            # minutes
-    skate_time: float = 0    # minutes
     # unique categories
     firstOfMonth: bool = False
     lastOfMonth: bool = False
 
 
-@dataclass
-class UserPoints:
-    """Store metrics derived from StravaStats"""
+# Registry bonus and adventure point fields
+_SportPoints = make_dataclass('_SportPoints',
+    [(c.bonus_field, int, 0) for c in BONUS_CATEGORIES] +
+    [(c.points_field, int, 0) for c in ADVENTURE_CATEGORIES], slots=True)
+
+
+@dataclass(slots=True)
+class UserPoints(_SportPoints):
+    """Store metrics derived from StravaStats
+    Per-sport bonus and adventure fields are generated from the sport registry"""
     total_points:   int = 0
     total_time_pts: float = 0
 
@@ -93,23 +151,13 @@ class UserPoints:
     ecm_walk:       float = 0
     ecm_swim:       float = 0
 
-    bonus_fields:  list[str] = field(default_factory=lambda: 
-        ["bonus_ECM", "bonus_swim", "bonus_run", "bonus_walk",
-         "bonus_bike", "bonus_lift", "bonus_HIT", "bonus_row"]
-    )
+    bonus_fields:  ClassVar[tuple] = ("bonus_ECM",) + tuple(c.bonus_field for c in BONUS_CATEGORIES)
     total_bonus:    int = 0
     bonus_ECM:      int = 0
-    bonus_swim:     int = 0
-    bonus_run:      int = 0
-    bonus_walk:     int = 0
-    bonus_bike:     int = 0
-    bonus_lift:     int = 0
-    bonus_HIT:      int = 0
-    bonus_row:      int = 0
     
-    unique_fields:  list[str] = field(default_factory=lambda: 
-        ["early_bird", "final_stretch", "triathlete", "around_the_world",
-         "club_500", "first_step", "lucky_7s", "club_adventure"]
+    unique_fields:  ClassVar[tuple] = (
+        "early_bird", "final_stretch", "triathlete", "around_the_world",
+        "club_500", "first_step", "lucky_7s", "club_adventure"
     )
     total_unique:   int = 0
     early_bird:     int = 0     # exercised on first day
@@ -121,24 +169,8 @@ class UserPoints:
     lucky_7s:       int = 0     # >777 ECM
     club_adventure: int = 0     # >6 adventure sports
 
-    adventure_fields :  list[str] = field(default_factory=lambda: [
-        "pickleball", "yoga", "racquetball", "tennis", "soccer", 
-        "rock_climb", "surf", "kayak", "skiing", "badminton", "golf", "skate"
-    ])
+    adventure_fields :  ClassVar[tuple] = tuple(c.points_field for c in ADVENTURE_CATEGORIES)
     total_adventure:    int = 0
-    pickleball:     int = 0  
-    yoga:           int = 0        
-    racquetball:    int = 0 
-    tennis:         int = 0      
-    soccer:         int = 0      
-    rock_climb:     int = 0  
-    surf:           int = 0        
-    paddleboard:    int = 0 
-    kayak:          int = 0       
-    skiing:         int = 0      
-    badminton:      int = 0   
-    golf:           int = 0
-    skate:   int = 0
 
     def sumTotalBonus(self) -> int:
         """Calculate total bonus points."""
@@ -160,29 +192,42 @@ class UserEC():
         _has_stats: boolean to check if stats have been calculated
         _has_points: boolean to check if points have been calculated
     """
-    def __init__(self, user_id: str):
+    __slots__ = ('user_id', 'challenge', 'stats', 'points', '_has_stats', '_has_points')
+
+    def __init__(self, user_id: str, challenge: Challenge = None):
         self.user_id = user_id
+        self.challenge = DEFAULT_CHALLENGE if challenge is None else challenge
         self.stats  = StravaStats()
         self.points = UserPoints()
         self._has_stats  = False # true if calculate_stats() was run
         self._has_points = False # true if ____() was run
 
     def calculate_stats(self):
-        """ Retrieves user's Strava activities within challenge time window.
-            Calculates stats from those activities
+        """ Syncs user's new Strava activities into the local activity store,
+            then calculates stats from the stored activities within challenge time window.
+        """
+        start, end = self.challenge.start, self.challenge.end
+        if strava_app_store.sync_user(self.user_id, start, end) is None:
+            return False
+        return self.add_activities(strava_app_store.load_activities(self.user_id, start, end))
+    # end calculate_stats()
+
+    def add_activities(self, activities: list):
+        """ Accumulates stats from a list of Strava activity dicts.
+            Returns False if there are no activities
         """
-        activities = strava_app_api.get_user_activities(self.user_id)
         if not activities:
             return False
 
-        fist_day = START + 86400
-        last_day = END - 86400
+        fist_day = self.challenge.start + 86400
+        last_day = self.challenge.end - 86400
+        dispatch = SPORT_DISPATCH
+        # Accumulate in locals, continuing from the current stats (add_activities can be called repeatedly)
+        totals = {name: getattr(self.stats, name) for name in STAT_FIELDS}
+        total_moving_time = self.stats.total_moving_time
         for workout in activities:
-            distance = workout['distance'] / 1609.3     # meters to miles
             duration = workout['moving_time'] / 60.0    # seconds to minutes
-            sport = workout['sport_type'].upper()       # type
-
-            self.stats.total_moving_time += duration
+            total_moving_time += duration
 
             # Check workout is on first or last day
             date = int(datetime.strptime(workout['start_date'], "%Y-%m-%dT%H:%M:%SZ").timestamp())
@@ -192,54 +237,22 @@ class UserEC():
                 self.stats.lastOfMonth = True
 
             # Get workout distances/times
-            match sport:
-                case 'SWIM':
-                    self.stats.swim_distance += distance
-                case 'RUN' | 'VIRTUALRUN' | 'ELLIPTICAL':
-                    self.stats.run_distance += distance
-                case 'RIDE' | 'VIRTUALRIDE' | 'MOUNTAINBIKERIDE'| 'EMOUNTAINBIKERIDE' | 'GRAVELRIDE':
-                    self.stats.bike_distance += distance
-                case 'WALK' | 'HIKE':
-                    self.stats.walk_distance += distance
-                case 'WEIGHTTRAINING':
-                    self.stats.weightlift_time += duration
-                case 'STAIRSTEPPER':
-                    self.stats.stairstepper_time += duration
-                case 'CROSSFIT' | 'HIGHINTENSITYINTERVALTRAINING':
-                    self.stats.hiit_time += duration
-                case 'ROWING' | 'VIRTUALROW':
-                    self.stats.rowing_distance += workout['distance'] # meters
-                # Adventure categories
-                case 'PICKLEBALL':
-                    self.stats.pickleball_time += duration
-                case 'YOGA':
-                    self.stats.yoga_time += duration
-                case 'RACQUETBALL' | 'SQUASH':
-                    self.stats.racquetball_time += duration
-                case 'TENNIS':
-                    self.stats.tennis_time += duration
-                case 'SOCCER':
-                    self.stats.soccer_time += duration
-                case 'ROCKCLIMBING':
-                    self.stats.rock_climb_time += duration
-                case 'SURFING':
-                    self.stats.surf_time += duration
-                case 'STANDUPPADDLING':
-                    self.stats.paddleboard_time += duration
-                case 'KAYAKING' | 'CANOEING':
-                    self.stats.kayak_time += duration
-                case 'ALPINESKI' | 'BACKCOUNTRYSKI' | 'NORDICSKI' | 'ROLLERSKI':
-                    self.stats.skiing_time += duration
-                case 'BADMINTON':
-                    self.stats.badminton_time += duration
-                case 'GOLF':
-                    self.stats.golf_time += duration
-                case 'INLINESKATE' | 'ICESKATE':
-                    self.stats.skate_time += duration
+            entry = dispatch.get(workout['sport_type'].upper())
+            if entry is not None:
+                name, unit = entry
+                if unit == MINUTES:
+                    totals[name] += duration
+                elif unit == MILES:
+                    totals[name] += workout['distance'] / 1609.3     # meters to miles
+                else:
+                    totals[name] += workout['distance']             # meters
 
+        self.stats.total_moving_time = total_moving_time
+        for name, total in totals.items():
+            setattr(self.stats, name, total)
         self._has_stats = True
         return True
-    # end calculate_stats()
+    # end add_activities()
     
     def calculate_points(self):
         """Generates individual's points from Strava stats.
@@ -248,33 +261,30 @@ class UserEC():
             if not self.calculate_stats(): # calls Strava API
                 return None
         
+        c = self.challenge
         # Calculate ECM
-        self.points.ecm_bike    = ECM_bike * self.stats.bike_distance
-        self.points.ecm_swim    = ECM_swim * self.stats.swim_distance
-        self.points.ecm_walk    = ECM_run  * self.stats.walk_distance
-        self.points.ecm_run     = ECM_run  * self.stats.run_distance
+        self.points.ecm_bike    = c.ecm_bike * self.stats.bike_distance
+        self.points.ecm_swim    = c.ecm_swim * self.stats.swim_distance
+        self.points.ecm_walk    = c.ecm_run  * self.stats.walk_distance
+        self.points.ecm_run     = c.ecm_run  * self.stats.run_distance
         self.points.total_ecm = sum([self.points.ecm_bike, self.points.ecm_swim,
                                      self.points.ecm_walk, self.points.ecm_run])
 
         # Calculate Bonus Points
-        self.points.bonus_ECM   = GetBonus(BonusType.ECM,  self.points.total_ecm)
-        self.points.bonus_swim  = GetBonus(BonusType.SWIM, self.stats.swim_distance)
-        self.points.bonus_run   = GetBonus(BonusType.RUN,  self.stats.run_distance)
-        self.points.bonus_walk  = GetBonus(BonusType.WALK, self.stats.walk_distance)
-        self.points.bonus_bike  = GetBonus(BonusType.BIKE, self.stats.bike_distance)
-        self.points.bonus_lift  = GetBonus(BonusType.LIFT, self.stats.weightlift_time)
-        self.points.bonus_HIT   = GetBonus(BonusType.HIIT, self.stats.hiit_time)
-        self.points.bonus_row   = GetBonus(BonusType.ROW,  self.stats.rowing_distance)
+        self.points.bonus_ECM   = GetBonus(BonusType.ECM,  self.points.total_ecm, c.bonus_tables)
+        for category in BONUS_CATEGORIES:
+            setattr(self.points, category.bonus_field,
+                    GetBonus(category.bonus, getattr(self.stats, category.stat_field), c.bonus_tables))
 
         # Calculate Unique Points
-        self.points.early_bird    = bonus_bird if self.stats.firstOfMonth else 0
-        self.points.final_stretch = bonus_bird if self.stats.lastOfMonth  else 0
+        self.points.early_bird    = c.bonus_bird if self.stats.firstOfMonth else 0
+        self.points.final_stretch = c.bonus_bird if self.stats.lastOfMonth  else 0
         isTriathlete = all([
             (self.stats.swim_distance > 0),
             (self.stats.bike_distance > 0),
             (self.stats.run_distance  > 0)
         ])
-        self.points.triathlete = bonus_triathlete if isTriathlete else 0
+        self.points.triathlete = c.bonus_triathlete if isTriathlete else 0
 
         isWorldTraveler = all([
             (self.stats.weightlift_time > 0),
@@ -283,32 +293,23 @@ class UserEC():
             (self.stats.hiit_time > 0),
             (self.stats.walk_distance > 0)
         ])
-        self.points.around_the_world = bonus_world if isWorldTraveler else 0
+        self.points.around_the_world = c.bonus_world if isWorldTraveler else 0
 
         is500Club = any([True for bon in self.points.bonus_fields if (bon != "bonus_ECM" and getattr(self.points, bon) >= 500)])
-        self.points.club_500    = bonus_500        if is500Club                          else 0
-        self.points.first_step  = bonus_first_step if self.stats.total_moving_time >= 60 else 0
-        self.points.lucky_7s    = bonus_lucky_7s   if self.points.total_ecm >= 777       else 0
+        self.points.club_500    = c.bonus_500        if is500Club                          else 0
+        self.points.first_step  = c.bonus_first_step if self.stats.total_moving_time >= 60 else 0
+        self.points.lucky_7s    = c.bonus_lucky_7s   if self.points.total_ecm >= 777       else 0
 
         # Calculate Adventure Points
-        self.points.pickleball  = toAdvPts(self.stats.pickleball_time)
-        self.points.yoga        = toAdvPts(self.stats.yoga_time)
-        self.points.racquetball = toAdvPts(self.stats.racquetball_time)
-        self.points.tennis      = toAdvPts(self.stats.tennis_time)
-        self.points.soccer      = toAdvPts(self.stats.soccer_time)
-        self.points.rock_climb  = toAdvPts(self.stats.rock_climb_time)
-        self.points.surf        = toAdvPts(self.stats.surf_time)
-        self.points.kayak       = toAdvPts(self.stats.kayak_time)
-        self.points.skiing      = toAdvPts(self.stats.skiing_time)
-        self.points.badminton   = toAdvPts(self.stats.badminton_time)
-        self.points.golf        = toAdvPts(self.stats.golf_time)
-        self.points.skate= toAdvPts(self.stats.skate_time)
+        for category in ADVENTURE_CATEGORIES:
+            setattr(self.points, category.points_field,
+                    toAdvPts(getattr(self.stats, category.stat_field), c.adventure_points))
 
         number_of_adventures = sum(1 for adv in self.points.adventure_fields if (getattr(self.points, adv) > 0))
-        self.points.club_adventure = 100 if (number_of_adventures >= 6) else 0
+        self.points.club_adventure = c.bonus_adventure_club if (number_of_adventures >= 6) else 0
 
         # Calculate Total Points
-        self.points.total_time_pts  = self.stats.total_moving_time * pts_per_min
+        self.points.total_time_pts  = self.stats.total_moving_time * c.pts_per_min
         self.points.total_bonus     = self.points.sumTotalBonus()
         self.points.total_unique    = self.points.sumTotalUnique()
         self.points.total_adventure = self.points.sumTotalAdventure()
@@ -326,8 +327,93 @@ class UserEC():
         return True
     
 
+# DataFrame columns in order: (column, source, field)
+#   source 'user'/'stats'/'points' reads that attribute of UserEC, 'const' uses field as the value
+USER_COLUMNS = [
+    ('User_ID',           'user',   'user_id'),
+    ('Team',              'const',  0),
+    ('Rank',              'const',  0),
+    ('Name',              'const',  "None"),
+    ('Total_Points',      'points', 'total_points'),
+    ('Moving_Time',       'stats',  'total_moving_time'),
+    ('Time_Points',       'points', 'total_time_pts'),
+    ('Bonus_Points',      'points', 'total_bonus'),
+    ('Unique_Points',     'points', 'total_unique'),
+    ('Adventure_Points',  'points', 'total_adventure'),
+    # Activity distances
+    ('Net_ECM',           'points', 'total_ecm'),
+    ('Run_Distance',      'stats',  'run_distance'),
+    ('Walk_Distance',     'stats',  'walk_distance'),
+    ('Bike_Distance',     'stats',  'bike_distance'),
+    ('Swim_Distance',     'stats',  'swim_distance'),
+    ('Rowing_Distance',   'stats',  'rowing_distance'),
+    # Activity times
+    ('Weightlift_Time',   'stats',  'weightlift_time'),
+    ('HIIT_Time',         'stats',  'hiit_time'),
+    ('Stairstepper_Time', 'stats',  'stairstepper_time'),
+    # Unique achievements
+    ('Early_Bird',        'points', 'early_bird'),
+    ('First_Step',        'points', 'first_step'),
+    ('Final_Stretch',     'points', 'final_stretch'),
+    ('Triathlete',        'points', 'triathlete'),
+    ('Around_the_World',  'points', 'around_the_world'),
+    ('Club_500',          'points', 'club_500'),
+    ('Lucky_7s',          'points', 'lucky_7s'),
+    ('Club_Adventure',    'points', 'club_adventure'),
+] + [
+    # Adventure points
+    (category.column,     'points', category.points_field) for category in ADVENTURE_CATEGORIES
+]
+USER_COLUMN_NAMES = [column for column, _, _ in USER_COLUMNS]
+
+
+def user_row(user: UserEC) -> tuple:
+    """Compact result row for one scored user, values in USER_COLUMNS order."""
+    sources = {'user': user, 'stats': user.stats, 'points': user.points}
+    return tuple(value if source == 'const' else getattr(sources[source], value)
+                 for _, source, value in USER_COLUMNS)
+
+
+def _build_dataframe(n_rows: int, column_values) -> pd.DataFrame:
+    """Builds the rankings DataFrame column by column.
+
+    Numeric columns become one typed array each (int64 unless a value is a float),
+    float columns are rounded to 2 places in place; constants are filled, not repeated
+    per row. Gives the same values and dtypes as pd.DataFrame(rows).round(2).
+
+    Args:
+        n_rows: Number of users
+        column_values: Sequence of each column's values, in USER_COLUMNS order (None for 'const' columns)
+    """
+    if not n_rows:
+        return pd.DataFrame(columns=USER_COLUMN_NAMES)
+    data = {}
+    for (column, source, value), values in zip(USER_COLUMNS, column_values):
+        if source == 'const':
+            values = np.full(n_rows, value) if isinstance(value, int) else [value] * n_rows
+        elif source != 'user':
+            values = np.array(values)
+            if values.dtype.kind == 'f':
+                np.round(values, 2, out=values)
+        data[column] = values   # 'user' columns (ids) stay lists so pandas infers their string dtype
+    return pd.DataFrame(data, copy=False)
+
+
+def create_dataframe_from_rows(rows: List[tuple]) -> pd.DataFrame:
+    """Build the rankings DataFrame from user_row() tuples.
+
+    Args:
+        rows: List of tuples in USER_COLUMNS order
+
+    Returns:
+        pd.DataFrame: DataFrame containing user data
+    """
+    return _build_dataframe(len(rows), list(zip(*rows)))
+
+
 def create_dataframe_from_users(user_results: List) -> pd.DataFrame:
     """Convert list of UserEC objects to pandas DataFrame efficiently.
+    Columns are read straight from the users' stats/points, no per-user dict or row.
     
     Args:
         user_results: List of UserEC objects
@@ -335,56 +421,85 @@ def create_dataframe_from_users(user_results: List) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame containing user data
     """
-    data_rows = [None] * len(user_results)
-    index = 0
-    
-    for user in user_results:
-        row = {
-            'User_ID': user.user_id,
-            'Team': 0,
-            'Rank': 0,
-            'Name': "None",
-            'Total_Points': user.points.total_points,
-            'Moving_Time': user.stats.total_moving_time,
-            'Time_Points': user.points.total_time_pts,
-            'Bonus_Points': user.points.total_bonus,
-            'Unique_Points': user.points.total_unique,
-            'Adventure_Points': user.points.total_adventure,
-            # Activity distances
-            'Net_ECM': user.points.total_ecm,
-            'Run_Distance': user.stats.run_distance,
-            'Walk_Distance': user.stats.walk_distance,
-            'Bike_Distance': user.stats.bike_distance,
-            'Swim_Distance': user.stats.swim_distance,
-            'Rowing_Distance': user.stats.rowing_distance,
-            # Activity times
-            'Weightlift_Time': user.stats.weightlift_time,
-            'HIIT_Time': user.stats.hiit_time,
-            'Stairstepper_Time': user.stats.stairstepper_time,
-            # Unique achievements
-            'Early_Bird': user.points.early_bird,
-            'First_Step': user.points.first_step,
-            'Final_Stretch': user.points.final_stretch,
-            'Triathlete': user.points.triathlete,
-            'Around_the_World': user.points.around_the_world,
-            'Club_500': user.points.club_500,
-            'Lucky_7s': user.points.lucky_7s,
-            'Club_Adventure': user.points.club_adventure,
-            # Adventure points
-            'Pickleball': user.points.pickleball,
-            'Yoga': user.points.yoga,
-            'Racquetball': user.points.racquetball,
-            'Tennis': user.points.tennis,
-            'Soccer': user.points.soccer,
-            'Rock_Climb': user.points.rock_climb,
-            'Surf': user.points.surf,
-            'Kayak': user.points.kayak,
-            'Skiing': user.points.skiing,
-            'Badminton': user.points.badminton,
-            'Golf': user.points.golf,
-            'Skating': user.points.skate
-        }
-        data_rows[index] = row
-        index += 1
-    
-    return pd.DataFrame(data_rows).round(2)
\ No newline at end of file
+    def column(source, value):
+        if source == 'const':
+            return None
+        if source == 'user':
+            return [getattr(user, value) for user in user_results]
+        return [getattr(getattr(user, source), value) for user in user_results]
+
+    return _build_dataframe(len(user_results), [column(source, value) for _, source, value in USER_COLUMNS])
+
+
+def _init_scoring_worker(store_file: str) -> None:
+    """Process pool initializer: use the parent's activity store."""
+    strava_app_store.store_file = store_file
+
+
+def score_user_challenges(user_id: str, challenges: list) -> list:
+    """Scores one user against several challenges in a single pass over their stored activities.
+    Each chunk of activities (oldest first) is split by date into every challenge's window,
+    so each challenge sees exactly the activities load_activities(start, end) would give it.
+
+    Args:
+        user_id: Strava ID for user
+        challenges: Challenge objects
+
+    Returns:
+        List with a scored UserEC per challenge, None where the user has no activities in its window
+    """
+    after, before = union_window(challenges)
+    users = [UserEC(user_id, challenge) for challenge in challenges]
+    for chunk in strava_app_store.iter_activity_chunks(user_id, after, before):
+        timestamps = [strava_app_api.activity_timestamp(a) for a in chunk]
+        for user in users:
+            first = bisect.bisect_right(timestamps, user.challenge.start)
+            last = bisect.bisect_left(timestamps, user.challenge.end)
+            user.add_activities(chunk[first:last])
+    scored = []
+    for user in users:
+        if user._has_stats:
+            user.calculate_points()
+            scored.append(user)
+        else:
+            scored.append(None)
+    return scored
+
+
+def _score_chunk(user_ids: List[str], challenges: list) -> List[list]:
+    """Process pool task: score a chunk of users from the activity store.
+    Returns compact user_row() tuples per challenge; users without activities are left out."""
+    rows = [[] for _ in challenges]
+    for user_id in user_ids:
+        for challenge_rows, user in zip(rows, score_user_challenges(user_id, challenges)):
+            if user:
+                challenge_rows.append(user_row(user))
+    return rows
+
+
+def score_cached_users_parallel(user_ids: List[str], max_workers: int = None,
+                                chunk_size: int = 50, challenges: list = None) -> dict:
+    """Re-score users from the activity store on a process pool (no API calls).
+
+    Scoring is CPU-bound Python, so processes sidestep the GIL that serializes
+    the thread pool once activities come from cache instead of the network.
+
+    Args:
+        user_ids: Users to score
+        max_workers: Worker processes (default: CPU count)
+        chunk_size: Users per task
+        challenges: Challenge objects (default: CHALLENGES)
+
+    Returns:
+        dict: {challenge name: DataFrame, same as create_dataframe_from_users for these users}
+    """
+    challenges = CHALLENGES if challenges is None else challenges
+    chunks = [user_ids[i:i + chunk_size] for i in range(0, len(user_ids), chunk_size)]
+    rows = [[] for _ in challenges]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_scoring_worker,
+                             initargs=(strava_app_store.store_file,)) as executor:
+        for chunk_rows in executor.map(_score_chunk, chunks, [challenges] * len(chunks)):
+            for challenge_rows, new_rows in zip(rows, chunk_rows):
+                challenge_rows.extend(new_rows)
+    return {challenge.name: create_dataframe_from_rows(challenge_rows)
+            for challenge, challenge_rows in zip(challenges, rows)}
@@ -7,10 +7,19 @@ from datetime import datetime
 ## Exercise challenge settings
 CHALLENGE_NAME          = 'Summer_2025'       # name of the challenge (for the output file)
 TOKEN_LOCATION          = 'user_tokens/'    # folder path to save tokens to. End with '/'
+TOKEN_STORE             = 'files'           # 'files' (one strava_tokens_<id>.json per user) or 'vault' (one SQLite tokens.db, see strava_app_vault)
 INTERMEDIATE_LOCATION   = 'output/'         # folder path to save retrieved/processed data from Strava. Prevents excess API calls. End with '/'
+ARCHIVE_LOCATION        = 'output/archive/' # folder path for the Parquet archive of activities and score snapshots. End with '/'
 
 START = int(datetime(2024, 10, 15).timestamp())  # year,month,day
 END =   int(datetime(2025, 7, 25).timestamp())
+TOKEN_REFRESH_HORIZON = 3600  # seconds, tokens expiring sooner are refreshed before scoring starts
+BONUS_TABLE_FILE = None     # optional JSON of bonus tiers, eg. 'bonus_tables.json' - {"RUN": {"points": [..], "values": [..]}}
+SYNC_LOOKBACK_DAYS = 3  # days re-requested behind the newest stored activity on each sync (catches late uploads)
+CHALLENGE_FILE = None       # optional JSON list of challenges scored together from one fetch, eg. 'challenges.json' (see strava_app_scoring.load_challenges)
+WEBHOOK_PORT = 8080         # port strava_app_webhook listens on for Strava push events
+WEBHOOK_VERIFY_TOKEN = None # any secret string, sent back by Strava when creating the push subscription (required)
+WEBHOOK_SUBSCRIPTION_ID = None  # id of the app's push subscription (printed by 'strava_app_webhook.py serve --subscribe'); other events are refused
 # PERMISSIONS='read_all'  # 'read', 'read_all'  # not used at the moment
 
 
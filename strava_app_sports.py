@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+from strava_app_helpers import BonusType
+
+"""
+Module for:
+1) Registry of how every tracked Strava sport_type is scored
+   StravaStats/UserPoints fields, the scoring dispatch and the adventure
+   DataFrame columns are all generated from CATEGORIES below
+
+Adding a Strava sport_type to an existing category, or a new adventure
+sport, is a one-line change to CATEGORIES
+"""
+
+# Units a category accumulates
+MILES   = 'miles'       # activity distance, converted from meters
+METERS  = 'meters'      # activity distance as reported
+MINUTES = 'minutes'     # activity moving time, converted from seconds
+
+
+@dataclass(frozen=True)
+class SportCategory:
+    """One stat tracked from Strava activities"""
+    stat_field: str             # StravaStats field the activities accumulate into
+    unit: str                   # MILES, METERS or MINUTES
+    category: str               # 'distance', 'time' or 'adventure'
+    sport_types: tuple          # upper-cased Strava sport_type values counted here
+    bonus: BonusType = None     # bonus tier table scored on the stat
+    bonus_field: str = None     # UserPoints field holding that bonus
+    points_field: str = None    # UserPoints field holding adventure points
+    column: str = None          # DataFrame column for adventure points
+
+
+CATEGORIES = [
+    SportCategory('swim_distance',     MILES,   'distance', ('SWIM',), BonusType.SWIM, 'bonus_swim'),
+    SportCategory('run_distance',      MILES,   'distance', ('RUN', 'VIRTUALRUN', 'ELLIPTICAL'),
+                  BonusType.RUN, 'bonus_run'),
+    SportCategory('bike_distance',     MILES,   'distance', ('RIDE', 'VIRTUALRIDE', 'MOUNTAINBIKERIDE',
+                                                             'EMOUNTAINBIKERIDE', 'GRAVELRIDE'),
+                  BonusType.BIKE, 'bonus_bike'),
+    SportCategory('walk_distance',     MILES,   'distance', ('WALK', 'HIKE'), BonusType.WALK, 'bonus_walk'),
+    SportCategory('weightlift_time',   MINUTES, 'time',     ('WEIGHTTRAINING',), BonusType.LIFT, 'bonus_lift'),
+    SportCategory('stairstepper_time', MINUTES, 'time',     ('STAIRSTEPPER',)),
+    SportCategory('hiit_time',         MINUTES, 'time',     ('CROSSFIT', 'HIGHINTENSITYINTERVALTRAINING'),
+                  BonusType.HIIT, 'bonus_HIT'),
+    SportCategory('rowing_distance',   METERS,  'distance', ('ROWING', 'VIRTUALROW'), BonusType.ROW, 'bonus_row'),
+    # adventure categories
+    SportCategory('pickleball_time',   MINUTES, 'adventure', ('PICKLEBALL',), points_field='pickleball', column='Pickleball'),
+    SportCategory('yoga_time',         MINUTES, 'adventure', ('YOGA',), points_field='yoga', column='Yoga'),
+    SportCategory('racquetball_time',  MINUTES, 'adventure', ('RACQUETBALL', 'SQUASH'), points_field='racquetball', column='Racquetball'),
+    SportCategory('tennis_time',       MINUTES, 'adventure', ('TENNIS',), points_field='tennis', column='Tennis'),
+    SportCategory('soccer_time',       MINUTES, 'adventure', ('SOCCER',), points_field='soccer', column='Soccer'),
+    SportCategory('rock_climb_time',   MINUTES, 'adventure', ('ROCKCLIMBING',), points_field='rock_climb', column='Rock_Climb'),
+    SportCategory('surf_time',         MINUTES, 'adventure', ('SURFING',), points_field='surf', column='Surf'),
+    SportCategory('paddleboard_time',  MINUTES, 'adventure', ('STANDUPPADDLING',), points_field='paddleboard', column='Paddleboard'),
+    SportCategory('kayak_time',        MINUTES, 'adventure', ('KAYAKING', 'CANOEING'), points_field='kayak', column='Kayak'),
+    SportCategory('skiing_time',       MINUTES, 'adventure', ('ALPINESKI', 'BACKCOUNTRYSKI', 'NORDICSKI', 'ROLLERSKI'),
+                  points_field='skiing', column='Skiing'),
+    SportCategory('badminton_time',    MINUTES, 'adventure', ('BADMINTON',), points_field='badminton', column='Badminton'),
+    SportCategory('golf_time',         MINUTES, 'adventure', ('GOLF',), points_field='golf', column='Golf'),
+    SportCategory('skate_time',        MINUTES, 'adventure', ('INLINESKATE', 'ICESKATE'), points_field='skate', column='Skating'),
+]
+
+# Derived lookups, built once at import
+STAT_FIELDS          = [c.stat_field for c in CATEGORIES]
+BONUS_CATEGORIES     = [c for c in CATEGORIES if c.bonus is not None]
+ADVENTURE_CATEGORIES = [c for c in CATEGORIES if c.category == 'adventure']
+
+# sport_type -> (stat field, unit): the per-activity dispatch table
+SPORT_DISPATCH = {sport: (c.stat_field, c.unit) for c in CATEGORIES for sport in c.sport_types}
@@ -0,0 +1,288 @@
+import json
+import sqlite3
+import threading
+import time
+
+import strava_app_api
+import strava_app_metrics as metrics
+import strava_app_settings
+
+"""
+Module for:
+1) Persistent per-user activity store (SQLite under INTERMEDIATE_LOCATION)
+2) Incremental sync - only activities after a user's last synced start are requested;
+   stored activities in the requested window that Strava no longer returns are removed
+"""
+
+store_file = strava_app_settings.INTERMEDIATE_LOCATION + 'activities.db'
+
+# Re-request this far behind the newest stored activity so late uploads
+# (manual entries, delayed device syncs) with older start dates are still picked up
+sync_lookback = strava_app_settings.SYNC_LOOKBACK_DAYS * 86400
+
+_local = threading.local()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS activities (
+    user_id     TEXT    NOT NULL,
+    activity_id INTEGER NOT NULL,
+    start_ts    INTEGER NOT NULL,   -- UTC epoch seconds of 'start_date'
+    payload     TEXT    NOT NULL,   -- activity JSON as returned by Strava
+    PRIMARY KEY (user_id, activity_id)
+);
+CREATE INDEX IF NOT EXISTS activities_by_start ON activities (user_id, start_ts);
+CREATE TABLE IF NOT EXISTS sync_state (
+    user_id     TEXT    PRIMARY KEY,
+    synced_from INTEGER NOT NULL,   -- start of the window that has been fetched
+    last_start  INTEGER NOT NULL,   -- newest activity start seen
+    synced_at   INTEGER NOT NULL    -- wall clock time of the last successful sync
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    Returns this thread's connection to the store, creating the schema on first use
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(store_file, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def get_sync_state(user_id: str):
+    """
+    Returns (synced_from, last_start, synced_at) for user_id, None if never synced
+    """
+    return _connect().execute(
+        "SELECT synced_from, last_start, synced_at FROM sync_state WHERE user_id = ?",
+        (user_id,)).fetchone()
+
+
+def order_by_staleness(user_ids: list) -> list:
+    """
+    Returns user_ids sorted by time of last sync, never-synced users first
+    """
+    synced_at = dict(_connect().execute("SELECT user_id, synced_at FROM sync_state"))
+    return sorted(user_ids, key=lambda user_id: synced_at.get(user_id, 0))
+
+
+def newest_start(user_id: str):
+    """
+    Returns the start_ts of the user's newest stored activity, None if nothing is stored
+    """
+    return _connect().execute("SELECT MAX(start_ts) FROM activities WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+
+def stored_payloads(user_id: str, activity_ids: list) -> dict:
+    """
+    Returns {activity_id: payload JSON} for the ids already in the store
+    """
+    conn = _connect()
+    stored = {}
+    chunk_size = 500    # stay well under SQLite's bound parameter limit
+    for i in range(0, len(activity_ids), chunk_size):
+        chunk = list(activity_ids[i:i + chunk_size])
+        stored.update(conn.execute(
+            f"SELECT activity_id, payload FROM activities WHERE user_id = ? AND activity_id IN ({','.join('?' * len(chunk))})",
+            [user_id] + chunk))
+    return stored
+
+
+def merge_activities(user_id: str, activities: list) -> int:
+    """
+    Upserts activities into the store keyed by activity id
+    Returns the number of activities merged
+    """
+    rows = [(user_id, a['id'], strava_app_api.activity_timestamp(a), json.dumps(a)) for a in activities]
+    conn = _connect()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO activities (user_id, activity_id, start_ts, payload) VALUES (?, ?, ?, ?)",
+            rows)
+    return len(rows)
+
+
+def delete_activity(user_id: str, activity_id) -> bool:
+    """
+    Removes one activity from the store
+    Returns True if it was stored
+    """
+    conn = _connect()
+    with conn:
+        cursor = conn.execute("DELETE FROM activities WHERE user_id = ? AND activity_id = ?",
+                              (user_id, activity_id))
+    return cursor.rowcount > 0
+
+
+def delete_user(user_id: str) -> None:
+    """
+    Removes all of a user's stored activities and sync state
+    """
+    conn = _connect()
+    with conn:
+        conn.execute("DELETE FROM activities WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM sync_state WHERE user_id = ?", (user_id,))
+
+
+class SyncPlan:
+    """What a sync of one user should request, derived from the stored sync state"""
+    def __init__(self, user_id: str, after: int, before: int, full: bool = False, keep_new: bool = True):
+        self.user_id = user_id
+        self.after = after
+        self.before = before
+        self.state = get_sync_state(user_id)
+        self.incremental = bool(self.state) and not full and self.state[0] <= after
+        self.fetch_after = max(after, self.state[1] - sync_lookback) if self.incremental else after
+        # Users synced longest ago (or never) go first when requests queue for quota
+        self.priority = self.state[2] if self.state else 0
+        self.keep_new = keep_new    # False when the caller only needs the store updated
+        self.new_activities = []    # filled by add_page()/commit()
+        self.changed = False
+        self.merged = 0
+        self.deleted = 0            # stored activities Strava no longer returned, removed by finish()
+        self._fetched_ids = set()
+        self.last_start = self.state[1] if self.incremental else after
+
+    def add_page(self, activities: list) -> None:
+        """
+        Merges one batch of fetched activities into the store
+        Afterwards new_activities lists the activities the store did not have yet (if keep_new),
+        and changed is True if any already stored activity came back different
+        """
+        if not activities:
+            return
+        self._fetched_ids.update(a['id'] for a in activities)
+        with metrics.span('store_merge'):
+            stored = stored_payloads(self.user_id, [a['id'] for a in activities])
+            if self.keep_new:
+                self.new_activities.extend(a for a in activities if a['id'] not in stored)
+            self.changed = self.changed or any(stored[a['id']] != json.dumps(a) for a in activities if a['id'] in stored)
+            self.merged += merge_activities(self.user_id, activities)
+        self.last_start = max([self.last_start] + [strava_app_api.activity_timestamp(a) for a in activities])
+
+    def finish(self) -> int:
+        """
+        Records the new sync state once every page is merged, and removes the stored
+        activities in the fetched window that Strava no longer returned (deleted or made
+        private); changed is set if any were removed
+        Returns the number of activities merged
+        """
+        synced_from = self.state[0] if self.incremental else self.after
+        conn = _connect()
+        stored_ids = [activity_id for (activity_id,) in conn.execute(
+            "SELECT activity_id FROM activities WHERE user_id = ? AND start_ts > ? AND start_ts < ?",
+            (self.user_id, self.fetch_after, self.before))]
+        gone = [activity_id for activity_id in stored_ids if activity_id not in self._fetched_ids]
+        with conn:
+            conn.executemany("DELETE FROM activities WHERE user_id = ? AND activity_id = ?",
+                             [(self.user_id, activity_id) for activity_id in gone])
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (user_id, synced_from, last_start, synced_at) VALUES (?, ?, ?, ?)",
+                (self.user_id, synced_from, self.last_start, int(time.time())))
+        self.deleted = len(gone)
+        self.changed = self.changed or bool(gone)
+        return self.merged
+
+    def commit(self, activities: list) -> int:
+        """
+        Merges all fetched activities and records the new sync state
+        Returns the number of activities merged
+        """
+        self.add_page(activities)
+        return self.finish()
+
+
+def sync_user(user_id: str, after: int = None, before: int = None, full: bool = False):
+    """
+    Fetches activities newer than the user's last synced start and merges them into the store
+    Falls back to a full after..before fetch the first time, or if the window was widened
+    @param user_id str Strava ID for user
+    @param after int epoch seconds, defaults to challenge START
+    @param before int epoch seconds, defaults to challenge END
+    @param full bool True to ignore sync state and refetch the whole window
+    @return int number of activities merged, None if the fetch failed
+    """
+    after = strava_app_settings.START if after is None else after
+    before = strava_app_settings.END if before is None else before
+
+    plan = SyncPlan(user_id, after, before, full, keep_new=False)
+    page_size = strava_app_api.activities_per_page
+    page = []
+    try:
+        # Merge page by page so only one page of activity dicts is held at a time
+        for activity in strava_app_api.iter_user_activities(user_id, after=plan.fetch_after, before=before,
+                                                            priority=plan.priority):
+            page.append(activity)
+            if len(page) == page_size:
+                plan.add_page(page)
+                page = []
+    except strava_app_api.StravaAPIError as e:
+        print(e)
+        return None
+    plan.add_page(page)
+    return plan.finish()
+
+
+def iter_activity_chunks(user_id: str, after: int = None, before: int = None, chunk_size: int = 500):
+    """
+    Generator over the user's stored activities in the after..before window, oldest first,
+    decoded chunk_size at a time so only one chunk of activity dicts is alive at once
+    """
+    after = strava_app_settings.START if after is None else after
+    before = strava_app_settings.END if before is None else before
+    cursor = _connect().execute(
+        "SELECT payload FROM activities WHERE user_id = ? AND start_ts > ? AND start_ts < ? "
+        "ORDER BY start_ts, activity_id",
+        (user_id, after, before))
+    while rows := cursor.fetchmany(chunk_size):
+        yield [json.loads(payload) for (payload,) in rows]
+
+
+def load_activities(user_id: str, after: int = None, before: int = None) -> list:
+    """
+    Returns the user's stored activities in the after..before window, oldest first
+    """
+    return [activity for chunk in iter_activity_chunks(user_id, after, before) for activity in chunk]
+
+
+def load_activity_columns(user_ids: list, after: int = None, before: int = None) -> list:
+    """
+    Returns (user_id, sport_type, distance, moving_time, start_date) rows for the users'
+    stored activities in the after..before window, without decoding whole payloads.
+    Rows are grouped by user, each user's oldest first (same order as load_activities)
+    """
+    after = strava_app_settings.START if after is None else after
+    before = strava_app_settings.END if before is None else before
+    conn = _connect()
+    rows = []
+    chunk_size = 500    # stay well under SQLite's bound parameter limit
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = list(user_ids[i:i + chunk_size])
+        rows.extend(conn.execute(
+            "SELECT user_id, json_extract(payload, '$.sport_type'), json_extract(payload, '$.distance'), "
+            "json_extract(payload, '$.moving_time'), json_extract(payload, '$.start_date') "
+            f"FROM activities WHERE user_id IN ({','.join('?' * len(chunk))}) AND start_ts > ? AND start_ts < ? "
+            "ORDER BY user_id, start_ts, activity_id",
+            chunk + [after, before]))
+    return rows
+
+
+def iter_activity_rows(after: int = None, before: int = None, chunk_size: int = 5000):
+    """
+    Generator over every stored activity in the after..before window as
+    (user_id, activity_id, start_ts, sport_type, distance, moving_time, payload) rows,
+    chunk_size rows at a time (eg. for archiving the raw activities)
+    """
+    after = strava_app_settings.START if after is None else after
+    before = strava_app_settings.END if before is None else before
+    cursor = _connect().execute(
+        "SELECT user_id, activity_id, start_ts, json_extract(payload, '$.sport_type'), "
+        "json_extract(payload, '$.distance'), json_extract(payload, '$.moving_time'), payload "
+        "FROM activities WHERE start_ts > ? AND start_ts < ? ORDER BY user_id, start_ts, activity_id",
+        (after, before))
+    while rows := cursor.fetchmany(chunk_size):
+        yield rows
@@ -0,0 +1,178 @@
+import itertools
+import json
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import strava_app_api
+
+"""
+Local stand-in for the Strava API, for running the app without network access
+Serves the endpoints the app uses:
+    POST /oauth/token               - authorization_code and refresh_token grants
+    GET  /api/v3/activities         - paginated, filtered by after/before
+    GET  /api/v3/activities/<id>    - single activity
+Responses carry X-RateLimit-Limit/X-RateLimit-Usage headers like the real API
+
+Example:
+    with StubStrava() as stub:
+        stub.add_user("12345", activities)
+        strava_app_api.set_base_url(stub.url)
+        ...
+"""
+
+
+class StubStrava:
+    """In-memory Strava API served from a background thread"""
+    def __init__(self, host='127.0.0.1', port=0, token_ttl=21600, rate_limit=(600, 30000)):
+        self.activities = {}        # user_id -> list of activity dicts
+        self.token_ttl = token_ttl  # seconds issued tokens stay valid
+        self.rate_limit = rate_limit
+        self.request_count = itertools.count()
+        self.usage = [0, 0]         # requests in this 15 minute window, today
+        self._access = {}           # access_token -> user_id
+        self._refresh = {}          # refresh_token -> user_id
+        self._codes = {}            # authorization code -> user_id
+        self._failures = {}         # user_id -> (status, raw body) answered to their activity requests
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def issue_token(self, user_id: str, expired: bool = False) -> dict:
+        """Creates a token for user_id in the shape Strava's /oauth/token returns"""
+        token = {
+            'token_type': 'Bearer',
+            'access_token': secrets.token_hex(20),
+            'refresh_token': secrets.token_hex(20),
+            'expires_at': int(time.time()) + (-60 if expired else self.token_ttl),
+            'expires_in': -60 if expired else self.token_ttl,
+        }
+        with self._lock:
+            self._access[token['access_token']] = user_id
+            self._refresh[token['refresh_token']] = user_id
+        return token
+
+    def add_user(self, user_id: str, activities: list, expired: bool = False) -> dict:
+        """Registers a user's activities and returns a token for them"""
+        self.activities[user_id] = sorted(activities, key=strava_app_api.activity_timestamp)
+        return self.issue_token(user_id, expired)
+
+    def add_code(self, code: str, user_id: str) -> None:
+        """Registers a one-time authorization code for user_id"""
+        with self._lock:
+            self._codes[code] = user_id
+
+    def fail_user(self, user_id: str, status: int = 502, body: bytes = b"<html><body>Bad Gateway</body></html>") -> None:
+        """Answers user_id's activity requests with status and a raw (eg. HTML) body, like a failing gateway"""
+        self._failures[user_id] = (status, body)
+
+    # Request handling - called from the server threads
+    def _count(self) -> None:
+        next(self.request_count)
+        with self._lock:
+            self.usage[0] += 1
+            self.usage[1] += 1
+
+    def _token_grant(self, form: dict):
+        grant = form.get('grant_type')
+        with self._lock:
+            if grant == 'authorization_code':
+                user_id = self._codes.pop(form.get('code'), None)
+            elif grant == 'refresh_token':
+                user_id = self._refresh.pop(form.get('refresh_token'), None)
+            else:
+                user_id = None
+        if user_id is None:
+            return 400, {'message': 'Bad Request',
+                         'errors': [{'resource': 'AuthorizationCode', 'field': 'code', 'code': 'invalid'}]}
+        token = self.issue_token(user_id)
+        token['athlete'] = {'id': int(user_id) if user_id.isdigit() else user_id}
+        return 200, token
+
+    def _authorized_user(self, headers, query: dict):
+        access_token = query.get('access_token')
+        auth = headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            access_token = auth[len('Bearer '):]
+        return self._access.get(access_token)
+
+    def _list_activities(self, user_id: str, query: dict):
+        after = int(query.get('after', 0))
+        before = int(query.get('before', 2**40))
+        per_page = min(int(query.get('per_page', 30)), 200)
+        page = max(int(query.get('page', 1)), 1)
+        matching = [a for a in self.activities.get(user_id, [])
+                    if after < strava_app_api.activity_timestamp(a) < before]
+        return 200, matching[(page - 1) * per_page:page * per_page]
+
+    def _get_activity(self, user_id: str, activity_id: str):
+        for activity in self.activities.get(user_id, []):
+            if str(activity['id']) == activity_id:
+                return 200, activity
+        return 404, {'message': 'Record Not Found'}
+
+
+def _make_handler(stub: StubStrava):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'   # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body, content_type: str = 'application/json') -> None:
+            payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.send_header('X-RateLimit-Limit', '%d,%d' % stub.rate_limit)
+            self.send_header('X-RateLimit-Usage', '%d,%d' % tuple(stub.usage))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            stub._count()
+            length = int(self.headers.get('Content-Length', 0))
+            form = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+            if urlparse(self.path).path != '/oauth/token':
+                return self._send(404, {'message': 'Not Found'})
+            self._send(*stub._token_grant(form))
+
+        def do_GET(self):
+            stub._count()
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            user_id = stub._authorized_user(self.headers, query)
+            if user_id is None:
+                return self._send(401, {'message': 'Authorization Error'})
+            if user_id in stub._failures and url.path.startswith('/api/v3/activities'):
+                return self._send(*stub._failures[user_id], content_type='text/html')
+            if url.path == '/api/v3/activities':
+                return self._send(*stub._list_activities(user_id, query))
+            if url.path.startswith('/api/v3/activities/'):
+                return self._send(*stub._get_activity(user_id, url.path.rsplit('/', 1)[-1]))
+            self._send(404, {'message': 'Not Found'})
+
+    return Handler
@@ -1,12 +1,13 @@
 import json
 import os
-import pandas as pd
 
 from strava_app_settings import INTERMEDIATE_LOCATION
+from strava_app_helpers import write_json_atomic
 import strava_app_api
 
 user_data_file = INTERMEDIATE_LOCATION + 'users.json'
 team_data_file = INTERMEDIATE_LOCATION + 'teams.json'
+roster_state_file = INTERMEDIATE_LOCATION + 'roster_state.json'   # token list version at the last sync
 
 # Example data structure
 # users_data = [
@@ -43,56 +44,196 @@ def load_team_data():
     return team_data
 
 
+class Roster:
+    """
+    users.json and teams.json indexed by user id and team number, for O(1) lookups,
+    upserts and team moves; save() persists both files atomically
+    Both files keep their list layout, so they can still be edited by hand
+    """
+    def __init__(self, user_data: list = None, team_data: list = None):
+        # Later entries win for duplicated ids, as in assign_user_data, so a user listed
+        # twice in users.json only counts towards their last team (the old list-based
+        # generate_team_data added them to the members of each team they were listed under)
+        self.users = {user['user_id']: user for user in user_data or []}
+        # Members are kept apart from the team entries as team -> {user_id: None}, an
+        # insertion-ordered set: O(1) moves, and members keep their order in teams.json
+        self.teams = {}
+        self._members = {}
+        for team in team_data or []:
+            self.teams[team['team']] = {key: value for key, value in team.items() if key != 'members'}
+            self._members[team['team']] = dict.fromkeys(team['members'])
+        self._users_changed = False
+        self._teams_changed = False
+        self._token_version = None  # token list version of a sync not yet saved
+
+    @classmethod
+    def load(cls):
+        return cls(load_user_data(), load_team_data())
+
+    def user_data(self) -> list:
+        return list(self.users.values())
+
+    def team_data(self) -> list:
+        return [dict(team, members=list(self._members[team_id])) for team_id, team in self.teams.items()]
+
+    # Users
+    def upsert(self, user_id: str, name: str = None, team: int = None) -> bool:
+        """
+        Adds a user (name "Unknown", team 0 unless given) or updates the given fields
+        Returns True if the user was new
+        """
+        user = self.users.get(user_id)
+        added = user is None
+        if added:
+            user = self.users[user_id] = {"user_id": user_id, "name": "Unknown", "team": 0}
+            self._users_changed = True
+        if name is not None and user['name'] != name:
+            user['name'] = name
+            self._users_changed = True
+        if team is not None:
+            self.reassign({user_id: team})
+        return added
+
+    def add_missing(self, user_ids) -> int:
+        """Adds the ids not in the roster yet; returns how many were added"""
+        added = 0
+        for user_id in user_ids:
+            if user_id not in self.users:
+                self.users[user_id] = {"user_id": user_id, "name": "Unknown", "team": 0}
+                added += 1
+        self._users_changed = self._users_changed or added > 0
+        return added
+
+    def reassign(self, assignments: dict) -> None:
+        """
+        Moves users to new teams in one go, {user_id: team}; team 0 means no team
+        Unknown ids are added. Team member lists follow the move; teams left empty are dropped
+        """
+        for user_id, team_id in assignments.items():
+            if user_id not in self.users:
+                self.add_missing([user_id])
+            user = self.users[user_id]
+            old_team = user.get('team', 0)
+            if old_team == team_id:
+                continue
+            user['team'] = team_id
+            self._users_changed = True
+            if user_id in self._members.get(old_team, ()):
+                del self._members[old_team][user_id]
+                if not self._members[old_team]:
+                    # An empty team would make the minimum team size (XC ranking) 0
+                    del self.teams[old_team], self._members[old_team]
+                self._teams_changed = True
+            if team_id != 0:
+                self._add_member(team_id, user_id)
+
+    # Teams
+    def _add_member(self, team_id: int, user_id: str) -> None:
+        if team_id not in self.teams:
+            self.teams[team_id] = {"team": team_id, "name": f"Team {team_id}"}
+            self._members[team_id] = {}
+            self._teams_changed = True
+        if user_id not in self._members[team_id]:
+            self._members[team_id][user_id] = None
+            self._teams_changed = True
+
+    def build_teams(self) -> list:
+        """Adds every assigned user to their team's members (creating missing teams); returns the teams"""
+        for user in self.users.values():
+            team_id = user.get("team", 0)
+            if team_id != 0:    # skip users not assigned to a team
+                self._add_member(team_id, user["user_id"])
+        return self.team_data()
+
+    # Token directory
+    def sync_tokens(self, force: bool = False) -> int:
+        """
+        Adds users that have a token but are not in the roster yet; returns how many were added
+        Tokens are only listed when they changed (strava_app_api.token_list_version) since the
+        last sync, or users.json was changed by someone else
+        """
+        state = _load_json(roster_state_file, {})
+        token_version = strava_app_api.token_list_version()
+        users_mtime = os.stat(user_data_file).st_mtime_ns if os.path.exists(user_data_file) else None
+        if not force and state.get('token_version') == token_version and state.get('users_mtime') == users_mtime:
+            return 0
+        # Version read before listing: a token added in between makes the next sync list again
+        added = self.add_missing(strava_app_api.get_token_list())
+        if added:
+            self._token_version = token_version    # recorded by save(), along with the new users.json
+        else:
+            write_json_atomic(roster_state_file, {'token_version': token_version, 'users_mtime': users_mtime})
+        return added
+
+    def save(self) -> None:
+        """Writes users.json and teams.json (whichever changed, or is missing)"""
+        if self._users_changed or not os.path.exists(user_data_file):
+            write_json_atomic(user_data_file, self.user_data())
+            self._users_changed = False
+            if self._token_version is not None:
+                write_json_atomic(roster_state_file, {'token_version': self._token_version,
+                                                      'users_mtime': os.stat(user_data_file).st_mtime_ns})
+                self._token_version = None
+        if self._teams_changed or not os.path.exists(team_data_file):
+            write_json_atomic(team_data_file, self.team_data(), indent=2)
+            self._teams_changed = False
+
+
+def _load_json(path: str, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
 def generate_user_data():
     """Adds users to users.json if they are not already in it.
     Function uses 'user_tokens/' list to create user list"""
-    # Load existing user data
-    user_data = load_user_data()
-
-    # For each token, add to user_data if not already in user_data
-    tokens = strava_app_api.get_token_list()
-    for token in tokens:
-        if token not in [user['user_id'] for user in user_data]:
-            user_data.append({"user_id": token, "name": "Unknown", "team": 0})
-    
-    # Save user_data
-    with open(user_data_file, 'w') as f:
-        json.dump(user_data, f)
+    roster = Roster.load()
+    roster.sync_tokens()
+    roster.save()
 
 
 def generate_team_data():
     # Generate team data from users.json (generate_user_data() should be called first)
-    users = load_user_data()
+    roster = Roster.load()
+    team_data = roster.build_teams()
+    roster.save()
+    return team_data
+
+
+def assign_user_data(user_rankings_df, user_data=None):
+    """
+    Fill in Name and Team from users.json with one indexed lookup on User_ID.
     
-    # Build a dict for teams keyed by team_id
-    team_data = load_team_data()
-    teams = {team['team']: team for team in team_data}
-
-    # Build teams dict: {team_id: {"team": team_id, "name": f"Team", "members": [user_ids]}}
-    for user in users:
-        team_id = user.get("team", 0)
-        if team_id == 0:
-            continue  # skip users not assigned to a team
-        if team_id not in teams:
-            teams[team_id] = {
-                "team": team_id,
-                "name": f"Team {team_id}",
-                "members": []
-            }
-        if user["user_id"] not in teams[team_id]["members"]:
-            teams[team_id]["members"].append(user["user_id"])
-
-    # Save to teams.json
-    team_data = list(teams.values())
-    with open(team_data_file, 'w') as f:
-        json.dump(team_data, f, indent=2)
+    Args:
+        user_rankings_df (pd.DataFrame): DataFrame with User_ID, Name and Team columns
+        user_data (list): users.json entries, loaded if not given
+    
+    Returns:
+        pd.DataFrame: Copy of user_rankings_df; users missing from users.json keep their values
+    """
+    import pandas as pd    # imported here so roster-only callers (eg. cron jobs) start fast
+    user_data = load_user_data() if user_data is None else user_data
+    df = user_rankings_df.copy()
+    if not user_data:
+        return df
 
-    return team_data
+    # Later entries win for duplicated ids, as with sequential assignment
+    users = (pd.DataFrame(user_data, columns=['user_id', 'name', 'team'])
+             .drop_duplicates('user_id', keep='last')
+             .set_index('user_id'))
+    matched = df['User_ID'].isin(users.index)
+    member_ids = df.loc[matched, 'User_ID']
+    df.loc[matched, 'Name'] = users['name'].reindex(member_ids).to_numpy()
+    df.loc[matched, 'Team'] = users['team'].reindex(member_ids).to_numpy()
+    return df
 
 
 def calculate_team_statistics(user_rankings_df):
     """
     Calculate team statistics from user rankings DataFrame.
+    The caller's DataFrame is not modified (see assign_user_data).
     
     Args:
         user_rankings_df (pd.DataFrame): DataFrame containing user rankings with columns:
@@ -110,25 +251,27 @@ def calculate_team_statistics(user_rankings_df):
             - XC_Ave_Rank: average rank of top N members (where N is minimum team size)
             - Min_Team_Size: minimum team size across all teams
     """
-    # Load user data and populate names and team assignments
-    user_data = load_user_data()
-    for user in user_data:
-        user_rankings_df.loc[user_rankings_df['User_ID'] == user['user_id'], 'Name'] = user['name']
-        user_rankings_df.loc[user_rankings_df['User_ID'] == user['user_id'], 'Team'] = user['team']
+    import pandas as pd
+    # Populate team assignments from user data
+    ranked = assign_user_data(user_rankings_df)[['Team', 'Rank']].sort_values('Rank', kind='stable')
 
     # Generate team data
     team_data = generate_team_data()
     min_members = min(len(team['members']) for team in team_data)
 
-    # Calculate team statistics
-    team_stats = []
-    for team in team_data:
-        member_rank = user_rankings_df[user_rankings_df['Team'] == team['team']]['Rank'].sort_values()
-        ave_rank = member_rank.mean()
-        xc_rank = member_rank.head(min_members).mean()
-        team_stats.append([team['team'], team['name'], len(team['members']), ave_rank, xc_rank, min_members])
-        
-    team_stats = pd.DataFrame(team_stats, columns=['Team', 'Name', 'MemberCount', 'ALL_Ave_Rank', 'XC_Ave_Rank', 'Min_Team_Size'])
+    # One pass per statistic over all teams
+    team_ids = [team['team'] for team in team_data]
+    ave_rank = ranked.groupby('Team')['Rank'].mean()
+    xc_rank = ranked.groupby('Team').head(min_members).groupby('Team')['Rank'].mean()
+
+    team_stats = pd.DataFrame({
+        'Team': team_ids,
+        'Name': [team['name'] for team in team_data],
+        'MemberCount': [len(team['members']) for team in team_data],
+        'ALL_Ave_Rank': ave_rank.reindex(team_ids).to_numpy(),
+        'XC_Ave_Rank': xc_rank.reindex(team_ids).to_numpy(),
+        'Min_Team_Size': min_members,
+    })
     team_stats = team_stats.sort_values('XC_Ave_Rank').reset_index(drop=True)
     
     return team_stats
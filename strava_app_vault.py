@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import strava_app_settings
+from strava_app_helpers import write_json_atomic
+
+"""
+Module for:
+1) Token vault - every user's Strava token in one SQLite file (WAL mode), indexed by user id,
+   instead of one strava_tokens_<id>.json per user. Listing users and loading all tokens
+   is a single query, and each write is one transaction
+2) Migration between the two layouts
+
+strava_app_api switches to the vault when TOKEN_STORE = 'vault' in settings; the vault
+lives at TOKEN_LOCATION/tokens.db
+
+Example:
+    python strava_app_vault.py migrate           # import every strava_tokens_<id>.json
+    python strava_app_vault.py migrate --remove  # ... and delete the files once imported
+    python strava_app_vault.py export            # write the files back out (eg. to switch back)
+"""
+
+vault_filename = 'tokens.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    user_id     TEXT    PRIMARY KEY,
+    token       TEXT    NOT NULL,   -- token JSON as returned by Strava
+    expires_at  INTEGER,            -- copied out of the token, for querying by hand
+    updated_at  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key         TEXT    PRIMARY KEY,
+    value       INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+-- Bumped when users are added or removed (not on refresh), so callers can tell the user list changed
+CREATE TRIGGER IF NOT EXISTS tokens_added AFTER INSERT ON tokens
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'generation'; END;
+CREATE TRIGGER IF NOT EXISTS tokens_removed AFTER DELETE ON tokens
+BEGIN UPDATE meta SET value = value + 1 WHERE key = 'generation'; END;
+"""
+
+_UPSERT = ("INSERT INTO tokens (user_id, token, expires_at, updated_at) VALUES (?, ?, ?, ?) "
+           "ON CONFLICT (user_id) DO UPDATE SET token = excluded.token, expires_at = excluded.expires_at, "
+           "updated_at = excluded.updated_at")
+_MAX_VARIABLES = 500    # ids per IN (...) query, below SQLite's bound parameter limit
+
+
+class TokenVault:
+    """Token dicts keyed by user id in one SQLite file; safe to share between threads"""
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Closes this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def __contains__(self, user_id: str) -> bool:
+        return self._connect().execute("SELECT 1 FROM tokens WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def ids(self) -> list:
+        return [row[0] for row in self._connect().execute("SELECT user_id FROM tokens ORDER BY user_id")]
+
+    def generation(self) -> int:
+        """Counter that changes whenever a user is added or removed"""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def get(self, user_id: str) -> dict:
+        """The user's token dict, None if they have none"""
+        row = self._connect().execute("SELECT token FROM tokens WHERE user_id = ?", (user_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_many(self, user_ids: list = None) -> dict:
+        """{user_id: token dict} for the given users (every user if None), missing users left out"""
+        conn = self._connect()
+        if user_ids is None:
+            return {user_id: json.loads(token) for user_id, token in conn.execute("SELECT user_id, token FROM tokens")}
+        user_ids = list(user_ids)
+        tokens = {}
+        for i in range(0, len(user_ids), _MAX_VARIABLES):
+            chunk = user_ids[i:i + _MAX_VARIABLES]
+            rows = conn.execute(f"SELECT user_id, token FROM tokens WHERE user_id IN ({','.join('?' * len(chunk))})",
+                                chunk)
+            tokens.update((user_id, json.loads(token)) for user_id, token in rows)
+        return tokens
+
+    def put(self, user_id: str, token: dict) -> None:
+        self.put_many({user_id: token})
+
+    def put_many(self, tokens: dict) -> None:
+        """Saves {user_id: token dict} in a single transaction"""
+        now = int(time.time())
+        conn = self._connect()
+        with conn:
+            conn.executemany(_UPSERT, [(user_id, json.dumps(token), token.get('expires_at'), now)
+                                       for user_id, token in tokens.items()])
+
+    def delete(self, user_id: str) -> bool:
+        """Removes the user's token; returns True if there was one"""
+        conn = self._connect()
+        with conn:
+            return conn.execute("DELETE FROM tokens WHERE user_id = ?", (user_id,)).rowcount > 0
+
+
+## Migration
+def _token_files(directory: str) -> dict:
+    """{user_id: path} of the strava_tokens_<id>.json files in directory"""
+    return {f.rsplit('.')[0].rsplit('_')[-1]: os.path.join(directory, f)
+            for f in os.listdir(directory) if f.startswith("strava_tokens_")}
+
+
+def migrate(directory: str, vault: TokenVault, remove: bool = False) -> dict:
+    """
+    Imports every token file in directory into the vault in one transaction
+    Where the vault already holds a token for a user, the one expiring later is kept
+    @param remove bool True to delete the files once the import is committed
+    @return dict {'imported': [ids], 'kept': [ids already newer in the vault], 'failed': {id: reason}}
+    """
+    report = {'imported': [], 'kept': [], 'failed': {}}
+    paths = _token_files(directory)
+    stored = vault.get_many(paths)
+    tokens = {}
+    for user_id, path in paths.items():
+        try:
+            with open(path) as token_file:
+                token = json.load(token_file)
+        except (OSError, ValueError) as e:
+            report['failed'][user_id] = f"unreadable token file ({e})"
+            continue
+        current = stored.get(user_id)
+        if current is not None and current.get('expires_at', 0) >= token.get('expires_at', 0):
+            report['kept'].append(user_id)
+        else:
+            tokens[user_id] = token
+            report['imported'].append(user_id)
+    vault.put_many(tokens)
+
+    if remove:
+        for user_id in report['imported'] + report['kept']:
+            os.remove(paths[user_id])
+    return report
+
+
+def export(vault: TokenVault, directory: str) -> int:
+    """Writes every vault token back out as strava_tokens_<id>.json; returns the number written"""
+    tokens = vault.get_many()
+    for user_id, token in tokens.items():
+        write_json_atomic(os.path.join(directory, f"strava_tokens_{user_id}.json"), token)
+    return len(tokens)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move Strava tokens between token files and the token vault")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help="import strava_tokens_<id>.json files into the vault")
+    migrate_parser.add_argument('--remove', action='store_true', help="delete the files once imported")
+    commands.add_parser('export', help="write the vault's tokens back out as files")
+    args = parser.parse_args()
+
+    directory = strava_app_settings.TOKEN_LOCATION
+    vault = TokenVault(directory + vault_filename)
+    if args.command == 'migrate':
+        report = migrate(directory, vault, remove=args.remove)
+        print(f"Imported {len(report['imported'])} tokens, kept {len(report['kept'])} newer ones already in the vault")
+        for user_id, reason in report['failed'].items():
+            print(f"  Skipped user {user_id}: {reason}")
+        if strava_app_settings.TOKEN_STORE != 'vault':
+            print("Set TOKEN_STORE = 'vault' in settings to use it")
+    else:
+        print(f"Wrote {export(vault, directory)} token files to {directory}")
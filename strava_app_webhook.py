@@ -0,0 +1,287 @@
+import argparse
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import strava_app_api
+import strava_app_leaderboard
+import strava_app_settings
+import strava_app_store
+
+"""
+Module for:
+1) Strava push subscription receiver - Strava POSTs one event per activity
+   create/update/delete or athlete deauthorization; each event costs a single
+   GET of the changed activity instead of re-listing every user's activities
+2) Event processing - updates the activity store and the live leaderboard of every
+   configured challenge (strava_app_scoring.CHALLENGES)
+3) Event replay from a JSONL file, for running without network access
+
+Event format (as sent by Strava):
+    {"object_type": "activity", "object_id": 1360128428, "aspect_type": "create",
+     "owner_id": 134815, "subscription_id": 120475, "event_time": 1516126040, "updates": {}}
+Deauthorization is {"object_type": "athlete", "aspect_type": "update", "updates": {"authorized": "false"}, ...}
+Replayed events may carry the activity JSON under an extra "activity" key, which is
+then used instead of requesting it. Events received over HTTP never are: the receiver is
+unauthenticated, so their activity is always requested from Strava, and events for another
+subscription_id than the app's (WEBHOOK_SUBSCRIPTION_ID) are refused
+
+Example:
+    python strava_app_webhook.py serve --subscribe https://example.com/strava    # first time
+    python strava_app_webhook.py serve
+    python strava_app_webhook.py replay events.jsonl
+"""
+
+
+class WebhookProcessor:
+    """Applies Strava webhook events to the activity store and a Leaderboard per challenge"""
+    def __init__(self, boards: list):
+        self.boards = boards
+        self.processed = 0
+        self.failed = 0
+
+    def handle(self, event: dict, embedded: bool = False) -> bool:
+        """
+        Applies one event
+        embedded: True to use an activity carried in the event (replayed events only)
+        Returns True if a leaderboard changed
+        """
+        user_id = str(event['owner_id'])
+        if event['object_type'] == 'athlete':
+            if event.get('updates', {}).get('authorized') == 'false':
+                return self.deauthorize(user_id)
+            return False
+        if event['object_type'] != 'activity':
+            return False
+
+        if event['aspect_type'] == 'delete':
+            activity = None
+        elif embedded and 'activity' in event:
+            activity = event['activity']
+        else:
+            activity = strava_app_api.get_activity(user_id, event['object_id'])
+
+        if activity is None:
+            # Deleted, or no longer visible to the app
+            if not strava_app_store.delete_activity(user_id, event['object_id']):
+                return False
+        else:
+            newest = strava_app_store.newest_start(user_id)
+            stored = strava_app_store.stored_payloads(user_id, [activity['id']])
+            strava_app_store.merge_activities(user_id, [activity])
+            timestamp = strava_app_api.activity_timestamp(activity)
+
+        changed = False
+        for board in self.boards:
+            if activity is not None and not stored:
+                if not board.in_window(activity):
+                    continue
+                # A brand new activity newer than everything stored is applied as a delta
+                if newest is not None and timestamp > newest and user_id in board.users:
+                    changed = board.apply(user_id, [activity]) or changed
+                    continue
+            board.replace(user_id, board.load_activities(user_id))
+            changed = True
+        return changed
+
+    def deauthorize(self, user_id: str) -> bool:
+        """Drops a user who revoked the app's access, along with their token and stored activities"""
+        strava_app_api.delete_user_token(user_id)
+        strava_app_store.delete_user(user_id)
+        for board in self.boards:
+            board.remove(user_id)
+        print(f"User {user_id} deauthorized the app, their data was removed")
+        return True
+
+    def process(self, event: dict, embedded: bool = False) -> bool:
+        """handle() that reports failures instead of raising, for the worker thread"""
+        try:
+            changed = self.handle(event, embedded)
+        except Exception as e:
+            self.failed += 1
+            print(f"Failed to process webhook event {event}: {e}")
+            return False
+        self.processed += 1
+        return changed
+
+
+class WebhookServer:
+    """
+    HTTP receiver for Strava push events
+    Events are queued and acknowledged at once (Strava expects a reply within 2 seconds);
+    a single worker thread applies them in arrival order and rewrites the ranking CSVs
+    whenever the queue drains after a change
+    Malformed events are answered 400, and events for another subscription 403; until
+    subscription_id is known (settings, or set after subscribe()) every event is refused
+    """
+    def __init__(self, processor: WebhookProcessor, host='0.0.0.0', port=None, verify_token=None,
+                 subscription_id=None):
+        self.processor = processor
+        self.verify_token = strava_app_settings.WEBHOOK_VERIFY_TOKEN if verify_token is None else verify_token
+        if not self.verify_token:
+            raise ValueError("Set WEBHOOK_VERIFY_TOKEN in settings to a secret string before receiving events")
+        self.subscription_id = (strava_app_settings.WEBHOOK_SUBSCRIPTION_ID if subscription_id is None
+                                else subscription_id)
+        self.events = queue.Queue()
+        port = strava_app_settings.WEBHOOK_PORT if port is None else port
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._worker = threading.Thread(target=self._work, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve_forever(self) -> None:
+        self._worker.start()
+        self._server.serve_forever()
+
+    def start(self):
+        self._worker.start()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self.events.put(None)
+        self._worker.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _work(self) -> None:
+        changed = False
+        while True:
+            event = self.events.get()
+            if event is None:
+                break
+            try:
+                changed = self.processor.process(event) or changed
+                if changed and self.events.empty():
+                    changed = False
+                    for board in self.processor.boards:
+                        strava_app_leaderboard.save_rankings(board)
+            except Exception as e:
+                # Keep the only worker alive; the next change rewrites the rankings
+                print(f"Failed to save rankings: {e}")
+            finally:
+                self.events.task_done()
+
+
+def _make_handler(receiver: WebhookServer):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, body) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            # Subscription validation: echo hub.challenge if the verify token matches
+            query = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+            if query.get('hub.mode') != 'subscribe' or query.get('hub.verify_token') != receiver.verify_token:
+                return self._send(403, {'message': 'Forbidden'})
+            self._send(200, {'hub.challenge': query.get('hub.challenge', '')})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                event = json.loads(self.rfile.read(length))
+            except ValueError:
+                return self._send(400, {'message': 'Bad Request'})
+            if not valid_event(event):
+                return self._send(400, {'message': 'Bad Request'})
+            if receiver.subscription_id is None or event['subscription_id'] != receiver.subscription_id:
+                return self._send(403, {'message': 'Forbidden'})
+            receiver.events.put(event)
+            self._send(200, {})
+
+    return Handler
+
+
+def valid_event(event) -> bool:
+    """True if event has the fields (and types) of a Strava push event"""
+    if not isinstance(event, dict):
+        return False
+    if not isinstance(event.get('object_type'), str) or not isinstance(event.get('aspect_type'), str):
+        return False
+    if not all(isinstance(event.get(key), int) and not isinstance(event.get(key), bool)
+               for key in ('object_id', 'owner_id', 'subscription_id')):
+        return False
+    return isinstance(event.get('updates', {}), dict)
+
+
+def replay(path: str, processor: WebhookProcessor) -> int:
+    """
+    Applies the events in a JSONL file (one event per line) in order
+    Activities carried in the events are used as they are (the file is trusted)
+    Returns the number of events that changed the leaderboard
+    """
+    changed = 0
+    with open(path) as events:
+        for line in events:
+            if line.strip():
+                changed += processor.process(json.loads(line), embedded=True)
+    return changed
+
+
+def subscribe(callback_url: str, verify_token: str = None) -> dict:
+    """
+    Creates the app's push subscription; Strava validates callback_url with a GET first,
+    so the WebhookServer must already be reachable there
+    Returns the subscription, eg. {"id": 120475}
+    """
+    verify_token = strava_app_settings.WEBHOOK_VERIFY_TOKEN if verify_token is None else verify_token
+    if not verify_token:
+        raise ValueError("Set WEBHOOK_VERIFY_TOKEN in settings to a secret string before subscribing")
+    response = strava_app_api.scheduler.request(
+        'POST', strava_app_api.strava_base_url + "/api/v3/push_subscriptions",
+        data={
+            'client_id': strava_app_api.client_id,
+            'client_secret': strava_app_api.client_secret,
+            'callback_url': callback_url,
+            'verify_token': verify_token,
+        })
+    if not response.ok:
+        raise strava_app_api.StravaAPIError(f"Failed to create push subscription (HTTP {response.status_code})")
+    return response.json()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receive Strava push events and keep the rankings live")
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help="listen for Strava webhook events")
+    serve_parser.add_argument('--port', type=int, default=None, help="defaults to WEBHOOK_PORT in settings")
+    serve_parser.add_argument('--subscribe', metavar='CALLBACK_URL', default=None,
+                              help="create the push subscription for this public URL once listening")
+    replay_parser = commands.add_parser('replay', help="apply events from a JSONL file")
+    replay_parser.add_argument('path')
+    args = parser.parse_args()
+
+    processor = WebhookProcessor(strava_app_leaderboard.load_boards())
+    if args.command == 'serve':
+        server = WebhookServer(processor, port=args.port).start()
+        if args.subscribe:
+            server.subscription_id = subscribe(args.subscribe)['id']
+            print(f"Subscribed, set WEBHOOK_SUBSCRIPTION_ID = {server.subscription_id} in settings")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        changed = replay(args.path, processor)
+        for board in processor.boards:
+            strava_app_leaderboard.save_rankings(board)
+        print(f"Replayed {processor.processed} events ({changed} changed the rankings, {processor.failed} failed)")
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import strava_app_bench
+
+
+@pytest.fixture
+def sandbox(tmp_path):
+    """Temporary store, tokens and rosters with the API pointed at a StubStrava"""
+    with strava_app_bench._Sandbox(str(tmp_path) + os.sep) as sandbox:
+        yield sandbox
@@ -0,0 +1,37 @@
+import pandas as pd
+
+import strava_app_batch
+import strava_app_scoring as scorer
+from strava_app_bench import generate_users
+
+
+def _scored_one_by_one(activities_by_user: dict) -> pd.DataFrame:
+    users = []
+    for user_id, activities in activities_by_user.items():
+        user = scorer.UserEC(user_id)
+        if user.add_activities(activities):
+            user.calculate_points()
+            users.append(user)
+    return scorer.create_dataframe_from_users(users)
+
+
+def _assert_identical(activities_by_user: dict) -> None:
+    expected = _scored_one_by_one(activities_by_user)
+    batch = strava_app_batch.score_activities(strava_app_batch.activities_frame_from_dicts(activities_by_user),
+                                              list(activities_by_user))
+    assert list(batch.columns) == list(expected.columns)
+    assert batch.dtypes.equals(expected.dtypes)
+    pd.testing.assert_frame_equal(batch, expected, check_exact=True)
+
+
+def test_batch_scoring_matches_user_scoring():
+    activities_by_user = dict(generate_users(2000, activities_per_user=20))
+    assert any(not activities for activities in activities_by_user.values())    # some users are left out
+    _assert_identical(activities_by_user)
+
+
+def test_untouched_stat_columns_keep_their_dtype():
+    # Only runs and yoga: every other stat column stays at its default for everyone
+    activities_by_user = {user_id: [a for a in activities if a['sport_type'] in ('Run', 'Yoga')]
+                          for user_id, activities in generate_users(200, activities_per_user=10)}
+    _assert_identical(activities_by_user)
@@ -0,0 +1,156 @@
+import json
+import time
+from unittest import mock
+
+import pytest
+
+import strava_app_api
+import strava_app_async
+import strava_app_pipeline
+import strava_app_scoring as scorer
+import strava_app_store
+from strava_app_bench import _close_store, generate_activities
+from strava_app_helpers import write_json_atomic
+
+pytest.importorskip('aiohttp')
+
+USERS = {'1001': 450, '1002': 37, '1003': 0, '1004': 200}   # user_id: activities (450 spans 3 pages)
+
+
+@pytest.fixture
+def users(sandbox):
+    activities = {user_id: generate_activities(user_id, count) for user_id, count in USERS.items()}
+    sandbox.add_users(list(activities.items()))
+    return activities
+
+
+def _fresh_store(sandbox, name: str):
+    """Points the activity store at an empty file, so the next run fetches everything"""
+    _close_store()
+    return mock.patch.object(strava_app_store, 'store_file', sandbox.directory + name)
+
+
+def _expected(activities: dict):
+    users = []
+    for user_id, user_activities in activities.items():
+        user = scorer.UserEC(user_id)
+        if user.add_activities(user_activities):
+            user.calculate_points()
+            users.append(user)
+    return scorer.create_dataframe_from_users(users)
+
+
+def _by_user(df):
+    return df.sort_values('User_ID').reset_index(drop=True)
+
+
+def test_thread_and_async_engines_match(sandbox, users):
+    user_ids = list(USERS)
+    with _fresh_store(sandbox, 'threads.db'):
+        threaded = strava_app_pipeline.run(user_ids).dataframe()
+    with _fresh_store(sandbox, 'async.db'):
+        async_users = strava_app_async.run(user_ids)[0]
+    _close_store()
+
+    expected = _by_user(_expected(users))
+    assert list(expected['User_ID']) == ['1001', '1002', '1004']
+    assert _by_user(threaded).equals(expected)
+    assert _by_user(scorer.create_dataframe_from_users(async_users)).equals(expected)
+
+
+def test_pagination_past_one_page(sandbox, users):
+    fetched = list(strava_app_api.iter_user_activities('1001'))
+    assert [a['id'] for a in fetched] == [a['id'] for a in users['1001']]
+
+    async def fetch():
+        async with strava_app_async.aiohttp.ClientSession() as session:
+            return await strava_app_async.get_user_activities(
+                session, '1001', scorer.DEFAULT_CHALLENGE.start, scorer.DEFAULT_CHALLENGE.end)
+    assert [a['id'] for a in strava_app_async.asyncio.run(fetch())] == [a['id'] for a in users['1001']]
+
+
+def test_full_page_then_empty_page(sandbox, users):
+    # Exactly one full page: page 2 comes back empty and ends the fetch
+    assert len(list(strava_app_api.iter_user_activities('1004'))) == 200
+
+
+@pytest.mark.parametrize('engine', ['threads', 'async'])
+def test_expired_token_is_refreshed(sandbox, engine):
+    activities = generate_activities('2001', 12)
+    old_token = sandbox.stub.add_user('2001', activities, expired=True)
+    strava_app_api.write_user_token('2001', old_token)
+
+    with _fresh_store(sandbox, engine + '.db'):
+        if engine == 'threads':
+            scored = strava_app_pipeline.run(['2001']).dataframe()
+        else:
+            scored = scorer.create_dataframe_from_users(strava_app_async.run(['2001'])[0])
+    _close_store()
+
+    assert scored.equals(_expected({'2001': activities}))
+    saved = strava_app_api.load_user_token('2001')
+    assert saved['refresh_token'] != old_token['refresh_token']
+    assert not strava_app_api.token_needs_refresh(saved)
+
+
+@pytest.mark.parametrize('engine', ['threads', 'async'])
+def test_unusable_tokens_only_skip_their_user(sandbox, users, engine):
+    # Revoked refresh token, a corrupt token file and one missing expires_at
+    revoked = sandbox.stub.issue_token('3001', expired=True)
+    revoked['refresh_token'] = 'revoked'
+    strava_app_api.write_user_token('3001', revoked)
+    with open(sandbox.directory + 'tokens/strava_tokens_3002.json', 'w') as f:
+        f.write('{not json')
+    with open(sandbox.directory + 'tokens/strava_tokens_3003.json', 'w') as f:
+        json.dump({'access_token': 'x', 'refresh_token': 'y'}, f)
+    strava_app_api.token_cache.invalidate()
+    # A gateway answering one user's activity requests with an HTML 502
+    strava_app_api.write_user_token('3004', sandbox.stub.add_user('3004', generate_activities('3004', 3)))
+    sandbox.stub.fail_user('3004')
+
+    user_ids = ['3001', '3002', '3003', '3004', '1002']
+    with _fresh_store(sandbox, engine + '.db'), \
+            mock.patch.object(strava_app_api.RequestScheduler, 'backoff', return_value=0):
+        if engine == 'threads':
+            scored = strava_app_pipeline.run(user_ids).dataframe()
+        else:
+            scored = scorer.create_dataframe_from_users(strava_app_async.run(user_ids)[0])
+    _close_store()
+
+    assert scored.equals(_expected({'1002': users['1002']}))
+    assert strava_app_api.token_cache.is_rejected('3001', revoked)
+
+
+@pytest.mark.parametrize('engine', ['threads', 'async'])
+def test_token_rotated_by_another_process_is_reread(sandbox, engine):
+    activities = generate_activities('4001', 5)
+    strava_app_api.write_user_token('4001', sandbox.stub.add_user('4001', activities, expired=True))
+    assert strava_app_api.token_cache.get('4001') is not None
+
+    # Eg. the refresh-tokens cron job: rotates the refresh token behind this process's cache
+    response = strava_app_api.get_session().post(strava_app_api.oauth_url, data=strava_app_api.refresh_request_data(
+        strava_app_api.load_user_token('4001')))
+    rotated = response.json()
+    write_json_atomic(sandbox.directory + 'tokens/strava_tokens_4001.json', rotated)
+
+    with _fresh_store(sandbox, engine + '.db'):
+        if engine == 'threads':
+            scored = strava_app_pipeline.run(['4001']).dataframe()
+        else:
+            scored = scorer.create_dataframe_from_users(strava_app_async.run(['4001'])[0])
+    _close_store()
+
+    assert scored.equals(_expected({'4001': activities}))
+    assert strava_app_api.token_cache.get('4001')['refresh_token'] == rotated['refresh_token']
+
+
+def test_page_estimate_stops_at_now(sandbox):
+    # 450 activities in the last 60 days of a challenge that ends 200 days from now: 3 pages
+    now = int(time.time())
+    activities = generate_activities('6001', 450, start=now - 60 * 86400, end=now - 60)
+    strava_app_api.write_user_token('6001', sandbox.stub.add_user('6001', activities))
+    before = now + 200 * 86400
+    requests_before = sandbox.stub.usage[0]
+    fetched = list(strava_app_api.iter_user_activities('6001', after=now - 120 * 86400, before=before))
+    assert len(fetched) == 450
+    assert sandbox.stub.usage[0] - requests_before == 3
@@ -0,0 +1,25 @@
+import os
+
+import pandas as pd
+import pytest
+
+import strava_app_export
+
+pytest.importorskip('pyarrow')
+
+
+def test_failed_export_keeps_previous_snapshot(tmp_path):
+    schema = strava_app_export.team_schema()
+    good = pd.DataFrame({'Team': [1], 'Name': ["Team 1"], 'MemberCount': [3], 'ALL_Ave_Rank': [2.0],
+                         'XC_Ave_Rank': [2.0], 'Min_Team_Size': [3]})
+    with strava_app_export.ParquetSink(str(tmp_path), 'teams', schema, 'Test', filename='teams.parquet') as sink:
+        sink.write_frame(good)
+
+    with pytest.raises(RuntimeError):
+        with strava_app_export.ParquetSink(str(tmp_path), 'teams', schema, 'Test', filename='teams.parquet') as sink:
+            sink.write((2, "Team 2", 1, 1.0, 1.0, 1))
+            raise RuntimeError("export failed")
+
+    assert not os.path.exists(sink._tmp_path)
+    archived = pd.read_parquet(sink.path)
+    pd.testing.assert_frame_equal(archived, good)
@@ -0,0 +1,82 @@
+import pandas as pd
+
+import strava_app_api
+import strava_app_leaderboard
+import strava_app_scoring as scorer
+import strava_app_team as teams
+from strava_app_bench import generate_activities
+
+# Team 1 is 1001-1003, team 2 is 1004-1006
+USER_DATA = [{'user_id': str(1001 + i), 'name': f"Athlete {i}", 'team': 1 + i // 3} for i in range(6)]
+TEAM_DATA = [{'team': 1, 'name': "Team 1", 'members': ['1001', '1002', '1003']},
+             {'team': 2, 'name': "Team 2", 'members': ['1004', '1005', '1006']}]
+
+
+def _board(user_ids) -> strava_app_leaderboard.Leaderboard:
+    board = strava_app_leaderboard.Leaderboard(USER_DATA, TEAM_DATA)
+    for user_id in user_ids:
+        board.apply(user_id, generate_activities(user_id, 5 + 4 * int(user_id[-1])))
+    return board
+
+
+def test_remove_updates_own_team():
+    board = _board([user['user_id'] for user in USER_DATA])
+    board.team_stats()     # cache every team's ranks
+    last = board.to_dataframe()['User_ID'].iloc[-1]
+    board.remove(last)
+
+    remaining = [user['user_id'] for user in USER_DATA if user['user_id'] != last]
+    pd.testing.assert_frame_equal(board.team_stats(), _board(remaining).team_stats())
+    pd.testing.assert_frame_equal(board.to_dataframe(), _board(remaining).to_dataframe())
+
+
+def test_one_sync_updates_each_challenge(sandbox):
+    default = scorer.DEFAULT_CHALLENGE
+    middle = (default.start + default.end) // 2
+    challenges = [scorer.Challenge(name='Early', end=middle), scorer.Challenge(name='Late', start=middle)]
+    activities = {user['user_id']: generate_activities(user['user_id'], 30) for user in USER_DATA}
+    sandbox.add_users(list(activities.items()))
+    user_ids = list(activities)
+
+    boards = [strava_app_leaderboard.Leaderboard(USER_DATA, TEAM_DATA, challenge) for challenge in challenges]
+    for board in boards:
+        board.build(user_ids)
+    plans = strava_app_leaderboard.sync(user_ids, *scorer.union_window(challenges))
+    for board in boards:
+        assert sorted(board.apply_plans(plans)) == user_ids
+
+    for board, challenge in zip(boards, challenges):
+        expected = strava_app_leaderboard.Leaderboard(USER_DATA, TEAM_DATA, challenge)
+        for user_id, user_activities in activities.items():
+            expected.apply(user_id, [a for a in user_activities if expected.in_window(a)])
+        pd.testing.assert_frame_equal(board.to_dataframe(), expected.to_dataframe())
+        pd.testing.assert_frame_equal(board.team_stats(), expected.team_stats())
+
+
+def test_refresh_picks_up_new_tokens_and_team_moves(sandbox):
+    activities = {user['user_id']: generate_activities(user['user_id'], 20) for user in USER_DATA}
+    first = USER_DATA[:4]
+    sandbox.add_users([(user['user_id'], activities[user['user_id']]) for user in first])
+    roster = teams.Roster()
+    for user in first:
+        roster.upsert(user['user_id'], name=user['name'], team=user['team'])
+    roster.save()
+    boards = strava_app_leaderboard.load_boards(challenges=[scorer.DEFAULT_CHALLENGE])
+    known = set(strava_app_api.get_token_list())
+    strava_app_leaderboard.refresh_boards(boards, known)
+
+    # Two athletes onboard, one moves team and one deauthorizes while serve() is running
+    sandbox.add_users([(user['user_id'], activities[user['user_id']]) for user in USER_DATA[4:]])
+    strava_app_api.delete_user_token('1002')
+    roster = teams.Roster.load()
+    roster.reassign({'1001': 2, '1005': 1, '1006': 2})
+    roster.save()
+    strava_app_leaderboard.refresh_boards(boards, known)
+
+    user_ids = sorted(strava_app_api.get_token_list())
+    assert sorted(known) == user_ids
+    expected = strava_app_leaderboard.load_boards(user_ids, [scorer.DEFAULT_CHALLENGE])[0]
+    assert set(boards[0].users) == set(user_ids)
+    assert boards[0].team_of['1001'] == 2
+    pd.testing.assert_frame_equal(boards[0].to_dataframe(), expected.to_dataframe())
+    pd.testing.assert_frame_equal(boards[0].team_stats(), expected.team_stats())
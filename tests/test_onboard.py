@@ -0,0 +1,71 @@
+from unittest import mock
+
+import pytest
+import requests
+
+import strava_app_api
+import strava_app_onboard
+
+
+def _signups(tmp_path, rows: list) -> list:
+    path = tmp_path / 'signups.csv'
+    path.write_text('user_id,code\n' + ''.join(f"{user_id},{code}\n" for user_id, code in rows))
+    return strava_app_onboard.read_signups(str(path))
+
+
+def test_code_of_another_athlete_is_saved_under_their_id(sandbox, tmp_path):
+    sandbox.stub.add_code('code-a', '5001')
+    report = strava_app_onboard.onboard(_signups(tmp_path, [('5002', 'code-a')]))
+    assert report['registered'] == ['5001']
+    [(signup, reason)] = report['failed']
+    assert reason == "code belongs to athlete 5001, not 5002 (token saved under 5001)"
+    assert strava_app_api.load_user_token('5001')['athlete']['id'] == 5001
+    assert strava_app_api.get_user_path('5002') is None
+
+
+def test_existing_token_is_kept_without_user_id(sandbox, tmp_path):
+    existing = sandbox.stub.add_user('5003', [])
+    strava_app_api.write_user_token('5003', existing)
+    sandbox.stub.add_code('code-b', '5003')
+    sandbox.stub.add_code('code-c', '5004')
+    sandbox.stub.add_code('code-d', '5004')
+    report = strava_app_onboard.onboard(_signups(tmp_path, [('', 'code-b'), ('', 'code-c'), ('', 'code-d')]))
+
+    assert report['existing'] == ['5003']
+    assert report['registered'] == ['5004']
+    assert [reason for _, reason in report['failed']] == ["duplicate sign-up, athlete 5004 is already listed above"]
+    assert strava_app_api.load_user_token('5003') == existing
+
+
+def test_unexpected_exchange_error_fails_only_its_row(sandbox, tmp_path):
+    sandbox.stub.add_code('code-e', '5005')
+    sandbox.stub.add_code('code-f', '5006')
+    exchange_code = strava_app_api.exchange_code
+
+    def flaky(code):
+        if code == 'code-e':
+            raise requests.exceptions.ChunkedEncodingError("Connection broken")
+        return exchange_code(code)
+
+    with mock.patch.object(strava_app_api, 'exchange_code', side_effect=flaky):
+        report = strava_app_onboard.onboard(_signups(tmp_path, [('5005', 'code-e'), ('5006', 'code-f')]))
+    assert report['registered'] == ['5006']
+    [(signup, reason)] = report['failed']
+    assert signup['user_id'] == '5005' and reason.startswith("exchange failed (ChunkedEncodingError")
+    assert strava_app_api.get_user_path('5006')
+
+
+def test_exchanged_tokens_are_saved_if_a_later_row_raises(sandbox, tmp_path):
+    sandbox.stub.add_code('code-g', '5007')
+    sandbox.stub.add_code('code-h', '5008')
+    get_user_path = strava_app_api.get_user_path
+
+    def broken(user_id):
+        if user_id == '5008':
+            raise OSError("token directory unreadable")
+        return get_user_path(user_id)
+
+    with mock.patch.object(strava_app_api, 'get_user_path', side_effect=broken):
+        with pytest.raises(OSError):
+            strava_app_onboard.onboard(_signups(tmp_path, [('', 'code-g'), ('', 'code-h')]), max_workers=1)
+    assert strava_app_api.load_user_token('5007')['athlete']['id'] == 5007
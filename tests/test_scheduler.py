@@ -0,0 +1,106 @@
+import time
+from unittest import mock
+
+import pytest
+import requests
+
+import strava_app_api
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = strava_app_api.RequestScheduler(max_retries=3)
+    with mock.patch.object(scheduler, 'backoff', return_value=0):
+        yield scheduler
+
+
+@pytest.mark.parametrize('method, attempts', [('GET', 4), ('POST', 1)])
+def test_timeouts_only_resend_idempotent_requests(scheduler, method, attempts):
+    session = mock.Mock()
+    session.request.side_effect = requests.Timeout("read timed out")
+    with mock.patch.object(strava_app_api, 'get_session', return_value=session):
+        with pytest.raises(strava_app_api.StravaAPIError):
+            scheduler.request(method, 'https://www.strava.com/oauth/token')
+    assert session.request.call_count == attempts
+    assert scheduler._in_flight == 0
+
+
+class _Clock:
+    """Stands in for the time module in strava_app_api; only time() is controlled"""
+    def __init__(self, now: float):
+        self.now = now
+        self.perf_counter = time.perf_counter
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    clock = _Clock(1_700_000_000 // 900 * 900 + 300)     # 5 minutes into a quarter hour
+    with mock.patch.object(strava_app_api, 'time', clock):
+        yield clock
+
+
+def _headers(short_usage: int, daily_usage: int = 0, limits=(200, 2000)) -> dict:
+    return {'X-RateLimit-Limit': '%d,%d' % limits, 'X-RateLimit-Usage': f"{short_usage},{daily_usage}"}
+
+
+def _response(status: int, headers: dict = None):
+    return mock.Mock(status_code=status, headers=headers or _headers(0))
+
+
+def test_fresh_window_spends_remaining_quota(clock):
+    scheduler = strava_app_api.RequestScheduler()
+    scheduler.update(_headers(20))
+    # Everything down to the 10% reserve goes out at once
+    for _ in range(160):
+        assert scheduler.try_acquire() == 0
+    # The last 20 are spread over the 10 minutes left in the window
+    assert scheduler.try_acquire() == pytest.approx(600 / 20)
+    assert scheduler._in_flight == 160
+
+
+def test_used_up_window_blocks_until_next_quarter_hour(clock):
+    scheduler = strava_app_api.RequestScheduler(max_wait=86400)
+    scheduler.update(_headers(200, 500))
+    assert scheduler.try_acquire() == pytest.approx(600)
+    clock.now += 600
+    assert scheduler.try_acquire() == 0
+    # A used-up daily quota blocks until the next UTC day instead
+    scheduler.update(_headers(10, 2000))
+    assert scheduler.try_acquire() == pytest.approx((clock.now // 86400 + 1) * 86400 - clock.now)
+
+
+def test_wait_past_max_wait_raises(clock):
+    scheduler = strava_app_api.RequestScheduler(max_wait=60)
+    scheduler.update(_headers(200))
+    with pytest.raises(strava_app_api.RateLimitExceeded):
+        scheduler.acquire()
+    with pytest.raises(strava_app_api.RateLimitExceeded):
+        scheduler.try_acquire()
+
+
+def test_429_is_retried_after_retry_after(clock):
+    scheduler = strava_app_api.RequestScheduler()
+    session = mock.Mock()
+    session.request.side_effect = [_response(429, dict(_headers(30), **{'Retry-After': '7'})), _response(200)]
+    with mock.patch.object(strava_app_api, 'get_session', return_value=session):
+        started = clock.now
+        response = scheduler.request('GET', 'https://www.strava.com/api/v3/activities')
+    assert response.status_code == 200
+    assert session.request.call_count == 2
+    assert clock.now - started == 7
+    assert scheduler._in_flight == 0
+
+
+def test_last_retry_returns_the_error_response(clock):
+    scheduler = strava_app_api.RequestScheduler(max_retries=2)
+    session = mock.Mock()
+    session.request.return_value = _response(503)
+    with mock.patch.object(strava_app_api, 'get_session', return_value=session):
+        assert scheduler.request('GET', 'https://www.strava.com/api/v3/activities').status_code == 503
+    assert session.request.call_count == 3
@@ -0,0 +1,39 @@
+import strava_app_api
+import strava_app_scoring as scorer
+import strava_app_store
+from strava_app_bench import generate_activities
+
+
+def test_resync_drops_activities_deleted_on_strava(sandbox):
+    activities = generate_activities('7001', 10)
+    sandbox.add_users([('7001', activities)])
+    assert strava_app_store.sync_user('7001') == 10
+
+    deleted = sandbox.stub.activities['7001'].pop(4)
+    assert strava_app_store.sync_user('7001', full=True) == 9
+    stored = strava_app_store.load_activities('7001')
+    assert deleted['id'] not in {a['id'] for a in stored}
+    assert len(stored) == 9
+
+    user = scorer.UserEC('7001')
+    assert user.add_activities(stored) and user.calculate_points()
+    expected = scorer.UserEC('7001')
+    expected.add_activities([a for a in activities if a['id'] != deleted['id']])
+    expected.calculate_points()
+    assert user.points == expected.points
+
+
+def test_incremental_sync_prunes_only_the_fetched_window(sandbox):
+    activities = generate_activities('7002', 10)
+    sandbox.add_users([('7002', activities)])
+    strava_app_store.sync_user('7002')
+
+    # Newest (inside the incremental lookback) and oldest (outside it) deleted on Strava
+    sandbox.stub.activities['7002'] = activities[1:-1]
+    plan = strava_app_store.SyncPlan('7002', scorer.DEFAULT_CHALLENGE.start, scorer.DEFAULT_CHALLENGE.end)
+    assert plan.incremental
+    assert strava_app_api.activity_timestamp(activities[0]) < plan.fetch_after
+    plan.commit(list(strava_app_api.iter_user_activities('7002', after=plan.fetch_after)))
+
+    assert plan.deleted == 1 and plan.changed
+    assert [a['id'] for a in strava_app_store.load_activities('7002')] == [a['id'] for a in activities[:-1]]
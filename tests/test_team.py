@@ -0,0 +1,75 @@
+import copy
+
+import pandas as pd
+
+import strava_app_batch
+import strava_app_team as teams
+from strava_app_bench import generate_users, write_rosters
+
+USER_DATA = [{'user_id': str(1001 + i), 'name': f"Athlete {i}", 'team': 1 + i % 2} for i in range(6)]
+TEAM_DATA = [{'team': 1, 'name': "Red", 'members': ['1001', '1003', '1005']},
+             {'team': 2, 'name': "Blue", 'members': ['1002', '1004', '1006']}]
+
+
+def _roster(user_data=USER_DATA, team_data=TEAM_DATA) -> teams.Roster:
+    return teams.Roster(copy.deepcopy(user_data), copy.deepcopy(team_data))
+
+
+def test_reassign_moves_members_in_order():
+    roster = _roster()
+    roster.reassign({'1003': 2, '1001': 3, '1005': 0})
+    assert roster.users['1003']['team'] == 2
+    assert roster.team_data() == [
+        {'team': 2, 'name': "Blue", 'members': ['1002', '1004', '1006', '1003']},
+        {'team': 3, 'name': "Team 3", 'members': ['1001']},
+    ]   # team 1 was left empty and dropped
+
+
+def test_team_data_matches_file_layout():
+    roster = _roster()
+    assert roster.build_teams() == TEAM_DATA
+    roster.upsert('1007', name="New", team=1)
+    assert roster.team_data()[0]['members'] == ['1001', '1003', '1005', '1007']
+
+
+def test_duplicated_user_counts_for_last_team_only():
+    roster = _roster(USER_DATA + [{'user_id': '1001', 'name': "Athlete 0", 'team': 2}], [])
+    member_counts = {team['team']: len(team['members']) for team in roster.build_teams()}
+    assert member_counts == {1: 2, 2: 4}
+
+
+def _team_statistics_per_user(user_rankings_df, user_data, team_data):
+    """calculate_team_statistics as it was before the indexed join: one .loc lookup per user"""
+    user_rankings_df = user_rankings_df.copy()
+    for user in user_data:
+        user_rankings_df.loc[user_rankings_df['User_ID'] == user['user_id'], 'Name'] = user['name']
+        user_rankings_df.loc[user_rankings_df['User_ID'] == user['user_id'], 'Team'] = user['team']
+    min_members = min(len(team['members']) for team in team_data)
+    team_stats = []
+    for team in team_data:
+        member_rank = user_rankings_df[user_rankings_df['Team'] == team['team']]['Rank'].sort_values()
+        team_stats.append([team['team'], team['name'], len(team['members']), member_rank.mean(),
+                           member_rank.head(min_members).mean(), min_members])
+    team_stats = pd.DataFrame(team_stats, columns=['Team', 'Name', 'MemberCount', 'ALL_Ave_Rank',
+                                                   'XC_Ave_Rank', 'Min_Team_Size'])
+    return team_stats.sort_values('XC_Ave_Rank').reset_index(drop=True)
+
+
+def test_team_statistics_match_per_user_lookup(sandbox):
+    activities_by_user = dict(generate_users(600, activities_per_user=10))
+    df = strava_app_batch.score_activities(strava_app_batch.activities_frame_from_dicts(activities_by_user),
+                                           list(activities_by_user))
+    df = df.sort_values('Total_Points', ascending=False).reset_index(drop=True)
+    df['Rank'] = df.index + 1
+
+    write_rosters(list(activities_by_user), team_size=12)
+    roster = teams.Roster.load()
+    roster.upsert('1003', name="Benched", team=0)     # ranked, but in no team
+    roster.upsert('9001', name="Absent", team=99)     # in a team, never ranked
+    roster.save()
+
+    expected = _team_statistics_per_user(df, teams.load_user_data(), teams.load_team_data())
+    stats = teams.calculate_team_statistics(df)
+    assert stats.dtypes.equals(expected.dtypes)
+    pd.testing.assert_frame_equal(stats, expected, check_exact=True)
+    assert (df['Team'] == 0).all()    # the caller's DataFrame is left alone
@@ -0,0 +1,92 @@
+import json
+import os
+import sqlite3
+from unittest import mock
+
+import pytest
+
+import strava_app_vault
+
+
+def _token(expires_at: int) -> dict:
+    return {'access_token': f"access-{expires_at}", 'refresh_token': "refresh", 'expires_at': expires_at}
+
+
+def _write_files(directory, tokens: dict) -> None:
+    for user_id, token in tokens.items():
+        (directory / f"strava_tokens_{user_id}.json").write_text(json.dumps(token))
+
+
+@pytest.fixture
+def vault(tmp_path):
+    vault = strava_app_vault.TokenVault(str(tmp_path / "vault" / strava_app_vault.vault_filename))
+    yield vault
+    vault.close()
+
+
+def test_migrate_keeps_the_later_expiry(tmp_path, vault):
+    vault.put_many({'1': _token(200), '2': _token(200), '3': _token(200)})
+    _write_files(tmp_path, {'1': _token(100), '2': _token(200), '3': _token(300), '4': _token(100)})
+    (tmp_path / "strava_tokens_5.json").write_text("{not json")
+
+    report = strava_app_vault.migrate(str(tmp_path), vault)
+
+    assert sorted(report['imported']) == ['3', '4']
+    assert sorted(report['kept']) == ['1', '2']     # ties keep the vault's token
+    assert list(report['failed']) == ['5']
+    assert {user_id: token['expires_at'] for user_id, token in vault.get_many().items()} == \
+        {'1': 200, '2': 200, '3': 300, '4': 100}
+    assert len(list(tmp_path.glob("strava_tokens_*.json"))) == 5     # files stay without remove
+
+
+def test_migrate_remove_deletes_files_once_committed(tmp_path, vault):
+    _write_files(tmp_path, {'1': _token(100), '2': _token(100)})
+    (tmp_path / "strava_tokens_3.json").write_text("{not json")
+
+    with mock.patch.object(vault, 'put_many', side_effect=sqlite3.OperationalError("database is locked")):
+        with pytest.raises(sqlite3.OperationalError):
+            strava_app_vault.migrate(str(tmp_path), vault, remove=True)
+    assert len(list(tmp_path.glob("strava_tokens_*.json"))) == 3
+    assert vault.ids() == []
+
+    strava_app_vault.migrate(str(tmp_path), vault, remove=True)
+    assert vault.ids() == ['1', '2']
+    # The unreadable file is left for the user to fix
+    assert [path.name for path in tmp_path.glob("strava_tokens_*.json")] == ["strava_tokens_3.json"]
+
+
+def test_generation_changes_only_when_users_are_added_or_removed(tmp_path, vault):
+    start = vault.generation()
+    vault.put_many({'1': _token(100), '2': _token(100)})
+    added = vault.generation()
+    assert added != start
+
+    # Token refreshes (and a migration that only refreshes) keep the user list version
+    vault.put('1', _token(200))
+    _write_files(tmp_path, {'2': _token(300)})
+    strava_app_vault.migrate(str(tmp_path), vault)
+    assert vault.get('2')['expires_at'] == 300
+    assert vault.generation() == added
+
+    vault.delete('1')
+    removed = vault.generation()
+    assert removed != added
+    assert not vault.delete('1')
+    assert vault.generation() == removed
+
+
+def test_export_writes_every_token(tmp_path, vault):
+    tokens = {'1': _token(100), '2': _token(200)}
+    vault.put_many(tokens)
+    assert strava_app_vault.export(vault, str(tmp_path)) == 2
+    for user_id, token in tokens.items():
+        with open(os.path.join(tmp_path, f"strava_tokens_{user_id}.json")) as token_file:
+            assert json.load(token_file) == token
+
+    # Round trip: exported files migrate back without changing anything
+    other = strava_app_vault.TokenVault(str(tmp_path / "other.db"))
+    try:
+        assert sorted(strava_app_vault.migrate(str(tmp_path), other)['imported']) == ['1', '2']
+        assert other.get_many() == tokens
+    finally:
+        other.close()
@@ -0,0 +1,115 @@
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from unittest import mock
+
+import pytest
+
+import strava_app_api
+import strava_app_leaderboard
+import strava_app_scoring as scorer
+import strava_app_webhook
+from strava_app_bench import generate_activities
+
+SUBSCRIPTION = 120475
+USER_DATA = [{'user_id': '1001', 'name': "A", 'team': 1}, {'user_id': '1002', 'name': "B", 'team': 1}]
+TEAM_DATA = [{'team': 1, 'name': "Team 1", 'members': ['1001', '1002']}]
+
+
+@pytest.fixture
+def server(sandbox):
+    activities = generate_activities('1001', 10)
+    sandbox.add_users([('1001', activities[:-1]), ('1002', generate_activities('1002', 20))])
+    sandbox.stub.activities['1001'] = activities    # the last one is "uploaded" after the board is built
+    board = strava_app_leaderboard.Leaderboard(USER_DATA, TEAM_DATA)
+    processor = strava_app_webhook.WebhookProcessor([board])
+    with strava_app_webhook.WebhookServer(processor, host='127.0.0.1', port=0, verify_token='secret',
+                                          subscription_id=SUBSCRIPTION) as server:
+        server.new_activity = activities[-1]
+        yield server
+
+
+def _post(server, body) -> int:
+    request = urllib.request.Request(server.url, data=json.dumps(body).encode(), method='POST')
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def _event(object_id, owner_id='1001', **extra) -> dict:
+    return {'object_type': 'activity', 'aspect_type': 'create', 'object_id': object_id,
+            'owner_id': int(owner_id), 'subscription_id': SUBSCRIPTION, 'event_time': int(time.time()),
+            'updates': {}, **extra}
+
+
+def test_embedded_activity_is_ignored_over_http(server):
+    forged = dict(server.new_activity, id=1, distance=5e7)
+    assert _post(server, _event(1, activity=forged)) == 200
+    server.events.join()
+    assert '1001' not in server.processor.boards[0].users     # Strava has no activity 1
+
+    assert _post(server, _event(server.new_activity['id'], activity=forged)) == 200
+    server.events.join()
+    stats = server.processor.boards[0].users['1001'].stats
+    assert stats.run_distance + stats.bike_distance + stats.walk_distance < 1000    # fetched, not forged
+
+
+def test_bad_events_are_refused(server):
+    assert _post(server, [1]) == 400
+    assert _post(server, dict(_event(1), owner_id="1001")) == 400
+    assert _post(server, dict(_event(1), subscription_id=1)) == 403
+    server.subscription_id = None
+    assert _post(server, _event(1)) == 403
+    assert server.events.empty()
+
+
+def test_worker_survives_failures(server):
+    with mock.patch.object(strava_app_webhook.WebhookProcessor, 'handle', side_effect=TypeError("boom")):
+        assert _post(server, _event(1)) == 200
+        server.events.join()
+    with mock.patch.object(strava_app_leaderboard, 'save_rankings', side_effect=OSError("disk full")):
+        assert _post(server, _event(server.new_activity['id'])) == 200
+        server.events.join()
+    assert server.processor.failed == 1
+    assert server.processor.boards[0].rank('1001') is not None
+
+
+def test_replay_uses_embedded_activity(sandbox, tmp_path):
+    activity = generate_activities('1001', 1)[0]
+    strava_app_api.write_user_token('1001', sandbox.stub.add_user('1001', []))
+    path = tmp_path / 'events.jsonl'
+    path.write_text(json.dumps(_event(activity['id'], activity=activity)) + '\n')
+    processor = strava_app_webhook.WebhookProcessor([strava_app_leaderboard.Leaderboard(USER_DATA, TEAM_DATA)])
+    assert strava_app_webhook.replay(str(path), processor) == 1
+    assert processor.boards[0].rank('1001') == 1
+
+
+def test_verify_token_is_required(sandbox):
+    board = strava_app_leaderboard.Leaderboard(USER_DATA, TEAM_DATA)
+    with pytest.raises(ValueError):
+        strava_app_webhook.WebhookServer(strava_app_webhook.WebhookProcessor([board]), port=0, verify_token='')
+
+
+def test_events_update_each_challenge_in_its_window(sandbox, tmp_path):
+    default = scorer.DEFAULT_CHALLENGE
+    middle = (default.start + default.end) // 2
+    challenges = [scorer.Challenge(name='Early', end=middle), scorer.Challenge(name='Late', start=middle)]
+    activity = generate_activities('1001', 1, start=middle + 86400)[0]
+    strava_app_api.write_user_token('1001', sandbox.stub.add_user('1001', []))
+    path = tmp_path / 'events.jsonl'
+    path.write_text(json.dumps(_event(activity['id'], activity=activity)) + '\n')
+
+    boards = [strava_app_leaderboard.Leaderboard(USER_DATA, TEAM_DATA, challenge) for challenge in challenges]
+    processor = strava_app_webhook.WebhookProcessor(boards)
+    assert strava_app_webhook.replay(str(path), processor) == 1
+    assert [board.rank('1001') for board in boards] == [None, 1]
+
+    with mock.patch.object(scorer, 'CHALLENGES', challenges):
+        for board in boards:
+            strava_app_leaderboard.save_rankings(board)
+    assert os.path.exists(sandbox.directory + 'Late_user_rankings.csv')
+    assert os.path.exists(sandbox.directory + 'Early_team_rankings.csv')